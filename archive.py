@@ -0,0 +1,421 @@
+# Binary game archive: a header, the games one after the other, then an index with the offset of every game
+# the header points at the index, so a game is appended in place: it goes over the old index, the new index follows it
+# and the header is rewritten last (a game record also has its own length, so a damaged index can be rebuilt)
+# a game is its result, clock times (GameTimer), tags and one 16-bit word per move (start square, end square and
+# promotion piece, the rest of the move code comes back from the legal moves of the position when it's replayed)
+# GameArchive maps the file with mmap and reads game N straight from its offset, without parsing the rest of the file
+# appendArchive adds a finished game to an archive (main.log_game keeps one in paths.saves)
+# usage: python archive.py convert PGN ARCHIVE [--backend mailbox|bitboard]
+#        python archive.py replay ARCHIVE [--game N] [--backend mailbox|bitboard]
+
+import argparse
+import datetime
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from engine import GameState, PROMOTION_SHIFT, parseFen
+from backends import START_FEN
+from pgn import readPgn, replayPgn, formatGame, gameSans, endState
+
+MAGIC = b"CDGA"
+VERSION = 2
+# magic, version, game count, position of the index in the file
+HEADER = struct.Struct("<4sHxxQQ")
+# offset of every game from the start of the data, plus the end of the last one (game count + 1 entries)
+OFFSET = struct.Struct("<Q")
+# result, flags, move count, white clock and black clock in milliseconds, length of the tags
+RECORD = struct.Struct("<BBHIIH")
+RESULTS = ("*", "1-0", "0-1", "1/2-1/2")
+# flags of a game
+HAS_CLOCKS = 1
+STOPWATCH = 2
+# tags kept in the record fields instead of the tag block
+CLOCK_TAGS = ("WhiteClock", "BlackClock", "TimerMode")
+
+
+# 16-bit word of a move code: start (0-5), end (6-11), promotion (12-14), squares always with white at the bottom
+def packMove(code, flipped=False):
+    start = code & 63
+    end = (code >> 6) & 63
+    if flipped:
+        start ^= 56
+        end ^= 56
+    return start | (end << 6) | (((code >> PROMOTION_SHIFT) & 7) << 12)
+
+
+# move code of a packed move in the current position of gs (white at the bottom), ValueError if it isn't legal
+def unpackMove(gs, word, legal=None):
+    if legal is None:
+        legal = gs.getValidMoveCodes()
+    for code in legal:
+        if code & 0x7fff == word:
+            return code
+    raise ValueError(f"illegal move in archive: {word:#06x}")
+
+
+# "h:mm:ss" of a clock time in seconds, and back
+def formatClock(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def parseClock(text):
+    seconds = 0.0
+    for part in text.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def encodeTags(tags):
+    return b"".join(f"{name}\0{value}\0".encode("utf-8") for name, value in tags.items())
+
+
+def decodeTags(data):
+    fields = data.decode("utf-8").split('\0')
+    return dict(zip(fields[0:-1:2], fields[1::2]))
+
+
+# bytes of a game record: RECORD, the tag block, then the packed moves
+def packRecord(result, tags, moves, clocks=None, stopwatch=False):
+    tagData = encodeTags({name: value for name, value in tags.items() if name not in CLOCK_TAGS and name != "Result"})
+    flags = (HAS_CLOCKS if clocks is not None else 0) | (STOPWATCH if stopwatch else 0)
+    whiteMs, blackMs = (round(clocks[0] * 1000), round(clocks[1] * 1000)) if clocks is not None else (0, 0)
+    moves = array('H', moves)
+    if sys.byteorder == "big":
+        moves.byteswap()
+    return RECORD.pack(RESULTS.index(result) if result in RESULTS else 0, flags, len(moves),
+                       whiteMs, blackMs, len(tagData)) + tagData + moves.tobytes()
+
+
+# record of the game of gs.moveLog, played from the position before its first move (kept as a FEN tag when it isn't
+# the start), timer is the controller.GameTimer of the game, if it had one
+def gameRecord(gs, result, tags=None, timer=None):
+    tags = dict(tags or {})
+    # undoMove / makeMove clear checkmate and stalemate, put back once the start position is known
+    flags = endState(gs)
+    codes = list(gs.moveLog)
+    for code in codes:
+        gs.undoMove()
+    startFen = gs.to_fen()
+    for code in codes:
+        gs.makeMove(code)
+    gs.inCheck, gs.checkmate, gs.stalemate = flags
+    if startFen != START_FEN:
+        tags["FEN"] = startFen
+    clocks = None
+    stopwatch = False
+    if timer is not None:
+        clocks = timer.get_current_times(gs.whiteToMove)
+        stopwatch = timer.mode == "stopwatch"
+    flipped = gs.playerWantsToPlayAsBlack
+    return packRecord(result, tags, [packMove(code, flipped) for code in codes], clocks, stopwatch)
+
+
+# length of the game record at position of data (RECORD, tags and moves), None if it runs past end
+def recordLength(data, position, end):
+    if position + RECORD.size > end:
+        return None
+    resultIndex, flags, moveCount, whiteMs, blackMs, tagLength = RECORD.unpack_from(data, position)
+    length = RECORD.size + tagLength + moveCount * 2
+    return length if position + length <= end and resultIndex < len(RESULTS) else None
+
+
+# offsets (from the start of the data) of the first count records of data and the end of the last one,
+# found by walking the records; None if they don't fit before end
+def scanOffsets(data, count, end):
+    offsets = array('Q', [0])
+    position = HEADER.size
+    for n in range(count):
+        length = recordLength(data, position, end)
+        if length is None:
+            return None
+        position += length
+        offsets.append(position - HEADER.size)
+    return offsets
+
+
+class ArchivedGame():
+    def __init__(self, result, tags, moves, clocks=None, stopwatch=False):
+        self.result = result
+        self.tags = tags
+        # array('H') of packed moves
+        self.moves = moves
+        # (white seconds, black seconds) at the end of the game, None for games without a timer
+        self.clocks = clocks
+        # the clocks count the time used (stopwatch mode) instead of the time left
+        self.stopwatch = stopwatch
+
+    # plays the game on gs (or a new state of backend) from its start position, returns gs
+    def replay(self, backend=GameState, gs=None):
+        if gs is None:
+            gs = backend()
+        gs.loadPosition(*parseFen(self.tags.get("FEN", START_FEN)))
+        buffer = None
+        for word in self.moves:
+            buffer = gs.getValidMoveCodes(buffer)
+            gs.makeMove(unpackMove(gs, word, buffer))
+        return gs
+
+
+# writes an archive: games are spooled to a temporary file next to path, close() writes the header, the games and
+# the index to path (replacing it at once), so a reader never sees a half written archive
+class ArchiveWriter():
+    def __init__(self, path):
+        self.path = path
+        self.data = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+        self.offsets = array('Q', [0])
+
+    # game of gs.moveLog (see gameRecord), timer is the controller.GameTimer of the game, if it had one
+    def add(self, gs, result, tags=None, timer=None):
+        self.addRecord(gameRecord(gs, result, tags, timer))
+
+    def addGame(self, result, tags, moves, clocks=None, stopwatch=False):
+        self.addRecord(packRecord(result, tags, moves, clocks, stopwatch))
+
+    # a game record as GameArchive.record returns it, copied without decoding it
+    def addRecord(self, data):
+        self.data.write(data)
+        self.offsets.append(self.data.tell())
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def close(self):
+        if self.data is None:
+            return
+        offsets = array('Q', self.offsets)
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self), HEADER.size + self.offsets[-1]))
+            self.data.seek(0)
+            while True:
+                chunk = self.data.read(1 << 20)
+                if not chunk:
+                    break
+                f.write(chunk)
+            f.write(offsets.tobytes())
+        os.replace(temporary, self.path)
+        self.data.close()
+        self.data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.data.close()
+            self.data = None
+
+
+# an archive file mapped in memory, archive[n] reads game n from its offset
+# ValueError if path isn't an archive or is cut short
+class GameArchive():
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # an empty file can't be mapped
+            self.file.close()
+            raise ValueError(f"not a game archive (version {VERSION}): {path}") from None
+        if len(self.map) < HEADER.size:
+            self.close()
+            raise ValueError(f"not a game archive (version {VERSION}): {path}")
+        magic, version, self.count, self.indexOffset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"not a game archive (version {VERSION}): {path}")
+        self.dataStart = HEADER.size
+        # the index is read from the file unless it doesn't match the records (an append was cut off after it
+        # started writing over the old index), then the offsets come from walking the records
+        self.offsets = None
+        if not self.indexIsValid():
+            self.offsets = scanOffsets(self.map, self.count, len(self.map))
+            if self.offsets is None:
+                self.close()
+                raise ValueError(f"damaged game archive: {path}")
+
+    def indexIsValid(self):
+        indexEnd = self.indexOffset + (self.count + 1) * OFFSET.size
+        if self.indexOffset < self.dataStart or indexEnd > len(self.map):
+            return False
+        return (OFFSET.unpack_from(self.map, self.indexOffset)[0] == 0 and
+                self.dataStart + OFFSET.unpack_from(self.map, indexEnd - OFFSET.size)[0] == self.indexOffset)
+
+    def __len__(self):
+        return self.count
+
+    def offset(self, n):
+        if self.offsets is not None:
+            return self.dataStart + self.offsets[n]
+        return self.dataStart + OFFSET.unpack_from(self.map, self.indexOffset + n * OFFSET.size)[0]
+
+    # end of the last game, where an appended game goes
+    def dataEnd(self):
+        return self.offset(self.count)
+
+    # array('Q') of the offsets of every game from the start of the data, plus the end of the last one
+    def offsetArray(self):
+        if self.offsets is not None:
+            return array('Q', self.offsets)
+        offsets = array('Q')
+        offsets.frombytes(self.map[self.indexOffset:self.indexOffset + (self.count + 1) * OFFSET.size])
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        return offsets
+
+    # bytes of game n as they are in the file
+    def record(self, n):
+        return self.map[self.offset(n):self.offset(n + 1)]
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += self.count
+        if not 0 <= n < self.count:
+            raise IndexError("game index out of range")
+        position = self.offset(n)
+        if recordLength(self.map, position, self.offset(n + 1)) is None:
+            raise ValueError(f"damaged game record {n}")
+        resultIndex, flags, moveCount, whiteMs, blackMs, tagLength = RECORD.unpack_from(self.map, position)
+        position += RECORD.size
+        tags = decodeTags(self.map[position:position + tagLength])
+        position += tagLength
+        moves = array('H')
+        moves.frombytes(self.map[position:position + moveCount * 2])
+        if sys.byteorder == "big":
+            moves.byteswap()
+        clocks = (whiteMs / 1000, blackMs / 1000) if flags & HAS_CLOCKS else None
+        return ArchivedGame(RESULTS[resultIndex], tags, moves, clocks, bool(flags & STOPWATCH))
+
+    def __iter__(self):
+        for n in range(self.count):
+            yield self[n]
+
+    def replay(self, n, backend=GameState, gs=None):
+        return self[n].replay(backend, gs)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# adds a game record to the archive at path in place, creating the archive if there is none; returns the number of games
+# the record goes where the old index was and the new index after it, the header is rewritten last, so an append cut
+# off half way leaves the old header, whose games GameArchive still finds by walking the records
+def appendRecord(path, data):
+    if not os.path.exists(path):
+        with ArchiveWriter(path) as writer:
+            writer.addRecord(data)
+        return 1
+    with GameArchive(path) as archive:
+        count = len(archive)
+        offsets = archive.offsetArray()
+    offsets.append(offsets[-1] + len(data))
+    indexOffset = HEADER.size + offsets[-1]
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    with open(path, "r+b") as f:
+        f.seek(indexOffset - len(data))
+        f.write(data)
+        f.write(offsets.tobytes())
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, count + 1, indexOffset))
+    return count + 1
+
+
+# adds the game of gs to the archive at path (see appendRecord), creating it and its directory
+# backup keeps a second archive in path + ".bak" that gets every game too (copied from path the first time),
+# so one damaged file doesn't lose the games; returns the number of games in the archive
+def appendArchive(path, gs, result, tags=None, timer=None, backup=False):
+    tags = dict(tags or {})
+    tags.setdefault("Date", datetime.date.today().strftime("%Y.%m.%d"))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    data = gameRecord(gs, result, tags, timer)
+    if backup and not os.path.exists(path + ".bak") and os.path.exists(path):
+        shutil.copyfile(path, path + ".bak")
+    count = appendRecord(path, data)
+    if backup:
+        appendRecord(path + ".bak", data)
+    return count
+
+
+# converts a PGN file (streamed with pgn.readPgn) to an archive, returns the number of games
+# WhiteClock / BlackClock / TimerMode tags (written by main.log_game) become the clock fields
+# games with an illegal move are skipped, their messages go in errors when it is a list
+def convertPgn(pgnPath, archivePath, backend=GameState, errors=None):
+    errors = [] if errors is None else errors
+    with open(pgnPath, "r", encoding="utf-8", errors="replace") as f, ArchiveWriter(archivePath) as writer:
+        for game, gs in replayPgn(readPgn(f), backend, errors):
+            clocks = None
+            if "WhiteClock" in game.tags and "BlackClock" in game.tags:
+                clocks = (parseClock(game.tags["WhiteClock"]), parseClock(game.tags["BlackClock"]))
+            moves = [packMove(code) for code in gs.moveLog]
+            writer.addGame(game.result, game.tags, moves, clocks, game.tags.get("TimerMode") == "stopwatch")
+        return len(writer)
+
+
+def main():
+    from backends import BACKENDS
+
+    parser = argparse.ArgumentParser(description="binary game archives")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="convert a PGN file to an archive")
+    convert.add_argument("pgn")
+    convert.add_argument("archive")
+    convert.add_argument("--backend", choices=sorted(BACKENDS), default="mailbox")
+    replay = commands.add_parser("replay", help="replay the games of an archive")
+    replay.add_argument("archive")
+    replay.add_argument("--game", type=int, default=None, help="only this game (from 0), printed as PGN")
+    replay.add_argument("--backend", choices=sorted(BACKENDS), default="mailbox")
+    args = parser.parse_args()
+
+    backend = BACKENDS[args.backend]
+    start = time.perf_counter()
+    if args.command == "convert":
+        errors = []
+        games = convertPgn(args.pgn, args.archive, backend, errors)
+        for message in errors:
+            print(f"skipped: {message}")
+        print(f"games {games}  skipped {len(errors)}  time {time.perf_counter() - start:.3f}s  size {os.path.getsize(args.archive)} bytes")
+        return 0
+    with GameArchive(args.archive) as archive:
+        if args.game is not None:
+            game = archive[args.game]
+            startFen, sans = gameSans(game.replay(backend))
+            tags = dict(game.tags)
+            if game.clocks is not None:
+                tags["WhiteClock"], tags["BlackClock"] = formatClock(game.clocks[0]), formatClock(game.clocks[1])
+            print(formatGame(sans, game.result, tags, startFen), end="")
+            return 0
+        gs = backend()
+        moves = 0
+        for game in archive:
+            game.replay(backend, gs)
+            moves += len(game.moves)
+        elapsed = time.perf_counter() - start
+        print(f"games {len(archive)}  moves {moves}  time {elapsed:.3f}s  moves/s {moves / max(elapsed, 1e-9):.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
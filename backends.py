@@ -0,0 +1,26 @@
+# What the command line tools share: the move generators by name, the start position and how positions and moves
+# are read and written on the command line
+# usage: from backends import BACKENDS, START_FEN, loadFen, moveName
+
+from engine import GameState, parseFen
+from bitboard import BitboardGameState
+
+BACKENDS = {'mailbox': GameState, 'bitboard': BitboardGameState}
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+# flipped sets the position up with white at the top, like GameState.from_fen(fen, True)
+def loadFen(gs, fen, flipped=False):
+    if flipped:
+        gs.playerWantsToPlayAsBlack = True
+    gs.loadPosition(*parseFen(fen, flipped))
+    return gs
+
+
+# start and end square of a move like e2e4
+def moveName(move):
+    name = move.getRankFile(move.startRow, move.startCol) + move.getRankFile(move.endRow, move.endCol)
+    if move.isPawnPromotion:
+        name += move.promotionChoice.lower()
+    return name
@@ -0,0 +1,79 @@
+# Legal moves of many positions (opening books, puzzle sets) with a single scratch GameState
+# positions are streamed, so memory stays flat however many of them there are
+# usage: python batch.py FILE [--backend mailbox|bitboard] [--print] [--report N]   (FILE has one FEN per line)
+
+import argparse
+import itertools
+import sys
+import time
+from engine import GameState, Move, parseFen, makeFen, readFenFile
+from backends import BACKENDS, moveName
+
+
+class LegalMovesBatch():
+    # codes=True yields the move codes (list of ints) instead of Move objects
+    def __init__(self, backend=GameState, codes=False):
+        self.gs = backend()
+        self.codes = codes
+        self.positions = 0
+        self.moves = 0
+        self.elapsed = 0.0
+
+    @property
+    def positionsPerSecond(self):
+        return self.positions / max(self.elapsed, 1e-9)
+
+    # positions are FEN strings or tuples of GameState.loadPosition arguments, as engine.readFenFile yields them
+    # yields the legal moves of every position in order, the scratch GameState is loaded in place for each one
+    def run(self, positions):
+        gs = self.gs
+        buffer = None
+        for position in positions:
+            start = time.perf_counter()
+            if isinstance(position, str):
+                position = parseFen(position)
+            gs.loadPosition(*position)
+            buffer = gs.getValidMoveCodes(buffer)
+            if self.codes:
+                moves = buffer.tolist()
+            else:
+                moves = [Move.fromCode(code) for code in buffer]
+            self.positions += 1
+            self.moves += len(moves)
+            self.elapsed += time.perf_counter() - start
+            yield moves
+
+
+def legalMovesBatch(positions, backend=GameState, codes=False):
+    return LegalMovesBatch(backend, codes).run(positions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="legal moves of every position of a FEN file")
+    parser.add_argument("file", help="one FEN per line, - for stdin")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="mailbox")
+    parser.add_argument("--print", action="store_true", help="print the legal moves of every position")
+    parser.add_argument("--report", type=int, default=100000, help="print the speed every N positions")
+    args = parser.parse_args()
+
+    if args.file == "-":
+        positions = (parseFen(line.strip()) for line in sys.stdin if line.strip())
+    else:
+        positions = readFenFile(args.file)
+    batch = LegalMovesBatch(BACKENDS[args.backend], codes=not args.print)
+    if args.print:
+        # tee only holds the one position the batch is ahead of the printer
+        positions, printed = itertools.tee(positions)
+        for position, moves in zip(printed, batch.run(positions)):
+            print(f"{makeFen(*position)}: {' '.join(moveName(move) for move in moves)}")
+    else:
+        for moves in batch.run(positions):
+            if args.report and batch.positions % args.report == 0:
+                print(f"positions {batch.positions}  moves {batch.moves}  positions/s {batch.positionsPerSecond:.0f}")
+    print(f"positions {batch.positions}  moves {batch.moves}  time {batch.elapsed:.3f}s  "
+          f"positions/s {batch.positionsPerSecond:.0f}", file=sys.stderr if args.print else sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
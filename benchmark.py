@@ -0,0 +1,48 @@
+# Micro-benchmark for the move generator in engine.py
+# usage: python benchmark.py [seconds]
+
+import sys
+import time
+from engine import GameState
+
+
+# play a few opening moves so the generator sees more than the start position
+OPENING = [((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 6), (5, 5)), ((0, 1), (2, 2)),
+           ((7, 5), (4, 2)), ((0, 6), (2, 5)), ((6, 3), (5, 3)), ((1, 3), (2, 3))]
+
+
+def playMoves(gs, squares):
+    for start, end in squares:
+        for move in gs.getValidMoves():
+            if (move.startRow, move.startCol) == start and (move.endRow, move.endCol) == end:
+                gs.makeMove(move)
+                break
+
+
+# count how many pseudo-legal moves getAllPossibleMoves() produces per second
+def benchmarkMoveGeneration(gs, seconds=2.0):
+    calls = 0
+    moves = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        # getAllPossibleMoves consumes gs.pins and reads gs.attackedSquares, so refresh them like getValidMoves does
+        gs.inCheck, gs.pins, gs.checks = gs.checkForPinsAndChecks()
+        gs.attackedSquares = gs.getAttackedSquares()
+        moves += len(gs.getAllPossibleMoves())
+        calls += 1
+        elapsed = time.perf_counter() - start
+    return calls, moves, elapsed
+
+
+def main(seconds=2.0):
+    positions = [("start position", []), ("after 4 moves", OPENING)]
+    for name, squares in positions:
+        gs = GameState()
+        playMoves(gs, squares)
+        calls, moves, elapsed = benchmarkMoveGeneration(gs, seconds)
+        print(f"{name:16s} {calls / elapsed:10.0f} calls/s {moves / elapsed:12.0f} moves/s")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
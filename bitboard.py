@@ -0,0 +1,712 @@
+'''
+    Bitboard backend with the same makeMove / undoMove / getValidMoves / board surface as engine.GameState.
+    Every piece type of each color is stored as a python int where bit (row * 8 + col) is set when the piece is on that square,
+    so the rows and cols used by Move and by self.board are exactly the same as in engine.py
+'''
+
+from array import array
+from engine import Move, PIECES, NO_PIECE, PIECE_INDEX, PROMOTION_OFFSETS, PROMOTION_SHIFT, MOVED_SHIFT, CAPTURED_SHIFT, \
+    ENPASSANT_FLAG, CASTLE_FLAG, PROMOTIONS, ZOBRIST_PIECES, ZOBRIST_CASTLE, ZOBRIST_ENPASSANT, ZOBRIST_BLACK_TO_MOVE, \
+    zobristKey, parseFen, makeFen, MG_TABLES, EG_TABLES, scoreBoard, scoreChange
+from pst import taper
+
+# engine zobrist numbers by piece index
+ZOBRIST_BY_INDEX = [ZOBRIST_PIECES[piece] for piece in PIECES[:NO_PIECE]]
+NO_SQUARE = -1
+
+# piece index is color * 6 + piece type
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+ROWS = [0xFF << (row * 8) for row in range(8)]
+# row each color promotes on
+PROMOTION_ROWS = [ROWS[0], ROWS[7]]
+# (row, col) of every square
+ROW_COL = [divmod(sq, 8) for sq in range(64)]
+
+# castle rights bits, same layout as engine.castleRightsMask
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+# castle rights of each color
+CASTLE_RIGHTS = [WHITE_KINGSIDE | WHITE_QUEENSIDE, BLACK_KINGSIDE | BLACK_QUEENSIDE]
+
+
+def _stepAttacks(offsets):
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        attacks = 0
+        for dr, dc in offsets:
+            if 0 <= row + dr < 8 and 0 <= col + dc < 8:
+                attacks |= 1 << ((row + dr) * 8 + col + dc)
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = _stepAttacks(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _stepAttacks(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+# white pawns move towards row 0 and black pawns towards row 7
+PAWN_ATTACKS = [_stepAttacks(((-1, -1), (-1, 1))), _stepAttacks(((1, -1), (1, 1)))]
+
+# up, down, left, right and then the diagonals, every direction is followed by its opposite (d ^ 1)
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (1, 1), (-1, 1), (1, -1))
+ORTHOGONAL = (0, 1, 2, 3)
+DIAGONAL = (4, 5, 6, 7)
+# directions that increase the square index, the first blocker on them is the lowest set bit
+POSITIVE = tuple(dr * 8 + dc > 0 for dr, dc in DIRECTIONS)
+
+# RAYS[direction][sq] every square from sq to the edge of the board in that direction (sq excluded)
+RAYS = []
+for _dr, _dc in DIRECTIONS:
+    _table = []
+    for _sq in range(64):
+        _row, _col = divmod(_sq, 8)
+        _ray = 0
+        for _i in range(1, 8):
+            if not (0 <= _row + _dr * _i < 8 and 0 <= _col + _dc * _i < 8):
+                break
+            _ray |= 1 << ((_row + _dr * _i) * 8 + _col + _dc * _i)
+        _table.append(_ray)
+    RAYS.append(_table)
+
+ROOK_RAYS = [RAYS[0][sq] | RAYS[1][sq] | RAYS[2][sq] | RAYS[3][sq] for sq in range(64)]
+BISHOP_RAYS = [RAYS[4][sq] | RAYS[5][sq] | RAYS[6][sq] | RAYS[7][sq] for sq in range(64)]
+
+# BETWEEN[a][b] squares strictly between two aligned squares, LINE[a][b] the whole line through them (0 if not aligned)
+BETWEEN = [[0] * 64 for _ in range(64)]
+LINE = [[0] * 64 for _ in range(64)]
+for _sq in range(64):
+    _row, _col = divmod(_sq, 8)
+    for _j, (_dr, _dc) in enumerate(DIRECTIONS):
+        _between = 0
+        _line = RAYS[_j][_sq] | RAYS[_j ^ 1][_sq] | (1 << _sq)
+        for _i in range(1, 8):
+            if not (0 <= _row + _dr * _i < 8 and 0 <= _col + _dc * _i < 8):
+                break
+            _target = (_row + _dr * _i) * 8 + _col + _dc * _i
+            BETWEEN[_sq][_target] = _between
+            LINE[_sq][_target] = _line
+            _between |= 1 << _target
+
+# castle rights that survive a move touching a square (king or rook leaving or rook being captured)
+CASTLE_KEEP = [15] * 64
+CASTLE_KEEP[60] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLE_KEEP[63] = 15 & ~WHITE_KINGSIDE
+CASTLE_KEEP[56] = 15 & ~WHITE_QUEENSIDE
+CASTLE_KEEP[4] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLE_KEEP[7] = 15 & ~BLACK_KINGSIDE
+CASTLE_KEEP[0] = 15 & ~BLACK_QUEENSIDE
+
+
+def _slidingAttacks(sq, occupied, directions):
+    attacks = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            if POSITIVE[d]:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            # cut the ray behind the first piece on it
+            ray ^= RAYS[d][blocker]
+        attacks |= ray
+    return attacks
+
+
+# slider attacks in one lookup: they only depend on the pieces on the rays of the square, without the last square of
+# every ray (nothing is behind it), so the attacks of every subset of those squares are computed once here
+def _relevantMask(sq, directions):
+    mask = 0
+    for d in directions:
+        ray = RAYS[d][sq]
+        if ray:
+            # drop the square on the edge of the board
+            ray ^= 1 << (ray.bit_length() - 1) if POSITIVE[d] else ray & -ray
+        mask |= ray
+    return mask
+
+
+# (masks, tables): tables[sq][occupied & masks[sq]] are the attacks from sq
+def _attackTables(directions):
+    masks = []
+    tables = []
+    for sq in range(64):
+        mask = _relevantMask(sq, directions)
+        table = {}
+        subset = 0
+        while True:
+            table[subset] = _slidingAttacks(sq, subset, directions)
+            # next subset of mask (carry-rippler)
+            subset = (subset - mask) & mask
+            if not subset:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+ROOK_MASKS, ROOK_TABLES = _attackTables(ORTHOGONAL)
+BISHOP_MASKS, BISHOP_TABLES = _attackTables(DIAGONAL)
+
+
+def _squares(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+class BitboardGameState():
+    def __init__(self):
+        self.board = [
+            ['bR', 'bN', 'bB', 'bQ', 'bK', 'bB', 'bN', 'bR'],
+            ['bp', 'bp', 'bp', 'bp', 'bp', 'bp', 'bp', 'bp'],
+            ['--', '--', '--', '--', '--', '--', '--', '--'],
+            ['--', '--', '--', '--', '--', '--', '--', '--'],
+            ['--', '--', '--', '--', '--', '--', '--', '--'],
+            ['--', '--', '--', '--', '--', '--', '--', '--'],
+            ['wp', 'wp', 'wp', 'wp', 'wp', 'wp', 'wp', 'wp'],
+            ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR']]
+        # the bitboard backend only supports the default orientation
+        self.playerWantsToPlayAsBlack = False
+        # row where each pawn promotes, like engine.GameState.promotionRows
+        self.promotionRows = {'wp': 0, 'bp': 7}
+        self.whiteToMove = True
+        # move codes, as in engine.GameState
+        self.moveLog = []
+        self.checkmate = False
+        self.stalemate = False
+        self.inCheck = False
+        self.bitboards = [0] * 12
+        # piece index on every square, NO_PIECE if there is none
+        self.squares = [NO_PIECE] * 64
+        self.occupied = [0, 0]
+        self.castleRights = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        self.castleRightsLog = [self.castleRights]
+        # square behind a pawn that just moved two squares, NO_SQUARE if en passant is not possible
+        self.enpasantSquare = NO_SQUARE
+        self.enpasantSquareLog = [self.enpasantSquare]
+        self.halfmoveClock = 0
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.fullmoveNumber = 1
+        self._loadBoard()
+        self.resetZobrist()
+        self.resetScore()
+
+    # same as engine.GameState.from_fen, only in the default orientation
+    @classmethod
+    def from_fen(cls, fen):
+        gs = cls()
+        gs.loadPosition(*parseFen(fen))
+        return gs
+
+    def to_fen(self):
+        return makeFen(self.board, self.whiteToMove, (self.whiteCastleKingside, self.whiteCastleQueenside,
+                       self.blackCastleKingside, self.blackCastleQueenside), self.enpasantPossible,
+                       self.halfmoveClock, self.fullmoveNumber)
+
+    # build the bitboards from self.board
+    def _loadBoard(self):
+        self.bitboards = [0] * 12
+        self.squares = [NO_PIECE] * 64
+        self.occupied = [0, 0]
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != '--':
+                    sq = row * 8 + col
+                    index = PIECE_INDEX[piece]
+                    self.bitboards[index] |= 1 << sq
+                    self.occupied[index // 6] |= 1 << sq
+                    self.squares[sq] = index
+
+    # same arguments as engine.GameState.loadPosition
+    def loadPosition(self, board, whiteToMove, castling, enpassant, halfmoveClock=0, fullmoveNumber=1):
+        for row in range(8):
+            self.board[row][:] = board[row]
+        self._loadBoard()
+        self.whiteToMove = whiteToMove
+        self.moveLog = []
+        self.checkmate = False
+        self.stalemate = False
+        self.inCheck = False
+        self.castleRights = 0
+        for right, allowed in zip((WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE), castling):
+            if allowed:
+                self.castleRights |= right
+        self.castleRightsLog = [self.castleRights]
+        self.enpasantSquare = enpassant[0] * 8 + enpassant[1] if enpassant else NO_SQUARE
+        self.enpasantSquareLog = [self.enpasantSquare]
+        self.halfmoveClock = halfmoveClock
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.fullmoveNumber = fullmoveNumber
+        self.resetZobrist()
+        self.resetScore()
+
+    # same as engine.GameState.resetZobrist
+    def resetZobrist(self):
+        self.zobristKey = zobristKey(self.board, self.whiteToMove, (self.whiteCastleKingside, self.whiteCastleQueenside,
+                                     self.blackCastleKingside, self.blackCastleQueenside), self.enpasantPossible)
+        self.zobristLog = [self.zobristKey]
+        self.positionCounts = {self.zobristKey: 1}
+
+    # same as engine.GameState.resetScore
+    def resetScore(self):
+        self.mgScore, self.egScore, self.phase = scoreBoard(self.board)
+        self.scoreLog = []
+
+    @property
+    def score(self):
+        return taper(self.mgScore, self.egScore, self.phase)
+
+    def repetitionCount(self):
+        return self.positionCounts[self.zobristKey]
+
+    def isThreefoldRepetition(self):
+        return self.positionCounts[self.zobristKey] >= 3
+
+    # same attributes engine.GameState exposes, derived from the bitboards
+    @property
+    def whiteKinglocation(self):
+        return ROW_COL[self.bitboards[KING].bit_length() - 1]
+
+    @property
+    def blackKinglocation(self):
+        return ROW_COL[self.bitboards[6 + KING].bit_length() - 1]
+
+    @property
+    def enpasantPossible(self):
+        return ROW_COL[self.enpasantSquare] if self.enpasantSquare != NO_SQUARE else ()
+
+    @property
+    def whiteCastleKingside(self):
+        return bool(self.castleRights & WHITE_KINGSIDE)
+
+    @property
+    def whiteCastleQueenside(self):
+        return bool(self.castleRights & WHITE_QUEENSIDE)
+
+    @property
+    def blackCastleKingside(self):
+        return bool(self.castleRights & BLACK_KINGSIDE)
+
+    @property
+    def blackCastleQueenside(self):
+        return bool(self.castleRights & BLACK_QUEENSIDE)
+
+    def _put(self, index, sq):
+        bit = 1 << sq
+        self.bitboards[index] |= bit
+        self.occupied[index // 6] |= bit
+        self.squares[sq] = index
+        self.board[sq >> 3][sq & 7] = PIECES[index]
+        self.zobristKey ^= ZOBRIST_BY_INDEX[index][sq]
+
+    def _remove(self, sq):
+        index = self.squares[sq]
+        bit = 1 << sq
+        self.bitboards[index] ^= bit
+        self.occupied[index // 6] ^= bit
+        self.squares[sq] = NO_PIECE
+        self.board[sq >> 3][sq & 7] = '--'
+        self.zobristKey ^= ZOBRIST_BY_INDEX[index][sq]
+        return index
+
+    # move is a code from getValidMoveCodes() or a Move
+    def makeMove(self, move):
+        code = move if isinstance(move, int) else move.code
+        start = code & 63
+        end = (code >> 6) & 63
+        self.moveLog.append(code)
+        self.scoreLog.append((self.mgScore, self.egScore, self.phase))
+        mg, eg, phase = scoreChange(code, MG_TABLES, EG_TABLES)
+        self.mgScore += mg
+        self.egScore += eg
+        self.phase += phase
+
+        # the pieces are moved here instead of through _put / _remove, this runs at every node of a search
+        bitboards = self.bitboards
+        occupied = self.occupied
+        squares = self.squares
+        board = self.board
+        moved = (code >> MOVED_SHIFT) & 15
+        captured = (code >> CAPTURED_SHIFT) & 15
+        color = moved // 6
+        key = self.zobristKey
+        if captured != NO_PIECE:
+            # for en passant the opponent pawn is on the start row, end col
+            capturedSquare = (start & ~7) | (end & 7) if code & ENPASSANT_FLAG else end
+            bit = 1 << capturedSquare
+            bitboards[captured] ^= bit
+            occupied[1 - color] ^= bit
+            squares[capturedSquare] = NO_PIECE
+            board[capturedSquare >> 3][capturedSquare & 7] = '--'
+            key ^= ZOBRIST_BY_INDEX[captured][capturedSquare]
+        piece = moved + PROMOTION_OFFSETS[(code >> PROMOTION_SHIFT) & 7]
+        startBit = 1 << start
+        endBit = 1 << end
+        bitboards[moved] ^= startBit
+        bitboards[piece] |= endBit
+        occupied[color] ^= startBit | endBit
+        squares[start] = NO_PIECE
+        squares[end] = piece
+        board[start >> 3][start & 7] = '--'
+        board[end >> 3][end & 7] = PIECES[piece]
+        self.zobristKey = key ^ ZOBRIST_BY_INDEX[moved][start] ^ ZOBRIST_BY_INDEX[piece][end]
+
+        if code & CASTLE_FLAG:
+            if end - start == 2:  # king side, rook jumps from the corner next to the king
+                self._put(self._remove(end + 1), end - 1)
+            else:  # queen side
+                self._put(self._remove(end - 2), end + 1)
+
+        key = self.zobristKey ^ ZOBRIST_CASTLE[self.castleRights] ^ ZOBRIST_BLACK_TO_MOVE
+        self.castleRights &= CASTLE_KEEP[start] & CASTLE_KEEP[end]
+        self.castleRightsLog.append(self.castleRights)
+        key ^= ZOBRIST_CASTLE[self.castleRights]
+
+        if self.enpasantSquare != NO_SQUARE:
+            key ^= ZOBRIST_ENPASSANT[self.enpasantSquare & 7]
+        # only on 2 square pawn advances
+        if piece % 6 == PAWN and abs(end - start) == 16:
+            self.enpasantSquare = (start + end) // 2
+            key ^= ZOBRIST_ENPASSANT[self.enpasantSquare & 7]
+        else:
+            self.enpasantSquare = NO_SQUARE
+        self.enpasantSquareLog.append(self.enpasantSquare)
+
+        self.zobristKey = key
+        self.zobristLog.append(key)
+        self.positionCounts[key] = self.positionCounts.get(key, 0) + 1
+
+        if ((code >> MOVED_SHIFT) & 15) % 6 == PAWN or (code >> CAPTURED_SHIFT) & 15 != NO_PIECE:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        self.halfmoveClockLog.append(self.halfmoveClock)
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
+
+        self.whiteToMove = not self.whiteToMove
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            code = self.moveLog.pop()
+            start = code & 63
+            end = (code >> 6) & 63
+
+            if code & CASTLE_FLAG:
+                if end - start == 2:
+                    self._put(self._remove(end - 1), end + 1)
+                else:
+                    self._put(self._remove(end + 1), end - 2)
+
+            # same as makeMove, the key comes back from zobristLog below
+            bitboards = self.bitboards
+            occupied = self.occupied
+            squares = self.squares
+            board = self.board
+            moved = (code >> MOVED_SHIFT) & 15
+            captured = (code >> CAPTURED_SHIFT) & 15
+            color = moved // 6
+            startBit = 1 << start
+            endBit = 1 << end
+            # puts the pawn back for promotions as well
+            bitboards[squares[end]] ^= endBit
+            bitboards[moved] |= startBit
+            occupied[color] ^= startBit | endBit
+            squares[end] = NO_PIECE
+            squares[start] = moved
+            board[end >> 3][end & 7] = '--'
+            board[start >> 3][start & 7] = PIECES[moved]
+            if captured != NO_PIECE:
+                capturedSquare = (start & ~7) | (end & 7) if code & ENPASSANT_FLAG else end
+                bit = 1 << capturedSquare
+                bitboards[captured] |= bit
+                occupied[1 - color] |= bit
+                squares[capturedSquare] = captured
+                board[capturedSquare >> 3][capturedSquare & 7] = PIECES[captured]
+
+            self.castleRightsLog.pop()
+            self.castleRights = self.castleRightsLog[-1]
+            self.enpasantSquareLog.pop()
+            self.enpasantSquare = self.enpasantSquareLog[-1]
+
+            self.positionCounts[self.zobristLog.pop()] -= 1
+            self.zobristKey = self.zobristLog[-1]
+
+            self.mgScore, self.egScore, self.phase = self.scoreLog.pop()
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog[-1]
+            self.whiteToMove = not self.whiteToMove
+            if not self.whiteToMove:
+                self.fullmoveNumber -= 1
+            self.checkmate = False
+            self.stalemate = False
+
+    # every piece of color `by` attacking sq when the board occupancy is `occupied`
+    def _attackersTo(self, sq, by, occupied):
+        bitboards = self.bitboards
+        offset = by * 6
+        attackers = (KNIGHT_ATTACKS[sq] & bitboards[offset + KNIGHT]) | \
+            (KING_ATTACKS[sq] & bitboards[offset + KING]) | \
+            (PAWN_ATTACKS[1 - by][sq] & bitboards[offset + PAWN])
+        rooks = bitboards[offset + ROOK] | bitboards[offset + QUEEN]
+        if rooks & ROOK_RAYS[sq]:
+            attackers |= ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]] & rooks
+        bishops = bitboards[offset + BISHOP] | bitboards[offset + QUEEN]
+        if bishops & BISHOP_RAYS[sq]:
+            attackers |= BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]] & bishops
+        return attackers
+
+    def getValidMoves(self):
+        return [Move.fromCode(code) for code in self.getValidMoveCodes()]
+
+    # same as engine.GameState.getValidMoveCodes, every code is built straight from the bitboards
+    def getValidMoveCodes(self, buffer=None):
+        return self._generateMoves(buffer, False)
+
+    # legal captures only (en passant included, checkmate / stalemate are left alone), no quiet move is generated
+    def getCaptureCodes(self, buffer=None):
+        return self._generateMoves(buffer, True)
+
+    def _generateMoves(self, buffer, capturesOnly):
+        us = WHITE if self.whiteToMove else BLACK
+        them = 1 - us
+        bitboards = self.bitboards
+        squares = self.squares
+        ours = self.occupied[us]
+        theirs = self.occupied[them]
+        occupied = ours | theirs
+        kingBit = bitboards[us * 6 + KING]
+        kingSquare = kingBit.bit_length() - 1
+        if buffer is None:
+            moves = array('I')
+        else:
+            moves = buffer
+            del moves[:]
+
+        checkers = self._attackersTo(kingSquare, them, occupied)
+        self.inCheck = checkers != 0
+
+        kingCode = kingSquare | ((us * 6 + KING) << MOVED_SHIFT)
+        kingTargets = KING_ATTACKS[kingSquare] & ~ours
+        if capturesOnly:
+            kingTargets &= theirs
+        append = moves.append
+        if kingTargets:
+            # the king has few squares, each one is tested on its own instead of building the whole attack map
+            # (_attackersTo written out), sliders see through the king so it can't walk away along their ray
+            withoutKing = occupied ^ kingBit
+            offset = them * 6
+            knights = bitboards[offset + KNIGHT]
+            pawnAttacks = PAWN_ATTACKS[us]
+            pawns = bitboards[offset + PAWN]
+            king = bitboards[offset + KING]
+            rooks = bitboards[offset + ROOK] | bitboards[offset + QUEEN]
+            bishops = bitboards[offset + BISHOP] | bitboards[offset + QUEEN]
+            while kingTargets:
+                bit = kingTargets & -kingTargets
+                end = bit.bit_length() - 1
+                kingTargets ^= bit
+                if KNIGHT_ATTACKS[end] & knights or pawnAttacks[end] & pawns or KING_ATTACKS[end] & king or \
+                        ROOK_TABLES[end][withoutKing & ROOK_MASKS[end]] & rooks or \
+                        BISHOP_TABLES[end][withoutKing & BISHOP_MASKS[end]] & bishops:
+                    continue
+                append(kingCode | (end << 6) | (squares[end] << CAPTURED_SHIFT))
+
+        # double check, only the king can move
+        if checkers & (checkers - 1):
+            return moves if capturesOnly else self._setEndState(moves)
+
+        if checkers:
+            # capture the checking piece or block its ray
+            checkSquare = checkers.bit_length() - 1
+            targetMask = checkers | BETWEEN[kingSquare][checkSquare]
+        else:
+            targetMask = FULL
+        targetMask &= theirs if capturesOnly else ~ours
+
+        # pinned pieces may only move along the line between the king and the pinning piece
+        pinLines = {}
+        snipers = (ROOK_RAYS[kingSquare] & (bitboards[them * 6 + ROOK] | bitboards[them * 6 + QUEEN])) | \
+            (BISHOP_RAYS[kingSquare] & (bitboards[them * 6 + BISHOP] | bitboards[them * 6 + QUEEN]))
+        between = BETWEEN[kingSquare]
+        while snipers:
+            bit = snipers & -snipers
+            sniper = bit.bit_length() - 1
+            snipers ^= bit
+            blockers = between[sniper] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & ours:
+                pinLines[blockers.bit_length() - 1] = LINE[kingSquare][sniper]
+
+        offset = us * 6
+        knightCode = (offset + KNIGHT) << MOVED_SHIFT
+        knights = bitboards[offset + KNIGHT]
+        while knights:
+            bit = knights & -knights
+            start = bit.bit_length() - 1
+            knights ^= bit
+            if start in pinLines:  # a pinned knight can never move
+                continue
+            startCode = start | knightCode
+            targets = KNIGHT_ATTACKS[start] & targetMask
+            while targets:
+                bit = targets & -targets
+                end = bit.bit_length() - 1
+                append(startCode | (end << 6) | (squares[end] << CAPTURED_SHIFT))
+                targets ^= bit
+
+        for tables, masks, sliders in ((BISHOP_TABLES, BISHOP_MASKS, bitboards[offset + BISHOP] | bitboards[offset + QUEEN]),
+                                       (ROOK_TABLES, ROOK_MASKS, bitboards[offset + ROOK] | bitboards[offset + QUEEN])):
+            while sliders:
+                bit = sliders & -sliders
+                start = bit.bit_length() - 1
+                sliders ^= bit
+                targets = tables[start][occupied & masks[start]] & targetMask
+                if start in pinLines:
+                    targets &= pinLines[start]
+                startCode = start | (squares[start] << MOVED_SHIFT)
+                while targets:
+                    bit = targets & -targets
+                    end = bit.bit_length() - 1
+                    append(startCode | (end << 6) | (squares[end] << CAPTURED_SHIFT))
+                    targets ^= bit
+
+        # with capturesOnly the target mask has only enemy pieces, which leaves no pawn push (en passant is kept)
+        self._getPawnMoves(us, occupied, theirs, kingSquare, targetMask, pinLines, moves)
+
+        if capturesOnly:
+            return moves
+        if not checkers and self.castleRights & CASTLE_RIGHTS[us]:
+            self._getCastleMoves(us, occupied, kingSquare, moves)
+
+        return self._setEndState(moves)
+
+    def _getPawnMoves(self, us, occupied, theirs, kingSquare, targetMask, pinLines, moves):
+        squares = self.squares
+        pawns = self.bitboards[us * 6 + PAWN]
+        pawnCode = (us * 6 + PAWN) << MOVED_SHIFT
+        promotionRow = PROMOTION_ROWS[us]
+        empty = ~occupied & FULL
+        # pinned pawns are generated one by one below, every other pawn is pushed as a whole set
+        pinned = 0
+        for sq in pinLines:
+            pinned |= 1 << sq
+        free = pawns & ~pinned
+        captures = theirs & targetMask
+        if us == WHITE:
+            single = (free >> 8) & empty
+            double = ((single & ROWS[5]) >> 8) & empty
+            targets = ((single & targetMask, 8), (double & targetMask, 16),
+                       (((free & ~FILE_A) >> 9) & captures, 9), (((free & ~FILE_H) >> 7) & captures, 7))
+        else:
+            single = (free << 8) & empty
+            double = ((single & ROWS[2]) << 8) & empty
+            targets = ((single & targetMask, -8), (double & targetMask, -16),
+                       (((free & ~FILE_A) << 7) & captures, -7), (((free & ~FILE_H) << 9) & captures, -9))
+        append = moves.append
+        for ends, back in targets:
+            if not ends:
+                continue
+            promotions = ends & promotionRow
+            ends ^= promotions
+            while ends:
+                bit = ends & -ends
+                end = bit.bit_length() - 1
+                append((end + back) | (end << 6) | pawnCode | (squares[end] << CAPTURED_SHIFT))
+                ends ^= bit
+            while promotions:
+                bit = promotions & -promotions
+                end = bit.bit_length() - 1
+                promotions ^= bit
+                code = (end + back) | (end << 6) | pawnCode | (squares[end] << CAPTURED_SHIFT)
+                # one move for every piece the pawn can become
+                for promotion in PROMOTIONS:
+                    append(code | promotion)
+
+        forward = -8 if us == WHITE else 8
+        startRow = 6 if us == WHITE else 1
+        for start in _squares(pawns & pinned):
+            allowed = targetMask & pinLines[start]
+            end = start + forward
+            if not (occupied >> end) & 1:
+                if (allowed >> end) & 1:
+                    code = start | (end << 6) | pawnCode | (NO_PIECE << CAPTURED_SHIFT)
+                    if (1 << end) & promotionRow:
+                        for promotion in PROMOTIONS:
+                            moves.append(code | promotion)
+                    else:
+                        moves.append(code)
+                if start >> 3 == startRow:
+                    end += forward
+                    if not (occupied >> end) & 1 and (allowed >> end) & 1:
+                        moves.append(start | (end << 6) | pawnCode | (NO_PIECE << CAPTURED_SHIFT))
+            for end in _squares(PAWN_ATTACKS[us][start] & theirs & allowed):
+                code = start | (end << 6) | pawnCode | (squares[end] << CAPTURED_SHIFT)
+                if (1 << end) & promotionRow:
+                    for promotion in PROMOTIONS:
+                        moves.append(code | promotion)
+                else:
+                    moves.append(code)
+
+        # en passant, pins and checks are all handled by _enpassantIsLegal
+        if self.enpasantSquare != NO_SQUARE:
+            enpassantCode = (self.enpasantSquare << 6) | pawnCode | (((1 - us) * 6 + PAWN) << CAPTURED_SHIFT) | ENPASSANT_FLAG
+            for start in _squares(PAWN_ATTACKS[1 - us][self.enpasantSquare] & pawns):
+                if self._enpassantIsLegal(us, start, occupied, kingSquare):
+                    moves.append(start | enpassantCode)
+
+    # en passant removes two pieces from the board, so test the resulting position directly
+    def _enpassantIsLegal(self, us, start, occupied, kingSquare):
+        them = 1 - us
+        end = self.enpasantSquare
+        capturedSquare = (start & ~7) | (end & 7)
+        occupied = (occupied ^ (1 << start) ^ (1 << capturedSquare)) | (1 << end)
+        bitboards = self.bitboards
+        offset = them * 6
+        if KNIGHT_ATTACKS[kingSquare] & bitboards[offset + KNIGHT]:
+            return False
+        if PAWN_ATTACKS[us][kingSquare] & bitboards[offset + PAWN] & ~(1 << capturedSquare):
+            return False
+        rooks = bitboards[offset + ROOK] | bitboards[offset + QUEEN]
+        if ROOK_TABLES[kingSquare][occupied & ROOK_MASKS[kingSquare]] & rooks:
+            return False
+        bishops = bitboards[offset + BISHOP] | bitboards[offset + QUEEN]
+        if BISHOP_TABLES[kingSquare][occupied & BISHOP_MASKS[kingSquare]] & bishops:
+            return False
+        return True
+
+    def _getCastleMoves(self, us, occupied, kingSquare, moves):
+        if us == WHITE:
+            kingside, queenside = self.castleRights & WHITE_KINGSIDE, self.castleRights & WHITE_QUEENSIDE
+        else:
+            kingside, queenside = self.castleRights & BLACK_KINGSIDE, self.castleRights & BLACK_QUEENSIDE
+        castleCode = kingSquare | ((us * 6 + KING) << MOVED_SHIFT) | (NO_PIECE << CAPTURED_SHIFT) | CASTLE_FLAG
+        them = 1 - us
+        # squares the king passes must be empty and not attacked
+        if kingside:
+            path = (1 << (kingSquare + 1)) | (1 << (kingSquare + 2))
+            if not path & occupied and not self._attackersTo(kingSquare + 1, them, occupied) and \
+                    not self._attackersTo(kingSquare + 2, them, occupied):
+                moves.append(castleCode | ((kingSquare + 2) << 6))
+        if queenside:
+            path = (1 << (kingSquare - 1)) | (1 << (kingSquare - 2))
+            if not (path | (1 << (kingSquare - 3))) & occupied and not self._attackersTo(kingSquare - 1, them, occupied) and \
+                    not self._attackersTo(kingSquare - 2, them, occupied):
+                moves.append(castleCode | ((kingSquare - 2) << 6))
+
+    def _setEndState(self, moves):
+        if len(moves) == 0:
+            self.checkmate = self.inCheck
+            self.stalemate = not self.inCheck
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+
+    def getBoardString(self):
+        return "".join("".join(row) for row in self.board)
@@ -0,0 +1,251 @@
+# Opening book: a file of fixed-width records (position key, move, weight) sorted by key, probed by binary search
+# over an mmap of the file, so a lookup costs about log2(records) reads and no loading time
+# the key is the zobrist key of the position with white at the bottom, the move is packed like archive.packMove
+# the weight of a move is 2 for every game the side that played it won and 1 for every draw (or unfinished game)
+# the builder streams the games of PGN files, sorts runs of records in memory and merges them from disk,
+# so corpora with millions of games only need memory for one run
+# usage: python book.py build BOOK PGN [PGN ...] [--plies N] [--min-weight N] [--run-size N] [--backend mailbox|bitboard]
+#        python book.py probe BOOK [--fen FEN]
+
+import argparse
+import heapq
+import mmap
+import os
+import random
+import struct
+import tempfile
+import time
+from engine import GameState, zobristKey
+from archive import packMove, unpackMove
+from backends import START_FEN
+from pgn import readPgn, replayPgn, san
+
+# key, move, weight
+RECORD = struct.Struct("<QHH")
+KEY = struct.Struct("<Q")
+MAX_WEIGHT = 0xFFFF
+# records of the runs written while building, the weight isn't capped yet
+RUN_RECORD = struct.Struct("<QHI")
+# weight of a move by the result of the game for the side that played it
+RESULT_WEIGHTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1), "*": (1, 1)}
+
+
+# zobrist key of the position of gs as if white was at the bottom, the same for both board orientations
+def bookKey(gs):
+    if not gs.playerWantsToPlayAsBlack:
+        return gs.zobristKey
+    return zobristKey(gs.board[::-1], gs.whiteToMove, (gs.whiteCastleKingside, gs.whiteCastleQueenside,
+                      gs.blackCastleKingside, gs.blackCastleQueenside), gs.enpasantPossible)
+
+
+class OpeningBook():
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size % RECORD.size:
+            self.file.close()
+            raise ValueError(f"not an opening book: {path}")
+        self.count = size // RECORD.size
+        # mmap can't map an empty file
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.hits = 0
+        self.probes = 0
+
+    def __len__(self):
+        return self.count
+
+    # index of the first record with a key >= key
+    def lowerBound(self, key):
+        low, high = 0, self.count
+        unpack = KEY.unpack_from
+        data = self.map
+        while low < high:
+            middle = (low + high) >> 1
+            if unpack(data, middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    # (packed move, weight) of every book record of the key
+    def entries(self, key):
+        entries = []
+        index = self.lowerBound(key)
+        while index < self.count:
+            recordKey, move, weight = RECORD.unpack_from(self.map, index * RECORD.size)
+            if recordKey != key:
+                break
+            entries.append((move, weight))
+            index += 1
+        return entries
+
+    # (move code, weight) of the book moves of the position of gs that are legal there
+    def moves(self, gs):
+        entries = self.entries(bookKey(gs))
+        if not entries:
+            return []
+        legal = gs.getValidMoveCodes()
+        flipped = gs.playerWantsToPlayAsBlack
+        moves = []
+        for move, weight in entries:
+            if flipped:
+                # back to the squares of the flipped board
+                move ^= 56 | (56 << 6)
+            try:
+                moves.append((unpackMove(gs, move, legal), weight))
+            except ValueError:
+                # a key collision, the move belongs to another position
+                pass
+        return moves
+
+    # move code picked at random with the book weights, None when the position isn't in the book
+    def pick(self, gs, rng=random):
+        self.probes += 1
+        moves = [(code, weight) for code, weight in self.moves(gs) if weight > 0]
+        if not moves:
+            return None
+        self.hits += 1
+        return rng.choices([code for code, weight in moves], [weight for code, weight in moves])[0]
+
+    def close(self):
+        if self.count:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# games cut after their first plies moves, only the opening has to be replayed
+def openingPlies(games, plies):
+    for game in games:
+        game.moves = game.moves[:plies]
+        yield game
+
+
+# (key, packed move, weight) of the first plies moves of every game of the PGN files
+# games with an illegal move are skipped, their messages go in errors when it is a list
+def bookRecords(paths, plies=20, backend=GameState, errors=None):
+    errors = [] if errors is None else errors
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for game, gs in replayPgn(openingPlies(readPgn(f), plies), backend, errors):
+                whiteWeight, blackWeight = RESULT_WEIGHTS.get(game.result, (1, 1))
+                codes = list(gs.moveLog)
+                for code in codes:
+                    gs.undoMove()
+                for code in codes:
+                    weight = whiteWeight if gs.whiteToMove else blackWeight
+                    if weight:
+                        yield gs.zobristKey, packMove(code), weight
+                    gs.makeMove(code)
+
+
+# sums the weights of equal (key, move) records of a sorted stream
+def mergeWeights(records):
+    current = None
+    weight = 0
+    for key, move, recordWeight in records:
+        if (key, move) != current:
+            if current is not None:
+                yield current[0], current[1], weight
+            current = (key, move)
+            weight = 0
+        weight += recordWeight
+    if current is not None:
+        yield current[0], current[1], weight
+
+
+def writeRun(records, directory):
+    records.sort()
+    run = tempfile.TemporaryFile(dir=directory)
+    run.write(b"".join(RUN_RECORD.pack(*record) for record in mergeWeights(records)))
+    run.seek(0)
+    return run
+
+
+def readRun(run, chunkRecords=65536):
+    while True:
+        chunk = run.read(RUN_RECORD.size * chunkRecords)
+        if not chunk:
+            return
+        yield from RUN_RECORD.iter_unpack(chunk)
+
+
+# builds a book from a stream of (key, move, weight) records with an external sort: runs of runSize records are
+# sorted in memory and written to temporary files next to path, then merged into the book
+# moves with a total weight below minWeight are left out, returns the number of book records
+def buildBook(records, path, runSize=1000000, minWeight=1):
+    directory = os.path.dirname(os.path.abspath(path))
+    runs = []
+    pending = []
+    try:
+        for record in records:
+            pending.append(record)
+            if len(pending) >= runSize:
+                runs.append(writeRun(pending, directory))
+                pending = []
+        if pending or not runs:
+            runs.append(writeRun(pending, directory))
+        count = 0
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            buffer = []
+            for key, move, weight in mergeWeights(heapq.merge(*(readRun(run) for run in runs))):
+                if weight < minWeight:
+                    continue
+                buffer.append(RECORD.pack(key, move, min(weight, MAX_WEIGHT)))
+                count += 1
+                if len(buffer) >= 65536:
+                    f.write(b"".join(buffer))
+                    buffer = []
+            f.write(b"".join(buffer))
+        os.replace(temporary, path)
+        return count
+    finally:
+        for run in runs:
+            run.close()
+
+
+def main():
+    from backends import BACKENDS, loadFen
+
+    parser = argparse.ArgumentParser(description="build or probe an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build a book from PGN files")
+    build.add_argument("book")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--plies", type=int, default=20, help="moves of every game that go in the book")
+    build.add_argument("--min-weight", type=int, default=1, help="leave out moves with a lower total weight")
+    build.add_argument("--run-size", type=int, default=1000000, help="records sorted in memory at a time")
+    build.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard")
+    probe = commands.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=START_FEN)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "build":
+        errors = []
+        count = buildBook(bookRecords(args.pgn, args.plies, BACKENDS[args.backend], errors),
+                          args.book, args.run_size, args.min_weight)
+        for message in errors:
+            print(f"skipped: {message}")
+        print(f"records {count}  skipped games {len(errors)}  time {time.perf_counter() - start:.3f}s  size {os.path.getsize(args.book)} bytes")
+        return 0
+    gs = loadFen(GameState(), args.fen)
+    with OpeningBook(args.book) as book:
+        moves = book.moves(gs)
+        elapsed = time.perf_counter() - start
+        total = sum(weight for code, weight in moves) or 1
+        for code, weight in sorted(moves, key=lambda item: -item[1]):
+            print(f"{san(gs, code):8}  weight {weight}  {100 * weight / total:.1f}%")
+        print(f"moves {len(moves)}  records {len(book)}  time {elapsed * 1000:.3f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,219 @@
+# Codduo - Xadrez - Fluxo da partida sem interface
+# aplica os lances, guarda as peças capturadas, troca o relógio, detecta o fim da partida
+# (tempo, repetição, afogamento, xeque-mate) e acompanha a rotação do tabuleiro
+# main.game_loop só desenha o estado daqui, headless.py joga partidas com ele sem pygame
+
+import time
+from engine import GameState, Move
+
+
+class GameTimer:
+    def __init__(self, minutes_per_player, mode="countdown"):
+        self.mode = mode
+        if mode == "countdown":
+            self.white_time = minutes_per_player * 60
+            self.black_time = minutes_per_player * 60
+        else:
+            self.white_time = 0
+            self.black_time = 0
+        self.current_turn_start = None
+        self.active = False
+        
+    def start_turn(self, is_white_turn):
+        if self.current_turn_start is not None:
+            elapsed = time.time() - self.current_turn_start
+            if self.mode == "countdown":
+                if is_white_turn:
+                    self.black_time = max(0, self.black_time - elapsed)
+                else:
+                    self.white_time = max(0, self.white_time - elapsed)
+            else:
+                if is_white_turn:
+                    self.black_time += elapsed
+                else:
+                    self.white_time += elapsed
+        
+        self.current_turn_start = time.time()
+        self.active = True
+    
+    def get_current_times(self, is_white_turn):
+        if not self.active or self.current_turn_start is None:
+            return self.white_time, self.black_time
+            
+        elapsed = time.time() - self.current_turn_start
+        
+        if self.mode == "countdown":
+            if is_white_turn:
+                current_white = max(0, self.white_time - elapsed)
+                return current_white, self.black_time
+            else:
+                current_black = max(0, self.black_time - elapsed)
+                return self.white_time, current_black
+        else:  # stopwatch mode
+            if is_white_turn:
+                current_white = self.white_time + elapsed
+                return current_white, self.black_time
+            else:
+                current_black = self.black_time + elapsed
+                return self.white_time, current_black
+    
+    def is_time_up(self, is_white_turn):
+        if self.mode == "stopwatch":
+            return False
+        white_time, black_time = self.get_current_times(is_white_turn)
+        return white_time <= 0 or black_time <= 0
+
+
+class GameController:
+    # new_game_state cria o GameState de cada partida (classe do backend ou main.createGameState)
+    # move_worker é um worker.MoveWorker opcional: com ele os lances válidos chegam por update()
+    def __init__(self, new_game_state=GameState, show_timer=False, timer_minutes=10, timer_mode="countdown",
+                 auto_rotate=False, rotation_animation=False, rotation_speed=2.0, move_worker=None):
+        self.new_game_state = new_game_state
+        self.show_timer = show_timer
+        self.timer_minutes = timer_minutes
+        self.timer_mode = timer_mode
+        self.auto_rotate = auto_rotate
+        self.rotation_animation = rotation_animation
+        self.rotation_speed = rotation_speed
+        self.move_worker = move_worker
+        self.reset()
+
+    # nova partida
+    def reset(self):
+        gs = self.new_game_state()
+        if (gs.playerWantsToPlayAsBlack):
+            gs.board = gs.board1
+        self.gs = gs
+        # if a user makes a move we can ckeck if its in the list of valid moves
+        self.valid_moves = gs.getValidMoves()
+        if self.move_worker is not None:
+            self.move_worker.cancel()
+        # Listas para peças capturadas
+        self.white_captured = []  # Peças brancas capturadas pelo preto
+        self.black_captured = []  # Peças pretas capturadas pelo branco
+        self.game_over = False  # gameover if checkmate, stalemate, repetition or time
+        self.end_text = None
+        # "1-0", "0-1", "1/2-1/2" ou "*" enquanto a partida não acabou
+        self.result = "*"
+        self.board_rotated = False  # Track if board is currently rotated
+        self.rotation_animation_active = False
+        self.rotation_start_time = 0
+        self.target_rotation = False
+        # Timer do jogo
+        self.timer = None
+        if self.show_timer:
+            self.timer = GameTimer(self.timer_minutes, self.timer_mode)
+            self.timer.start_turn(gs.whiteToMove)
+
+    # o tabuleiro aceita cliques: partida em andamento e sem rotação
+    @property
+    def accepts_input(self):
+        return not self.game_over and not self.rotation_animation_active
+
+    # rotação desenhada agora: a animação troca o lado na metade
+    @property
+    def current_rotation(self):
+        if self.rotation_animation_active:
+            progress = min((time.time() - self.rotation_start_time) / self.rotation_speed, 1.0)
+            # Simple flip animation (could be enhanced with smooth rotation)
+            if progress > 0.5:
+                return self.target_rotation
+        return self.board_rotated
+
+    # lance válido de start para end ((row, col) do tabuleiro), None se não houver
+    # promoções têm um lance por peça: promotion ('Q', 'R', 'B' ou 'N') escolhe qual, sem ela vem o primeiro
+    def find_move(self, start, end, promotion=None):
+        move = Move(start, end, self.gs.board, promotionRows=self.gs.promotionRows)
+        for valid_move in self.valid_moves:
+            if move == valid_move and (promotion is None or valid_move.promotionChoice == promotion):
+                return valid_move
+        return None
+
+    # move é um dos valid_moves (com promotionChoice já escolhida) ou um código de lance válido
+    def make_move(self, move):
+        if isinstance(move, int):
+            move = Move.fromCode(move)
+        # peça capturada, no caso do en passant o peão ao lado da casa final
+        captured_piece = move.pieceCaptured
+        if captured_piece != '--':
+            if captured_piece[0] == 'w':  # White piece captured
+                self.white_captured.append(captured_piece)
+            else:  # Black piece captured
+                self.black_captured.append(captured_piece)
+        self.gs.makeMove(move)
+        self.after_move()
+
+    def undo_move(self):
+        self.gs.undoMove()
+        self.game_over = False
+        self.after_move()
+
+    def after_move(self):
+        gs = self.gs
+        # Update timer
+        if self.timer is not None:
+            self.timer.start_turn(gs.whiteToMove)
+
+        # Auto-rotate board if enabled
+        if self.auto_rotate:
+            new_rotation = not gs.whiteToMove  # Black's turn = rotated
+            if new_rotation != self.board_rotated:
+                if self.rotation_animation:
+                    # Start rotation animation
+                    self.rotation_animation_active = True
+                    self.rotation_start_time = time.time()
+                    self.target_rotation = new_rotation
+                else:
+                    # Instant rotation
+                    self.board_rotated = new_rotation
+
+        # genetare new set of valid move, in the worker when there is one (no move matches until they arrive)
+        if self.move_worker is not None:
+            self.move_worker.submit(gs)
+            self.valid_moves = []
+        else:
+            self.valid_moves = gs.getValidMoves()
+
+    # chamado uma vez por frame (ou por lance sem interface): resultados do worker, rotação e fim de partida
+    def update(self):
+        gs = self.gs
+        # resultado do worker para a posição atual (os de posições antigas são descartados pela chave zobrist)
+        if self.move_worker is not None and self.move_worker.pending:
+            result = self.move_worker.poll()
+            if result is not None:
+                self.valid_moves = [Move.fromCode(code) for code in result.moves]
+                gs.checkmate = result.checkmate
+                gs.stalemate = result.stalemate
+                gs.inCheck = result.inCheck
+
+        # Update rotation animation
+        if self.rotation_animation_active and time.time() - self.rotation_start_time >= self.rotation_speed:
+            # Animation complete
+            self.rotation_animation_active = False
+            self.board_rotated = self.target_rotation
+
+        # o fim da partida fica como foi detectado até undo_move ou reset
+        if self.game_over:
+            return
+        self.end_text = None
+        self.result = "*"
+        # Check timer
+        if self.timer is not None and self.timer.is_time_up(gs.whiteToMove):
+            self.game_over = True
+            winner = "Black" if gs.whiteToMove else "White"
+            self.end_text = f'{winner} wins by time!'
+            self.result = "0-1" if gs.whiteToMove else "1-0"
+        # same position (zobrist key) on the board for the third time
+        if gs.isThreefoldRepetition():
+            self.game_over = True
+            self.end_text = 'Draw due to repetition'
+            self.result = "1/2-1/2"
+        if gs.stalemate:
+            self.game_over = True
+            self.end_text = 'Stalemate'
+            self.result = "1/2-1/2"
+        elif gs.checkmate:
+            self.game_over = True
+            self.end_text = 'Black wins by checkmate' if gs.whiteToMove else 'White wins by checkmate'
+            self.result = "0-1" if gs.whiteToMove else "1-0"
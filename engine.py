@@ -5,6 +5,230 @@
 
 # Responsible for storing all information about current state of chess game, determining valid move, able to undo moves ...
 
+import random
+from array import array
+from pst import MG_VALUES, EG_VALUES, MG_PST, EG_PST, PHASE_WEIGHTS, pieceSquareTables, taper
+
+
+# row where each pawn promotes, every GameState picks one of these from playerWantsToPlayAsBlack (gs.promotionRows)
+PROMOTION_ROWS = {'wp': 0, 'bp': 7}
+PROMOTION_ROWS_FLIPPED = {'wp': 7, 'bp': 0}
+
+
+# Zobrist hashing: a random 64 bit number for every piece on every square (row * 8 + col), every combination of castle rights,
+# every enpassant col and for black to move. The key of a position is the xor of the numbers that apply to it,
+# so a move only has to xor out what changed. Fixed seed so keys are the same on every run (opening books, saved tables)
+_zobristRandom = random.Random(20240601)
+ZOBRIST_PIECES = {piece: [_zobristRandom.getrandbits(64) for sq in range(64)]
+                  for piece in ['wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK']}
+# indexed by castleRightsMask()
+ZOBRIST_CASTLE = [_zobristRandom.getrandbits(64) for mask in range(16)]
+ZOBRIST_ENPASSANT = [_zobristRandom.getrandbits(64) for col in range(8)]
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+
+
+def castleRightsMask(wks, wqs, bks, bqs):
+    return wks | (wqs << 1) | (bks << 2) | (bqs << 3)
+
+
+# key of a position from scratch, makeMove and undoMove keep it up to date incrementally
+def zobristKey(board, whiteToMove, castling, enpassant):
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            if board[row][col] != '--':
+                key ^= ZOBRIST_PIECES[board[row][col]][row * 8 + col]
+    key ^= ZOBRIST_CASTLE[castleRightsMask(*castling)]
+    if enpassant:
+        key ^= ZOBRIST_ENPASSANT[enpassant[1]]
+    if not whiteToMove:
+        key ^= ZOBRIST_BLACK_TO_MOVE
+    return key
+
+
+def _targets(offsets):
+    table = []
+    for sq in range(64):
+        row, col = sq >> 3, sq & 7
+        table.append([(row + dr) * 8 + col + dc for dr, dc in offsets if 0 <= row + dr < 8 and 0 <= col + dc < 8])
+    return table
+
+
+# squares a knight or a king on each square (row * 8 + col) attacks
+KNIGHT_TARGETS = _targets(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_TARGETS = _targets(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+
+
+# Moves are generated, searched and logged as plain ints instead of Move objects:
+#   bits 0-5 start square (row * 8 + col), 6-11 end square, 12-14 promotion piece (index in PROMOTION_PIECES, 0 if none)
+#   bits 16-19 piece moved, 20-23 piece captured (index in PIECES, NO_PIECE if none), bit 24 enpassant, bit 25 castle
+# the low 16 bits (MOVE_MASK) tell apart every move of a position, the whole code fits in the 32 bit items of array('I')
+PIECES = ['wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK', '--']
+NO_PIECE = 12
+PIECE_INDEX = {piece: i for i, piece in enumerate(PIECES)}
+PROMOTION_PIECES = ['', 'Q', 'R', 'B', 'N']
+
+MOVE_MASK = 0xFFFF
+PROMOTION_SHIFT = 12
+MOVED_SHIFT = 16
+CAPTURED_SHIFT = 20
+ENPASSANT_FLAG = 1 << 24
+CASTLE_FLAG = 1 << 25
+PROMOTE_QUEEN = 1 << PROMOTION_SHIFT
+# promotion bits of every piece a pawn can promote to, a promoting pawn move is generated once with each
+PROMOTIONS = tuple(i << PROMOTION_SHIFT for i in range(1, len(PROMOTION_PIECES)))
+# promotion bits of a pawn move that doesn't promote
+NO_PROMOTION = (0,)
+
+
+# code of the move from (startRow, startCol) to (endRow, endCol) on board, flags are or'ed in as they are
+def encodeMove(startRow, startCol, endRow, endCol, board, flags=0):
+    code = (startRow * 8 + startCol) | ((endRow * 8 + endCol) << 6) | \
+        (PIECE_INDEX[board[startRow][startCol]] << MOVED_SHIFT) | flags
+    if flags & ENPASSANT_FLAG:
+        # the captured pawn is next to the moving pawn, not on the end square
+        return code | (PIECE_INDEX[board[startRow][endCol]] << CAPTURED_SHIFT)
+    return code | (PIECE_INDEX[board[endRow][endCol]] << CAPTURED_SHIFT)
+
+
+# material + piece-square score (pst.py) of every piece index on every square, positive for white, 0 for NO_PIECE
+MG_TABLES = pieceSquareTables(PIECES, MG_VALUES, MG_PST)
+EG_TABLES = pieceSquareTables(PIECES, EG_VALUES, EG_PST)
+# same for the board of playerWantsToPlayAsBlack, where white starts on row 0
+MG_TABLES_FLIPPED = pieceSquareTables(PIECES, MG_VALUES, MG_PST, True)
+EG_TABLES_FLIPPED = pieceSquareTables(PIECES, EG_VALUES, EG_PST, True)
+PHASES = [PHASE_WEIGHTS.get(piece[1], 0) for piece in PIECES]
+# index offset from the pawn to the piece it promotes to, by PROMOTION_PIECES index
+PROMOTION_OFFSETS = [0, PIECE_INDEX['wQ'], PIECE_INDEX['wR'], PIECE_INDEX['wB'], PIECE_INDEX['wN']]
+
+
+# (mg, eg, phase) of a board from scratch, scores positive for white
+def scoreBoard(board, flipped=False):
+    mgTables = MG_TABLES_FLIPPED if flipped else MG_TABLES
+    egTables = EG_TABLES_FLIPPED if flipped else EG_TABLES
+    mg = eg = phase = 0
+    sq = 0
+    for row in board:
+        for piece in row:
+            if piece != '--':
+                index = PIECE_INDEX[piece]
+                mg += mgTables[index][sq]
+                eg += egTables[index][sq]
+                phase += PHASES[index]
+            sq += 1
+    return mg, eg, phase
+
+
+# (mg, eg, phase) change made by a move code: the moved piece, the promotion, the capture (en passant too) and the castle rook
+def scoreChange(code, mgTables, egTables):
+    start = code & 63
+    end = (code >> 6) & 63
+    moved = (code >> MOVED_SHIFT) & 15
+    captured = (code >> CAPTURED_SHIFT) & 15
+    placed = moved + PROMOTION_OFFSETS[(code >> PROMOTION_SHIFT) & 7]
+    capturedSquare = (start & ~7) | (end & 7) if code & ENPASSANT_FLAG else end
+    mg = mgTables[placed][end] - mgTables[moved][start] - mgTables[captured][capturedSquare]
+    eg = egTables[placed][end] - egTables[moved][start] - egTables[captured][capturedSquare]
+    if code & CASTLE_FLAG:
+        # the rook index is two below the king's
+        rook = moved - 2
+        if end - start == 2:
+            rookStart, rookEnd = end + 1, end - 1
+        else:
+            rookStart, rookEnd = end - 2, end + 1
+        mg += mgTables[rook][rookEnd] - mgTables[rook][rookStart]
+        eg += egTables[rook][rookEnd] - egTables[rook][rookStart]
+    return mg, eg, PHASES[placed] - PHASES[moved] - PHASES[captured]
+
+
+# FEN letter of every piece and back
+FEN_PIECES = {'P': 'wp', 'N': 'wN', 'B': 'wB', 'R': 'wR', 'Q': 'wQ', 'K': 'wK',
+              'p': 'bp', 'n': 'bN', 'b': 'bB', 'r': 'bR', 'q': 'bQ', 'k': 'bK'}
+PIECE_FEN = {piece: char for char, piece in FEN_PIECES.items()}
+EMPTY_RUNS = {str(n): ['--'] * n for n in range(1, 9)}
+# parsed FEN ranks, most positions share a lot of them ('8', 'pppppppp', ...)
+_fenRanks = {}
+
+
+def _parseFenRank(rank):
+    row = _fenRanks.get(rank)
+    if row is None:
+        row = []
+        for char in rank:
+            if char in FEN_PIECES:
+                row.append(FEN_PIECES[char])
+            elif char in EMPTY_RUNS:
+                row.extend(EMPTY_RUNS[char])
+            else:
+                raise ValueError(f"invalid FEN rank {rank!r}")
+        if len(row) != 8:
+            raise ValueError(f"invalid FEN rank {rank!r}")
+        # keep the cache bounded on huge inputs
+        if len(_fenRanks) >= 100000:
+            _fenRanks.clear()
+        _fenRanks[rank] = row
+    return row
+
+
+# arguments of GameState.loadPosition for a FEN string:
+# (board, whiteToMove, castling, enpassant, halfmoveClock, fullmoveNumber)
+# flipped gives the board of playerWantsToPlayAsBlack, where white starts on row 0
+def parseFen(fen, flipped=False):
+    fields = fen.split()
+    if len(fields) < 4:
+        raise ValueError(f"invalid FEN {fen!r}")
+    ranks = fields[0].split('/')
+    if len(ranks) != 8:
+        raise ValueError(f"invalid FEN {fen!r}")
+    # the cached rows are shared, so every position gets its own copies
+    board = [_parseFenRank(rank)[:] for rank in ranks]
+    if flipped:
+        board.reverse()
+    whiteToMove = fields[1] == 'w'
+    castlingField = fields[2]
+    castling = ('K' in castlingField, 'Q' in castlingField, 'k' in castlingField, 'q' in castlingField)
+    if fields[3] == '-':
+        enpassant = ()
+    else:
+        rank = int(fields[3][1])
+        enpassant = (rank - 1 if flipped else 8 - rank, ord(fields[3][0]) - ord('a'))
+    halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+    fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+    return board, whiteToMove, castling, enpassant, halfmoveClock, fullmoveNumber
+
+
+def makeFen(board, whiteToMove, castling, enpassant, halfmoveClock=0, fullmoveNumber=1, flipped=False):
+    ranks = []
+    for row in (reversed(board) if flipped else board):
+        rank = ""
+        empty = 0
+        for square in row:
+            if square == '--':
+                empty += 1
+            else:
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += PIECE_FEN[square]
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+    castlingField = "".join(char for char, allowed in zip("KQkq", castling) if allowed) or "-"
+    if enpassant:
+        enpassantField = "abcdefgh"[enpassant[1]] + str(enpassant[0] + 1 if flipped else 8 - enpassant[0])
+    else:
+        enpassantField = "-"
+    return f"{'/'.join(ranks)} {'w' if whiteToMove else 'b'} {castlingField} {enpassantField} {halfmoveClock} {fullmoveNumber}"
+
+
+# parsed positions of a file with one FEN per line, read lazily so millions of them never sit in memory at once
+def readFenFile(path, flipped=False):
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield parseFen(line, flipped)
+
 
 class GameState():
     def __init__(self):
@@ -33,6 +257,8 @@ class GameState():
         self.whiteToMove = True
         # set playerWantsToPlayAsBlack = True if you want to flip board and play as black
         self.playerWantsToPlayAsBlack = False
+        self.promotionRows = PROMOTION_ROWS_FLIPPED if self.playerWantsToPlayAsBlack else PROMOTION_ROWS
+        # codes of the moves played, Move.fromCode(code) gives the Move back
         self.moveLog = []
         # keeping track of king positions to prevent from checks and also it makes castling easier
         if (self.playerWantsToPlayAsBlack):
@@ -44,9 +270,12 @@ class GameState():
         self.checkmate = False
         self.stalemate = False
         self.inCheck = False
-        self.score = 0
         self.pins = []
         self.checks = []
+        # squares the opponent attacks, one flag per row * 8 + col, rebuilt by every getValidMoves
+        self.attackedSquares = bytearray(64)
+        # set while getCaptureCodes runs the piece generators
+        self.capturesOnly = False
         # co-ordinates for square where enpassant is possible
         self.enpasantPossible = ()
         self.enpasantPossibleLog = [self.enpasantPossible]
@@ -57,47 +286,149 @@ class GameState():
         self.blackCastleQueenside = True
         self.castleRightsLog = [castleRights(
             self.whiteCastleKingside, self.whiteCastleQueenside, self.blackCastleKingside, self.blackCastleQueenside)]
-
+        # moves since the last capture or pawn move (fifty move rule) and the move number as written in a FEN
+        self.halfmoveClock = 0
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.fullmoveNumber = 1
+        self.resetZobrist()
+        self.resetScore()
+
+    # new GameState set up from a FEN string
+    @classmethod
+    def from_fen(cls, fen, playerWantsToPlayAsBlack=False):
+        gs = cls()
+        gs.playerWantsToPlayAsBlack = playerWantsToPlayAsBlack
+        gs.loadPosition(*parseFen(fen, playerWantsToPlayAsBlack))
+        return gs
+
+    def to_fen(self):
+        return makeFen(self.board, self.whiteToMove, (self.whiteCastleKingside, self.whiteCastleQueenside,
+                       self.blackCastleKingside, self.blackCastleQueenside), self.enpasantPossible,
+                       self.halfmoveClock, self.fullmoveNumber, self.playerWantsToPlayAsBlack)
+
+    # set up an arbitrary position in place, reusing the board lists
+    # board is 8 lists of 8 piece strings, castling is (wks, wqs, bks, bqs) and enpassant is () or (row, col)
+    def loadPosition(self, board, whiteToMove, castling, enpassant, halfmoveClock=0, fullmoveNumber=1):
+        for row in range(8):
+            self.board[row][:] = board[row]
+            for col in range(8):
+                if board[row][col] == 'wK':
+                    self.whiteKinglocation = (row, col)
+                elif board[row][col] == 'bK':
+                    self.blackKinglocation = (row, col)
+        self.whiteToMove = whiteToMove
+        self.moveLog = []
+        self.checkmate = False
+        self.stalemate = False
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.attackedSquares = bytearray(64)
+        self.enpasantPossible = enpassant
+        self.enpasantPossibleLog = [self.enpasantPossible]
+        self.whiteCastleKingside, self.whiteCastleQueenside, self.blackCastleKingside, self.blackCastleQueenside = castling
+        self.castleRightsLog = [castleRights(
+            self.whiteCastleKingside, self.whiteCastleQueenside, self.blackCastleKingside, self.blackCastleQueenside)]
+        self.halfmoveClock = halfmoveClock
+        self.halfmoveClockLog = [self.halfmoveClock]
+        self.fullmoveNumber = fullmoveNumber
+        # playerWantsToPlayAsBlack may have been set since __init__
+        self.promotionRows = PROMOTION_ROWS_FLIPPED if self.playerWantsToPlayAsBlack else PROMOTION_ROWS
+        self.resetZobrist()
+        self.resetScore()
+
+    # recompute the key of the current position and start a new key history (after the board was set up by hand)
+    def resetZobrist(self):
+        self.zobristKey = zobristKey(self.board, self.whiteToMove, (self.whiteCastleKingside, self.whiteCastleQueenside,
+                                     self.blackCastleKingside, self.blackCastleQueenside), self.enpasantPossible)
+        # key of every position since the start, next to moveLog
+        self.zobristLog = [self.zobristKey]
+        # how many times each key is in zobristLog, for O(1) repetition checks
+        self.positionCounts = {self.zobristKey: 1}
+
+    # recompute the material + piece-square score of the board and start a new score history
+    def resetScore(self):
+        self.mgTables = MG_TABLES_FLIPPED if self.playerWantsToPlayAsBlack else MG_TABLES
+        self.egTables = EG_TABLES_FLIPPED if self.playerWantsToPlayAsBlack else EG_TABLES
+        self.mgScore, self.egScore, self.phase = scoreBoard(self.board, self.playerWantsToPlayAsBlack)
+        # (mgScore, egScore, phase) before every move of moveLog
+        self.scoreLog = []
+
+    # evaluation of the position from white's point of view, kept up to date by makeMove / undoMove (for an eval bar)
+    @property
+    def score(self):
+        return taper(self.mgScore, self.egScore, self.phase)
+
+    # number of times the current position has been on the board
+    def repetitionCount(self):
+        return self.positionCounts[self.zobristKey]
+
+    def isThreefoldRepetition(self):
+        return self.positionCounts[self.zobristKey] >= 3
+
+    # move is a code from getValidMoveCodes() or a Move
     def makeMove(self, move):
-        self.board[move.startRow][move.startCol] = "--"
-        self.board[move.endRow][move.endCol] = move.pieceMoved
+        code = move if isinstance(move, int) else move.code
+        start = code & 63
+        end = (code >> 6) & 63
+        startRow, startCol = start >> 3, start & 7
+        endRow, endCol = end >> 3, end & 7
+        pieceMoved = PIECES[(code >> MOVED_SHIFT) & 15]
+        oldCastleRights = self.castleRightsLog[-1]
+        oldEnpassant = self.enpasantPossible
+        self.board[startRow][startCol] = "--"
+        self.board[endRow][endCol] = pieceMoved
         # save history of the moved played
-        self.moveLog.append(move)
+        self.moveLog.append(code)
+        # running evaluation
+        self.scoreLog.append((self.mgScore, self.egScore, self.phase))
+        mg, eg, phase = scoreChange(code, self.mgTables, self.egTables)
+        self.mgScore += mg
+        self.egScore += eg
+        self.phase += phase
+        # the clock restarts on pawn moves and captures, the move number goes up after black's move
+        if pieceMoved[1] == 'p' or (code >> CAPTURED_SHIFT) & 15 != NO_PIECE:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        self.halfmoveClockLog.append(self.halfmoveClock)
+        if not self.whiteToMove:
+            self.fullmoveNumber += 1
         # swap player
         self.whiteToMove = not self.whiteToMove
 
         # update king's location if moved
-        if move.pieceMoved == 'wK':
-            self.whiteKinglocation = (move.endRow, move.endCol)
+        if pieceMoved == 'wK':
+            self.whiteKinglocation = (endRow, endCol)
             self.whiteCastleKingside = False
             self.whiteCastleQueenside = False
-        elif move.pieceMoved == 'bK':
-            self.blackKinglocation = (move.endRow, move.endCol)
+        elif pieceMoved == 'bK':
+            self.blackKinglocation = (endRow, endCol)
             self.blackCastleKingside = False
             self.blackCastleQueenside = False
 
         # pawn promotion
-        # if move.isPawnPromotion:
-            # self.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q'
+        promotion = (code >> PROMOTION_SHIFT) & 7
+        if promotion:
+            self.board[endRow][endCol] = pieceMoved[0] + PROMOTION_PIECES[promotion]
 
         # enpassant move
-        if move.isEnpassantMove:
+        if code & ENPASSANT_FLAG:
             # capture piece, (same row , end col ) is the location of the opponent pawn from our pawn
-            self.board[move.startRow][move.endCol] = '--'
+            self.board[startRow][endCol] = '--'
 
         # update enpassant variable everytime piece is moved
         # only on 2 square pawn advances
-        if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
+        if pieceMoved[1] == 'p' and abs(startRow - endRow) == 2:
             # valid square will be between (startRow and endRow, endcol or startCol(because opponent's pawn 2 square move is on same col))
             # if we do the average of startRow and endRow it will be valid for both black and white
-            self.enpasantPossible = (
-                (move.startRow + move.endRow)//2, move.startCol)
+            self.enpasantPossible = ((startRow + endRow)//2, startCol)
         else:
             # if after opponent move its pawn to second square instead of capturing it with enpassant we played different move then enpassant move will not be possible
             self.enpasantPossible = ()
 
         # update Log which side castle is possible
-        self.updateCastleRights(move)
+        self.updateCastleRights(code)
         self.castleRightsLog.append(castleRights(
             self.whiteCastleKingside, self.whiteCastleQueenside, self.blackCastleKingside, self.blackCastleQueenside))
 
@@ -105,37 +436,79 @@ class GameState():
         self.enpasantPossibleLog.append(self.enpasantPossible)
 
         # castle moves
-        if move.castle:
+        if code & CASTLE_FLAG:
             # King Side
-            if move.endCol - move.startCol == 2:
+            if endCol - startCol == 2:
                 # Rook move
-                self.board[move.endRow][move.endCol -
-                                        1] = self.board[move.endRow][move.endCol + 1]
-                self.board[move.endRow][move.endCol + 1] = "--"
+                self.board[endRow][endCol - 1] = self.board[endRow][endCol + 1]
+                self.board[endRow][endCol + 1] = "--"
             # Queen Side
             else:
                 # Rook move
-                self.board[move.endRow][move.endCol +
-                                        1] = self.board[move.endRow][move.endCol - 2]
-                self.board[move.endRow][move.endCol - 2] = "--"
+                self.board[endRow][endCol + 1] = self.board[endRow][endCol - 2]
+                self.board[endRow][endCol - 2] = "--"
+
+        self.updateZobrist(code, oldCastleRights, oldEnpassant)
+
+    # xor out everything the move changed and push the new key
+    def updateZobrist(self, code, oldCastleRights, oldEnpassant):
+        start = code & 63
+        end = (code >> 6) & 63
+        pieceMoved = PIECES[(code >> MOVED_SHIFT) & 15]
+        pieceCaptured = PIECES[(code >> CAPTURED_SHIFT) & 15]
+        key = self.zobristKey ^ ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_PIECES[pieceMoved][start]
+        # placed piece, differs from pieceMoved on promotion
+        key ^= ZOBRIST_PIECES[self.board[end >> 3][end & 7]][end]
+        if code & ENPASSANT_FLAG:
+            key ^= ZOBRIST_PIECES[pieceCaptured][(start & ~7) | (end & 7)]
+        elif pieceCaptured != '--':
+            key ^= ZOBRIST_PIECES[pieceCaptured][end]
+        if code & CASTLE_FLAG:
+            rook = pieceMoved[0] + 'R'
+            if end - start == 2:
+                key ^= ZOBRIST_PIECES[rook][end + 1] ^ ZOBRIST_PIECES[rook][end - 1]
+            else:
+                key ^= ZOBRIST_PIECES[rook][end - 2] ^ ZOBRIST_PIECES[rook][end + 1]
+        newCastleRights = self.castleRightsLog[-1]
+        key ^= ZOBRIST_CASTLE[castleRightsMask(oldCastleRights.wks, oldCastleRights.wqs, oldCastleRights.bks, oldCastleRights.bqs)]
+        key ^= ZOBRIST_CASTLE[castleRightsMask(newCastleRights.wks, newCastleRights.wqs, newCastleRights.bks, newCastleRights.bqs)]
+        if oldEnpassant:
+            key ^= ZOBRIST_ENPASSANT[oldEnpassant[1]]
+        if self.enpasantPossible:
+            key ^= ZOBRIST_ENPASSANT[self.enpasantPossible[1]]
+        self.zobristKey = key
+        self.zobristLog.append(key)
+        self.positionCounts[key] = self.positionCounts.get(key, 0) + 1
 
     def undoMove(self):
         if len(self.moveLog) != 0:  # there is atleast one move to undo
-            move = self.moveLog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            code = self.moveLog.pop()
+            start = code & 63
+            end = (code >> 6) & 63
+            startRow, startCol = start >> 3, start & 7
+            endRow, endCol = end >> 3, end & 7
+            pieceMoved = PIECES[(code >> MOVED_SHIFT) & 15]
+            pieceCaptured = PIECES[(code >> CAPTURED_SHIFT) & 15]
+            self.board[startRow][startCol] = pieceMoved
+            self.board[endRow][endCol] = pieceCaptured
             self.whiteToMove = not self.whiteToMove  # swap player
+            self.mgScore, self.egScore, self.phase = self.scoreLog.pop()
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock = self.halfmoveClockLog[-1]
+            if not self.whiteToMove:
+                self.fullmoveNumber -= 1
 
             # undo updated king's location
-            if move.pieceMoved == 'wK':
-                self.whiteKinglocation = (move.startRow, move.startCol)
-            elif move.pieceMoved == 'bK':
-                self.blackKinglocation = (move.startRow, move.startCol)
+            if pieceMoved == 'wK':
+                self.whiteKinglocation = (startRow, startCol)
+            elif pieceMoved == 'bK':
+                self.blackKinglocation = (startRow, startCol)
 
             # enpassant move
-            if move.isEnpassantMove:
-                self.board[move.endRow][move.endCol] = "--"
-                self.board[move.startRow][move.endCol] = move.pieceCaptured
+            if code & ENPASSANT_FLAG:
+                self.board[endRow][endCol] = "--"
+                self.board[startRow][endCol] = pieceCaptured
 
             self.enpasantPossibleLog.pop()
             self.enpasantPossible = self.enpasantPossibleLog[-1]
@@ -149,28 +522,52 @@ class GameState():
             self.blackCastleQueenside = castleRights.bqs
 
             # undo castle
-            if move.castle:
-                if move.endCol - move.startCol == 2:  # KingSide
-                    self.board[move.endRow][move.endCol +
-                                            1] = self.board[move.endRow][move.endCol - 1]  # rook move
-                    self.board[move.endRow][move.endCol - 1] = "--"
+            if code & CASTLE_FLAG:
+                if endCol - startCol == 2:  # KingSide
+                    self.board[endRow][endCol + 1] = self.board[endRow][endCol - 1]  # rook move
+                    self.board[endRow][endCol - 1] = "--"
                 else:  # queenSide
-                    self.board[move.endRow][move.endCol -
-                                            2] = self.board[move.endRow][move.endCol + 1]  # rook move
-                    self.board[move.endRow][move.endCol + 1] = "--"
+                    self.board[endRow][endCol - 2] = self.board[endRow][endCol + 1]  # rook move
+                    self.board[endRow][endCol + 1] = "--"
+
+            # back to the previous key
+            self.positionCounts[self.zobristKey] -= 1
+            self.zobristLog.pop()
+            self.zobristKey = self.zobristLog[-1]
 
             self.checkmate = False
             self.stalemate = False
 
-    # move is valid if your king is in check and you move the piece which stops you from check
+    # legal captures only (en passant included, checkmate / stalemate are left alone), no quiet move is generated
+    # for searches that try the captures before the quiet moves
+    def getCaptureCodes(self, buffer=None):
+        return self.generateMoves(buffer, True)
+
+    # legal moves as Move objects, for the UI and other callers that don't need speed
     def getValidMoves(self):
+        return [Move.fromCode(code) for code in self.getValidMoveCodes()]
+
+    # move is valid if your king is in check and you move the piece which stops you from check
+    # fills buffer (an array('I') reused by the caller, or a new one) with the codes of the legal moves and returns it
+    def getValidMoveCodes(self, buffer=None):
+        return self.generateMoves(buffer, False)
+
+    # capturesOnly makes the piece generators skip every move to an empty square (see getCaptureCodes)
+    def generateMoves(self, buffer, capturesOnly):
         # 1) first generate all possible moves for the piece of player in check
         # 2) for each move, make a move for the player in check
         # 3) generate all opponent moves after you moved-your-piece(when you called makeMove) to prevent check
         # 4) for each of opponents moves, see if opponents still attack your king
         # 5) if they still attack your king, its not a valid move
-        moves = []
+        if buffer is None:
+            moves = array('I')
+        else:
+            moves = buffer
+            del moves[:]
+        self.capturesOnly = capturesOnly
         self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        # king moves and castling only look up this map instead of scanning the board again for every square
+        self.attackedSquares = self.getAttackedSquares()
         if self.whiteToMove:
             kingRow = self.whiteKinglocation[0]
             kingCol = self.whiteKinglocation[1]
@@ -180,43 +577,46 @@ class GameState():
         if self.inCheck:
             # only one check to the king, move the king or block the check with a piece
             if len(self.checks) == 1:
-                moves = self.getAllPossibleMoves()
+                self.getAllPossibleMoves(moves)
                 # (row, col) of the piece which is causing the check
                 check = self.checks[0]
                 checkRow = check[0]
                 checkCol = check[1]
                 # position of the piece which is causing the check
                 pieceChecking = self.board[checkRow][checkCol]
-                validSquares = []  # sqaures that pieces can move to
+                validSquares = set()  # sqaures (row * 8 + col) that pieces can move to
                 # if check is from knight than either move the king or take the knight
                 if pieceChecking[1] == 'N':
-                    validSquares = [(checkRow, checkCol)]
+                    validSquares.add(checkRow * 8 + checkCol)
                 else:
                     for i in range(1, 8):
                         # check[2], check[3] are the check directions
-                        validSq = (kingRow + check[2]
-                                   * i, kingCol + check[3] * i)
-                        validSquares.append(validSq)
+                        validSq = (kingRow + check[2] * i, kingCol + check[3] * i)
+                        validSquares.add(validSq[0] * 8 + validSq[1])
                         # upto the piece applying check
                         if validSq[0] == checkRow and validSq[1] == checkCol:
                             break
-                # remove the move that dosen't prevent from check
-                # going backward in all possible moves
-                for i in range(len(moves) - 1, -1, -1):
-                    # as the king is not moved it should block the check if not then remove the move from moves
-                    if moves[i].pieceMoved[1] != 'K':
-                        # if not in validSquares then it do not block check or capture the piece making check
-                        if not (moves[i].endRow, moves[i].endCol) in validSquares:
-                            moves.remove(moves[i])  # remove the moves
-                    '''
-                        till know we will be able to find check and can move piece to block check but we are doing nothing about the pin so it will allow us to moved the pin pieced 
-                        what if we move the king and is in the position of pinned we would still be able to move the pinned piece and let king be in check
-                    '''
+                # en passant takes a checking pawn without landing on its square (start row, end col)
+                pawnCheckSquare = checkRow * 8 + checkCol if pieceChecking[1] == 'p' else -1
+                # keep king moves and the moves that block the check or capture the piece making check
+                blocking = [code for code in moves
+                            if PIECES[(code >> MOVED_SHIFT) & 15][1] == 'K' or (code >> 6) & 63 in validSquares
+                            or (code & ENPASSANT_FLAG and (code & 56) | ((code >> 6) & 7) == pawnCheckSquare)]
+                del moves[:]
+                moves.extend(blocking)
+                '''
+                    till know we will be able to find check and can move piece to block check but we are doing nothing about the pin so it will allow us to moved the pin pieced 
+                    what if we move the king and is in the position of pinned we would still be able to move the pinned piece and let king be in check
+                '''
             else:  # if double check then king has to move
                 self.getKingMoves(kingRow, kingCol, moves)
         else:  # not in check all checks in moves are fine
-            moves = self.getAllPossibleMoves()
+            self.getAllPossibleMoves(moves)
+        self.capturesOnly = False
 
+        # no capture doesn't mean no move
+        if capturesOnly:
+            return moves
         if len(moves) == 0:
             if self.inCheck:
                 self.checkmate = True
@@ -230,56 +630,10 @@ class GameState():
 
         return moves
 
-    '''
-    # check if the current player is in check
-    def inCheck(self):
-        # after we moved a piece to prevent from check its still out turn to play,
-        # as we changed turn back to us before calling inCheck, to get the king's position to see if king is still under attack
-        if self.whiteToMove:
-            return self.squareUnderAttack(self.whiteKinglocation[0], self.whiteKinglocation[1])
-        else:
-            return self.squareUnderAttack(self.blackKinglocation[0], self.blackKinglocation[1])
-    '''
-
-    # check if enemy can attack your king after you make a move while you were in check
-    # row, col is the position of the king in attack
-    def squareUnderAttack(self, row, col, allyColor):
-        enemyColor = 'w' if allyColor == 'b' else 'b'
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1),
-                      (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            d = directions[j]
-            for i in range(1, 8):
-                endRow = row + d[0] * i
-                endCol = col + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor:  # no attack from that direction
-                        break
-                    elif endPiece[0] == enemyColor:
-                        type = endPiece[1]
-                        # Possibilities
-                        # 1) Rook in any orthogonal directions
-                        # 2) Bishop in any diagonal
-                        # 3) Queen in orthogonal or diagonal directions
-                        # 4) Pawn if onw square away in any diagonal
-                        # 5) King in any direction to 1 square (to prevent king move controlled by another king)
-                        '''
-                        For Rook we will check only if directions and up, down, left, right which is in range 0 <= j <=  3 in directions.
-                        Similarty for bishop, in directions we have added the bishop direction in directions (4 to 7).
-                        For pawn if one forward diagonal square in front of king has opponent's pawn
-                        '''
-                        if (0 <= j <= 3 and type == 'R') or (4 <= j <= 7 and type == 'B') or \
-                            (i == 1 and type == 'p' and ((enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
-                                (type == 'Q') or (i == 1 and type == 'K'):
-                            return True
-                        else:  # enemy piece not applying check
-                            break
-                else:  # off board
-                    break
-
-    def getAllPossibleMoves(self):
-        moves = []
+    # appends the move codes to moves (a list or array('I')), a new array when it's not given
+    def getAllPossibleMoves(self, moves=None):
+        if moves is None:
+            moves = array('I')
         for row in range(len(self.board)):
             # traverse every position to find validmove for each piece
             for col in range(len(self.board[0])):
@@ -329,24 +683,25 @@ class GameState():
                 startRow = 1
                 enemyColor = 'w'
                 kingRow, kingCol = self.blackKinglocation
+        # pushes and captures onto the last row promote, once to every piece
+        promotions = PROMOTIONS if row + moveAmount == self.promotionRows[self.board[row][col]] else NO_PROMOTION
 
-        if self.board[row + moveAmount][col] == "--":  # first square move
+        if self.board[row + moveAmount][col] == "--" and not self.capturesOnly:  # first square move
             # if piece is not pinned then its fine or if it is pinned but from forward direction then we can still move
             if not piecePinned or pinDirection == (moveAmount, 0):
-                moves.append(
-                    Move((row, col), (row+moveAmount, col), self.board))
+                for promotion in promotions:
+                    moves.append(encodeMove(row, col, row+moveAmount, col, self.board, promotion))
                 # Check if pawn can directly advance to second square
                 if row == startRow and self.board[row+2*moveAmount][col] == "--":
-                    moves.append(
-                        Move((row, col), (row+2*moveAmount, col), self.board))
+                    moves.append(encodeMove(row, col, row+2*moveAmount, col, self.board))
         # capture
         if col-1 >= 0:  # there is a col to the left for white
             # check if there is a black piece to the left of your pawn that you can capture
             # if piece is not pinned then its fine or if it is pinned but from left direction then we can capture left piece
             if not piecePinned or pinDirection == (moveAmount, -1):
                 if self.board[row+moveAmount][col-1][0] == enemyColor:
-                    moves.append(
-                        Move((row, col), (row+moveAmount, col-1), self.board))
+                    for promotion in promotions:
+                        moves.append(encodeMove(row, col, row+moveAmount, col-1, self.board, promotion))
                 if (row+moveAmount, col-1) == self.enpasantPossible:
                     attackingPiece = blockingPiece = False
                     if kingRow == row:
@@ -366,18 +721,19 @@ class GameState():
                             square = self.board[row][i]
                             if square[0] == enemyColor and (square[1] == "R" or square[1] == "Q"):
                                 attackingPiece = True
+                                break
                             elif square != "--":
                                 blockingPiece = True
+                                break
                     if not attackingPiece or blockingPiece:
-                        moves.append(Move((row, col), (row+moveAmount, col-1),
-                                          self.board, isEnpassantMove=True))
+                        moves.append(encodeMove(row, col, row+moveAmount, col-1, self.board, ENPASSANT_FLAG))
         if col+1 <= 7:  # there is a col to the right for white
             # check if there is a black piece to the right of your pawn that you can capture
             # if piece is not pinned then its fine or if it is pinned but from left direction then we can capture right piece
             if not piecePinned or pinDirection == (moveAmount, 1):
                 if self.board[row+moveAmount][col+1][0] == enemyColor:
-                    moves.append(
-                        Move((row, col), (row+moveAmount, col+1), self.board))
+                    for promotion in promotions:
+                        moves.append(encodeMove(row, col, row+moveAmount, col+1, self.board, promotion))
                 if (row+moveAmount, col+1) == self.enpasantPossible:
                     attackingPiece = blockingPiece = False
                     if kingRow == row:
@@ -397,11 +753,12 @@ class GameState():
                             square = self.board[row][i]
                             if square[0] == enemyColor and (square[1] == "R" or square[1] == "Q"):
                                 attackingPiece = True
+                                break
                             elif square != "--":
                                 blockingPiece = True
+                                break
                     if not attackingPiece or blockingPiece:
-                        moves.append(Move((row, col), (row+moveAmount, col+1),
-                                          self.board, isEnpassantMove=True))
+                        moves.append(encodeMove(row, col, row+moveAmount, col+1, self.board, ENPASSANT_FLAG))
 
     # Get all the Rook moves for the Rook located at row, col and add it to the moves
     def getRookMoves(self, row, col, moves):
@@ -430,6 +787,7 @@ class GameState():
         directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
         # enemy color is b if whiteToMove or vice versa
         enemy_color = 'b' if self.whiteToMove else 'w'
+        capturesOnly = self.capturesOnly
 
         for direction in directions:
             for i in range(1, 8):  # from one position rook can go upto max 7th square
@@ -442,15 +800,14 @@ class GameState():
                         # check if next square is empty
                         if self.board[endRow][endCol] == '--':
                             # if empty then add moves
-                            moves.append(
-                                Move((row, col), (endRow, endCol), self.board))
+                            if not capturesOnly:
+                                moves.append(encodeMove(row, col, endRow, endCol, self.board))
                         # check if piece on next square is opponent
                         elif self.board[endRow][endCol][0] == enemy_color:
                             # if piece is not pinned then its fine or if it is pinned but from forward direction then we can still move
                             if not piecePinned or pinDirection == direction:
                                 # then you can at it to the move as you can capture it
-                                moves.append(
-                                    Move((row, col), (endRow, endCol), self.board))
+                                moves.append(encodeMove(row, col, endRow, endCol, self.board))
                             break
                         else:  # if neither then break
                             break
@@ -471,6 +828,7 @@ class GameState():
         directions = [(1, 1), (-1, -1), (-1, 1), (1, -1)]  # diagonals
         # enemy color is b if whiteToMove or vice versa
         enemy_color = 'b' if self.whiteToMove else 'w'
+        capturesOnly = self.capturesOnly
 
         for direction in directions:
             for i in range(1, 8):  # from one position bishop can go upto max 7th square
@@ -481,13 +839,12 @@ class GameState():
                         # check if next square is empty
                         if self.board[endRow][endCol] == '--':
                             # if empty then add moves
-                            moves.append(
-                                Move((row, col), (endRow, endCol), self.board))
+                            if not capturesOnly:
+                                moves.append(encodeMove(row, col, endRow, endCol, self.board))
                         # check if piece on next square is opponent
                         elif self.board[endRow][endCol][0] == enemy_color:
                             # then you can at it to the move as you can capture it
-                            moves.append(
-                                Move((row, col), (endRow, endCol), self.board))
+                            moves.append(encodeMove(row, col, endRow, endCol, self.board))
                             break
                         else:  # if neither then break
                             break
@@ -514,68 +871,107 @@ class GameState():
 
             if 0 <= endRow <= 7 and 0 <= endCol <= 7:
                 if not piecePinned:
+                    # empty squares only when quiet moves are wanted
+                    if self.board[endRow][endCol] == '--' and self.capturesOnly:
+                        continue
                     # if white to move and destination either have no piece or have a black piece
                     if self.whiteToMove and (self.board[endRow][endCol] == '--' or self.board[endRow][endCol][0] == 'b'):
-                        moves.append(
-                            Move((row, col), (endRow, endCol), self.board))
+                        moves.append(encodeMove(row, col, endRow, endCol, self.board))
                     # if black to move and destination either have no piece or have a black piece
                     elif not self.whiteToMove and (self.board[endRow][endCol] == '--' or self.board[endRow][endCol][0] == 'w'):
-                        moves.append(
-                            Move((row, col), (endRow, endCol), self.board))
+                        moves.append(encodeMove(row, col, endRow, endCol, self.board))
 
     # Get all the Queen moves for the Queen located at row, col and add it to the moves
     def getQueenMoves(self, row, col, moves):
-        self.getBishopMoves(row, col, moves)
+        # rook moves first, they keep a queen's pin in self.pins for getBishopMoves to use (and remove)
         self.getRookMoves(row, col, moves)
+        self.getBishopMoves(row, col, moves)
 
     # Get all the King moves for the King located at row, col and add it to the moves
     def getKingMoves(self, row, col, moves):
+        allyColor = 'w' if self.whiteToMove else 'b'
+        attacked = self.attackedSquares
+        # with capturesOnly empty squares count as own pieces
+        blocked = (allyColor, '-') if self.capturesOnly else (allyColor,)
         # these for loops denote all possible moves for the king
         for i in range(-1, 2):
             for j in range(-1, 2):
-                allyColor = 'w' if self.whiteToMove else 'b'
                 if i == 0 and j == 0:  # same square
                     continue
                 if 0 <= row + i <= 7 and 0 <= col + j <= 7:
                     endPiece = self.board[row + i][col + j]
-                    if endPiece[0] != allyColor:  # the square is empty or has an enemy piece
-                        # temporarily move the king to check if it returns in check
-                        if allyColor == 'w':
-                            self.whiteKinglocation = (row + i, col + j)
-                        else:
-                            self.blackKinglocation = (row + i, col + j)
-
-                        inCheck, pins, checks = self.checkForPinsAndChecks()
-                        # if king's move doesn't return in check, append to moves
-                        if not inCheck:
-                            moves.append(
-                                Move((row, col), (row + i, col + j), self.board))
-                        # move the king back to its original location
-                        if allyColor == 'w':
-                            self.whiteKinglocation = (row, col)
-                        else:
-                            self.blackKinglocation = (row, col)
-
-        self.getcastleMoves(row, col, moves, allyColor)
+                    # the square is empty or has an enemy piece, and the king isn't walking into check
+                    if endPiece[0] not in blocked and not attacked[(row + i) * 8 + col + j]:
+                        moves.append(encodeMove(row, col, row + i, col + j, self.board))
+
+        if not self.capturesOnly:
+            self.getcastleMoves(row, col, moves, allyColor)
 
     def getcastleMoves(self, row, col, moves, allyColor):
-        inCheck = self.squareUnderAttack(row, col, allyColor)
-        if inCheck:
+        # can't castle out of check
+        if self.attackedSquares[row * 8 + col]:
             return
         if (self.whiteToMove and self.whiteCastleKingside) or (not self.whiteToMove and self.blackCastleKingside):
             self.getKingsidecastleMoves(row, col, moves, allyColor)
         if (self.whiteToMove and self.whiteCastleQueenside) or (not self.whiteToMove and self.blackCastleQueenside):
             self.getQueensidecastleMoves(row, col, moves, allyColor)
 
+    # the squares the king passes must be empty and not attacked
     def getKingsidecastleMoves(self, row, col, moves, allyColor):
-        if self.board[row][col+1] == "--" and self.board[row][col+2] == "--" and not self.squareUnderAttack(row, col + 1, allyColor) and not self.squareUnderAttack(row, col + 2, allyColor):
-            moves.append(Move((row, col), (row, col + 2),
-                         self.board, castle=True))
+        attacked = self.attackedSquares
+        if self.board[row][col+1] == "--" and self.board[row][col+2] == "--" and not attacked[row * 8 + col + 1] and not attacked[row * 8 + col + 2]:
+            moves.append(encodeMove(row, col, row, col + 2, self.board, CASTLE_FLAG))
 
     def getQueensidecastleMoves(self, row, col, moves, allyColor):
-        if self.board[row][col-1] == "--" and self.board[row][col-2] == "--" and self.board[row][col-3] == "--" and not self.squareUnderAttack(row, col - 1, allyColor) and not self.squareUnderAttack(row, col - 2, allyColor):
-            moves.append(Move((row, col), (row, col - 2),
-                         self.board, castle=True))
+        attacked = self.attackedSquares
+        if self.board[row][col-1] == "--" and self.board[row][col-2] == "--" and self.board[row][col-3] == "--" and not attacked[row * 8 + col - 1] and not attacked[row * 8 + col - 2]:
+            moves.append(encodeMove(row, col, row, col - 2, self.board, CASTLE_FLAG))
+
+    # every square (row * 8 + col) attacked by the side not to move, as 64 flags
+    # the king of the side to move is taken off the board, so a slider checking it also attacks the squares behind it
+    def getAttackedSquares(self):
+        attacked = bytearray(64)
+        board = self.board
+        enemyColor = 'b' if self.whiteToMove else 'w'
+        allyKing = 'wK' if self.whiteToMove else 'bK'
+        for row in range(8):
+            for col in range(8):
+                piece = board[row][col]
+                if piece[0] != enemyColor:
+                    continue
+                type = piece[1]
+                if type == 'p':
+                    # pawns attack diagonally towards the row they promote on
+                    endRow = row - 1 if self.promotionRows[piece] < row else row + 1
+                    if 0 <= endRow <= 7:
+                        if col > 0:
+                            attacked[endRow * 8 + col - 1] = 1
+                        if col < 7:
+                            attacked[endRow * 8 + col + 1] = 1
+                elif type == 'N':
+                    for sq in KNIGHT_TARGETS[row * 8 + col]:
+                        attacked[sq] = 1
+                elif type == 'K':
+                    for sq in KING_TARGETS[row * 8 + col]:
+                        attacked[sq] = 1
+                else:
+                    if type == 'R':
+                        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
+                    elif type == 'B':
+                        directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+                    else:
+                        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+                    for d in directions:
+                        endRow = row + d[0]
+                        endCol = col + d[1]
+                        while 0 <= endRow < 8 and 0 <= endCol < 8:
+                            attacked[endRow * 8 + endCol] = 1
+                            # the ray stops at the first piece, except our king
+                            if board[endRow][endCol] != '--' and board[endRow][endCol] != allyKing:
+                                break
+                            endRow += d[0]
+                            endCol += d[1]
+        return attacked
 
     def checkForPinsAndChecks(self):
         pins = []
@@ -621,9 +1017,10 @@ class GameState():
                         For Rook we will check only if directions and up, down, left, right which is in range 0 <= j <=  3 in directions.
                         Similarty for bishop, in directions we have added the bishop direction in directions (4 to 7).
                         For pawn if one forward diagonal square in front of king has opponent's pawn
+                        (in front of the pawn: towards the row it promotes on, which depends on the board orientation)
                         '''
                         if (0 <= j <= 3 and type == 'R') or (4 <= j <= 7 and type == 'B') or \
-                            (i == 1 and type == 'p' and ((enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
+                            (i == 1 and type == 'p' and 4 <= j <= 7 and (self.promotionRows[endPiece] < endRow) == (d[0] == 1)) or \
                                 (type == 'Q') or (i == 1 and type == 'K'):
                             '''
                             now check if king is pinned or in check
@@ -652,24 +1049,31 @@ class GameState():
                     checks.append((endRow, endCol, m[0], m[1]))
         return inCheck, pins, checks
 
-    def updateCastleRights(self, move):
+    def updateCastleRights(self, code):
+        pieceMoved = PIECES[(code >> MOVED_SHIFT) & 15]
 
-        if move.pieceMoved == 'wK':
+        if pieceMoved == 'wK':
             self.whiteCastleKingside = False
             self.whiteCastleQueenside = False
-        elif move.pieceMoved == 'bK':
+        elif pieceMoved == 'bK':
             self.blackCastleKingside = False
             self.blackCastleQueenside = False
 
-        # rook captured
-        if move.pieceCaptured == 'wR' and move.endRow == 7 and move.endCol == 0:
-            self.whiteCastleQueenside = False
-        if move.pieceCaptured == 'wR' and move.endRow == 7 and move.endCol == 7:
-            self.whiteCastleKingside = False
-        if move.pieceCaptured == 'bR' and move.endRow == 0 and move.endCol == 0:
-            self.blackCastleQueenside = False
-        if move.pieceCaptured == 'bR' and move.endRow == 0 and move.endCol == 7:
-            self.blackCastleKingside = False
+        # a move from a corner (the rook leaves) or to a corner (the rook is captured) ends castling on that side
+        whiteRow, blackRow = (0, 7) if self.playerWantsToPlayAsBlack else (7, 0)
+        for sq in (code & 63, (code >> 6) & 63):
+            row, col = sq >> 3, sq & 7
+            if col == 0 or col == 7:
+                if row == whiteRow:
+                    if col == 0:
+                        self.whiteCastleQueenside = False
+                    else:
+                        self.whiteCastleKingside = False
+                elif row == blackRow:
+                    if col == 0:
+                        self.blackCastleQueenside = False
+                    else:
+                        self.blackCastleKingside = False
 
     def getBoardString(self):
         # Convert the board state to a string
@@ -709,39 +1113,77 @@ class Move():
         "K": "K"
     }
 
-    # add an optional parameter to identify, the square for enpassant
-    def __init__(self, startSquare, endSquare, board, isEnpassantMove=False, castle=False):
-        self.startRow = startSquare[0]
-        self.startCol = startSquare[1]
-        self.endRow = endSquare[0]
-        self.endCol = endSquare[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.castle = castle
-        if isEnpassantMove == True:
-            self.pieceCaptured = board[self.startRow][self.endCol]
-        else:
-            self.pieceCaptured = board[self.endRow][self.endCol]
-        self.isCapture = self.pieceCaptured != '--'
-        self.moveID = self.startRow * 1000 + self.startCol * \
-            100 + self.endRow * 10 + self.endCol
-        # pawn promotion
-        gs = GameState()
-        if (gs.playerWantsToPlayAsBlack):
-            self.isPawnPromotion = (self.pieceMoved == "wp" and self.endRow == 7) or (
-                self.pieceMoved == "bp" and self.endRow == 0)
-        else:
-            self.isPawnPromotion = (self.pieceMoved == "wp" and self.endRow == 0) or (
-                self.pieceMoved == "bp" and self.endRow == 7)
-        '''
-        this is same as 
-
-        self.isPawnPromotion = False
-        if (self.pieceMoved == "wp" and self.endRow == 0) or (self.pieceMoved == "bp" and self.endRow == 7):
-            self.isPawnPromotion = True
+    # a Move is only a view over a move code (see encodeMove), every attribute is decoded when it's read
+    __slots__ = ('code',)
 
-        '''
-        # en passant
-        self.isEnpassantMove = isEnpassantMove
+    # add an optional parameter to identify, the square for enpassant
+    # promotionRows is the gs.promotionRows of the board the move is played on
+    def __init__(self, startSquare, endSquare, board, isEnpassantMove=False, castle=False, promotionRows=PROMOTION_ROWS):
+        flags = (ENPASSANT_FLAG if isEnpassantMove else 0) | (CASTLE_FLAG if castle else 0)
+        # pawn promotion (promotionRows only has entries for pawns, so other pieces get None)
+        if promotionRows.get(board[startSquare[0]][startSquare[1]]) == endSquare[0]:
+            flags |= PROMOTE_QUEEN
+        self.code = encodeMove(startSquare[0], startSquare[1], endSquare[0], endSquare[1], board, flags)
+
+    @classmethod
+    def fromCode(cls, code):
+        move = cls.__new__(cls)
+        move.code = code
+        return move
+
+    @property
+    def startRow(self):
+        return (self.code & 63) >> 3
+
+    @property
+    def startCol(self):
+        return self.code & 7
+
+    @property
+    def endRow(self):
+        return (self.code >> 9) & 7
+
+    @property
+    def endCol(self):
+        return (self.code >> 6) & 7
+
+    @property
+    def pieceMoved(self):
+        return PIECES[(self.code >> MOVED_SHIFT) & 15]
+
+    @property
+    def pieceCaptured(self):
+        return PIECES[(self.code >> CAPTURED_SHIFT) & 15]
+
+    @property
+    def isCapture(self):
+        return (self.code >> CAPTURED_SHIFT) & 15 != NO_PIECE
+
+    @property
+    def isEnpassantMove(self):
+        return bool(self.code & ENPASSANT_FLAG)
+
+    @property
+    def castle(self):
+        return bool(self.code & CASTLE_FLAG)
+
+    @property
+    def isPawnPromotion(self):
+        return bool((self.code >> PROMOTION_SHIFT) & 7)
+
+    # piece a pawn promotes to, every promotion piece has its own generated move
+    @property
+    def promotionChoice(self):
+        return PROMOTION_PIECES[(self.code >> PROMOTION_SHIFT) & 7] or 'Q'
+
+    @promotionChoice.setter
+    def promotionChoice(self, piece):
+        if self.isPawnPromotion:
+            self.code = (self.code & ~(7 << PROMOTION_SHIFT)) | (PROMOTION_PIECES.index(piece) << PROMOTION_SHIFT)
+
+    @property
+    def moveID(self):
+        return self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
 
     # overriding the equals method (tell python if two moves are equal)
     # no two pieces should be on the same square
@@ -772,15 +1214,15 @@ class Move():
         startSquare = self.getRankFile(self.startRow, self.startCol)
         endSquare = self.getRankFile(self.endRow, self.endCol)
 
-        # pawn moves
+        # pawn moves (with the promotion piece)
         if self.pieceMoved[1] == 'p':
+            promotion = "=" + self.promotionChoice if self.isPawnPromotion else ""
             if self.isCapture:
-                return startSquare + "x" + endSquare
+                return startSquare + "x" + endSquare + promotion
             else:
-                return startSquare+endSquare
+                return startSquare+endSquare + promotion
 
-        # pawn promotion (add later)
-        # add + for check # for checkmate
+        # only the move itself, pgn.san gives the SAN of a move in its position (disambiguation, + and #)
 
         # piece moves
         moveString = self.pieceMoved[1]
@@ -0,0 +1,108 @@
+# Static evaluation: material plus piece-square tables (pst.py), tapered between middlegame and endgame by the material left
+# evaluate(gs) scores one GameState (either backend) for the side to move from the score makeMove / undoMove keep up to date,
+# and can be passed to search.Searcher
+# evaluateBatch scores many positions at once from an int8 (N, 64) array of piece indices (encodeBoards), with numpy
+# usage: python evaluation.py FILE [--batch N] [--print]   (FILE has one FEN per line, - for stdin)
+
+import argparse
+import sys
+import time
+from engine import PIECE_INDEX, MG_TABLES, EG_TABLES, PHASES, parseFen, readFenFile
+from pst import PHASE_TOTAL
+
+
+# score of the position for the side to move
+def evaluate(gs):
+    return gs.score if gs.whiteToMove else -gs.score
+
+
+# 64 piece indices (NO_PIECE for empty squares) of a board, always with white at the bottom (flipped boards are turned)
+def encodeBoard(board, flipped=False):
+    rows = reversed(board) if flipped else board
+    return bytes(PIECE_INDEX[piece] for row in rows for piece in row)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("batched evaluation needs numpy (pip install -r requirements.txt)") from None
+    return numpy
+
+
+# int8 array of shape (N, 64) with the piece indices of every board
+def encodeBoards(boards, flipped=False):
+    np = _numpy()
+    data = b"".join(encodeBoard(board, flipped) for board in boards)
+    return np.frombuffer(data, dtype=np.int8).reshape(-1, 64)
+
+
+# numpy versions of the tables, built on the first batch
+_batchTables = None
+
+
+def _getBatchTables():
+    global _batchTables
+    if _batchTables is None:
+        np = _numpy()
+        _batchTables = (np.array(MG_TABLES, dtype=np.int32), np.array(EG_TABLES, dtype=np.int32),
+                        np.array(PHASES, dtype=np.int32), np.arange(64))
+    return _batchTables
+
+
+# scores of an (N, 64) array of piece indices (encodeBoards), same values as evaluate
+# positive for white, or for the side to move when whiteToMove (N booleans) is given
+def evaluateBatch(boards, whiteToMove=None):
+    np = _numpy()
+    mgTables, egTables, phases, squares = _getBatchTables()
+    indices = np.asarray(boards, dtype=np.int8).astype(np.intp)
+    # (N, 64) lookups of table[piece of the square][square], summed per board
+    mg = mgTables[indices, squares].sum(axis=1)
+    eg = egTables[indices, squares].sum(axis=1)
+    phase = np.minimum(phases[indices].sum(axis=1), PHASE_TOTAL)
+    score = (mg * phase + eg * (PHASE_TOTAL - phase)) // PHASE_TOTAL
+    if whiteToMove is not None:
+        score = np.where(np.asarray(whiteToMove, dtype=bool), score, -score)
+    return score
+
+
+# scores of positions for the side to move, evaluated batchSize positions at a time
+# positions are FEN strings or parsed ones, as engine.readFenFile yields them
+def evaluateFens(fens, batchSize=4096):
+    np = _numpy()
+    boards = []
+    sides = []
+    for fen in fens:
+        board, whiteToMove = (parseFen(fen) if isinstance(fen, str) else fen)[:2]
+        boards.append(board)
+        sides.append(whiteToMove)
+        if len(boards) == batchSize:
+            yield from evaluateBatch(encodeBoards(boards), np.array(sides)).tolist()
+            boards = []
+            sides = []
+    if boards:
+        yield from evaluateBatch(encodeBoards(boards), np.array(sides)).tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="evaluate every position of a FEN file")
+    parser.add_argument("file", help="one FEN per line, - for stdin")
+    parser.add_argument("--batch", type=int, default=4096, help="positions evaluated together")
+    parser.add_argument("--print", action="store_true", help="print the score of every position")
+    args = parser.parse_args()
+
+    fens = (line.strip() for line in sys.stdin if line.strip()) if args.file == "-" else readFenFile(args.file)
+    positions = 0
+    start = time.perf_counter()
+    for score in evaluateFens(fens, args.batch):
+        positions += 1
+        if args.print:
+            print(score)
+    elapsed = time.perf_counter() - start
+    print(f"positions {positions}  time {elapsed:.3f}s  positions/s {positions / max(elapsed, 1e-9):.0f}",
+          file=sys.stderr if args.print else sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,83 @@
+# Games between two move sources through controller.GameController, without pygame, a window or any rendering
+# for self-play, regression runs and throughput benchmarks on machines with no display
+# usage: python headless.py [--white random|search] [--black random|search] [--games N] [--backend mailbox|bitboard]
+#                           [--nodes N] [--time SECONDS] [--depth N] [--max-plies N] [--seed N]
+
+import argparse
+import random
+import time
+from engine import GameState
+from controller import GameController
+from search import findBestMove
+
+SOURCES = ("random", "search")
+
+
+# a move source is called with the GameState and its legal moves (Move objects) and returns one of them
+def randomMoves(seed=None):
+    rng = random.Random(seed)
+
+    def source(gs, validMoves):
+        return rng.choice(validMoves)
+    return source
+
+
+def searchMoves(timeLimit=None, nodeLimit=None, maxDepth=64, tt=None):
+    def source(gs, validMoves):
+        return findBestMove(gs, timeLimit, nodeLimit, maxDepth, tt=tt).bestMove
+    return source
+
+
+# plays one game as fast as the move sources allow, returns the controller of the finished game
+# (result, end_text and gs.moveLog), result stays "*" when maxPlies ran out first
+def playGame(white, black, backend=GameState, maxPlies=400):
+    controller = GameController(backend)
+    controller.update()
+    while not controller.game_over and len(controller.gs.moveLog) < maxPlies:
+        gs = controller.gs
+        source = white if gs.whiteToMove else black
+        controller.make_move(source(gs, controller.valid_moves))
+        controller.update()
+    return controller
+
+
+def main():
+    from backends import BACKENDS
+
+    parser = argparse.ArgumentParser(description="play games between two move sources without a display")
+    parser.add_argument("--white", choices=SOURCES, default="search")
+    parser.add_argument("--black", choices=SOURCES, default="random")
+    parser.add_argument("--games", type=int, default=10)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="mailbox")
+    parser.add_argument("--nodes", type=int, default=None, help="node budget of every search move")
+    parser.add_argument("--time", type=float, default=None, help="time budget in seconds of every search move")
+    parser.add_argument("--depth", type=int, default=64)
+    parser.add_argument("--max-plies", type=int, default=400, help="games still running after this many plies stay unfinished")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    if args.nodes is None and args.time is None and args.depth == 64:
+        args.nodes = 2000
+
+    def makeSource(name, seed):
+        if name == "random":
+            return randomMoves(seed)
+        return searchMoves(args.time, args.nodes, args.depth)
+
+    white = makeSource(args.white, args.seed)
+    black = makeSource(args.black, None if args.seed is None else args.seed + 1)
+    scores = {"1-0": 0, "0-1": 0, "1/2-1/2": 0, "*": 0}
+    plies = 0
+    start = time.perf_counter()
+    for game in range(1, args.games + 1):
+        controller = playGame(white, black, BACKENDS[args.backend], args.max_plies)
+        scores[controller.result] += 1
+        plies += len(controller.gs.moveLog)
+        print(f"game {game}  {controller.result}  {controller.end_text or 'move limit'}  plies {len(controller.gs.moveLog)}")
+    elapsed = time.perf_counter() - start
+    print(f"white {scores['1-0']}  black {scores['0-1']}  draws {scores['1/2-1/2']}  unfinished {scores['*']}  "
+          f"plies {plies}  time {elapsed:.3f}s  plies/s {plies / max(elapsed, 1e-9):.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,7 +5,13 @@ import pygame as p
 import time
 import json
 import os
+from collections import OrderedDict
 from engine import GameState, Move
+from bitboard import BitboardGameState
+from worker import MoveWorker
+from controller import GameController
+from pgn import appendGame
+from archive import formatClock, appendArchive
 
 
 # Configurações do jogo
@@ -25,7 +31,8 @@ class GameConfig:
             "rotation_speed": 2.0,
             "resolution_preset": "800x600",  # Available presets
             "window_width": 800,
-            "window_height": 600
+            "window_height": 600,
+            "engine_backend": "mailbox"  # "mailbox" (engine.GameState) or "bitboard" (bitboard.BitboardGameState)
         }
         
         self.resolution_presets = {
@@ -91,61 +98,40 @@ SQ_SIZE = BOARD_HEIGHT // DIMENSION
 MAX_FPS = config.get("max_fps")
 IMAGES = {}
 
-class GameTimer:
-    def __init__(self, minutes_per_player, mode="countdown"):
-        self.mode = mode
-        if mode == "countdown":
-            self.white_time = minutes_per_player * 60
-            self.black_time = minutes_per_player * 60
-        else:
-            self.white_time = 0
-            self.black_time = 0
-        self.current_turn_start = None
-        self.active = False
-        
-    def start_turn(self, is_white_turn):
-        if self.current_turn_start is not None:
-            elapsed = time.time() - self.current_turn_start
-            if self.mode == "countdown":
-                if is_white_turn:
-                    self.black_time = max(0, self.black_time - elapsed)
-                else:
-                    self.white_time = max(0, self.white_time - elapsed)
-            else:
-                if is_white_turn:
-                    self.black_time += elapsed
-                else:
-                    self.white_time += elapsed
-        
-        self.current_turn_start = time.time()
-        self.active = True
-    
-    def get_current_times(self, is_white_turn):
-        if not self.active or self.current_turn_start is None:
-            return self.white_time, self.black_time
-            
-        elapsed = time.time() - self.current_turn_start
-        
-        if self.mode == "countdown":
-            if is_white_turn:
-                current_white = max(0, self.white_time - elapsed)
-                return current_white, self.black_time
-            else:
-                current_black = max(0, self.black_time - elapsed)
-                return self.white_time, current_black
-        else:  # stopwatch mode
-            if is_white_turn:
-                current_white = self.white_time + elapsed
-                return current_white, self.black_time
-            else:
-                current_black = self.black_time + elapsed
-                return self.white_time, current_black
-    
-    def is_time_up(self, is_white_turn):
-        if self.mode == "stopwatch":
-            return False
-        white_time, black_time = self.get_current_times(is_white_turn)
-        return white_time <= 0 or black_time <= 0
+# Fontes abertas uma vez por (nome, tamanho, negrito, itálico), SysFont procura e carrega o arquivo a cada chamada
+FONTS = {}
+# Textos já renderizados por (texto, fonte, cor, antialias), o menos usado sai quando passa de TEXT_CACHE_SIZE
+TEXT_CACHE = OrderedDict()
+TEXT_CACHE_SIZE = 512
+
+def get_font(name, size, bold=False, italic=False):
+    key = (name, size, bool(bold), bool(italic))
+    font = FONTS.get(key)
+    if font is None:
+        font = p.font.SysFont(name, size, bold, italic)
+        FONTS[key] = font
+    return font
+
+def render_text(font, text, color, antialias=True):
+    key = (text, font, tuple(color), bool(antialias))
+    surface = TEXT_CACHE.get(key)
+    if surface is None:
+        surface = font.render(text, antialias, color)
+        TEXT_CACHE[key] = surface
+        if len(TEXT_CACHE) > TEXT_CACHE_SIZE:
+            TEXT_CACHE.popitem(last=False)
+    else:
+        TEXT_CACHE.move_to_end(key)
+    return surface
+
+# chamado quando o preset de resolução muda
+def clear_text_cache():
+    TEXT_CACHE.clear()
+
+def createGameState():
+    if config.get("engine_backend") == "bitboard":
+        return BitboardGameState()
+    return GameState()
 
 LIGHT_SQUARE_COLOR = (237, 238, 209)
 DARK_SQUARE_COLOR = (119, 153, 82)
@@ -162,12 +148,49 @@ TIMER_BG_COLOR = (35, 42, 55)
 TIMER_BORDER_COLOR = (80, 90, 110)
 
 
+PIECE_NAMES = ['bR', 'bN', 'bB', 'bQ', 'bK', 'bp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'wp']
+CAPTURED_PIECE_SIZE = 35  # Tamanho menor para peças capturadas
+PROMOTION_PIECE_SIZE = 70  # Peças dos botões do popup de promoção
+# Atlas já escalados ficam salvos em disco, um PNG por tamanho
+SPRITE_CACHE_DIR = "sprite_cache"
+# tamanho -> {peça: sprite}, cada atlas é uma única superfície com as 12 peças lado a lado
+ATLASES = {}
+
+def load_atlas(size):
+    sprites = ATLASES.get(size)
+    if sprites is not None:
+        return sprites
+    sources = ["images1/" + piece + ".png" for piece in PIECE_NAMES]
+    cache_path = os.path.join(SPRITE_CACHE_DIR, f"pieces_{size}.png")
+    atlas = None
+    # O cache só vale se for mais novo que todas as imagens originais
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= max(os.path.getmtime(source) for source in sources):
+        try:
+            atlas = p.image.load(cache_path).convert_alpha()
+        except p.error:
+            atlas = None
+    if atlas is None:
+        atlas = p.Surface((size * len(PIECE_NAMES), size), p.SRCALPHA)
+        for i, source in enumerate(sources):
+            scaled = p.transform.smoothscale(p.image.load(source).convert_alpha(), (size, size))
+            # RGBA_MAX sobre a superfície transparente copia os pixels sem misturar as bordas com preto
+            atlas.blit(scaled, (i * size, 0), special_flags=p.BLEND_RGBA_MAX)
+        try:
+            os.makedirs(SPRITE_CACHE_DIR, exist_ok=True)
+            p.image.save(atlas, cache_path)
+        except (OSError, p.error):
+            pass
+        atlas = atlas.convert_alpha()
+    sprites = {piece: atlas.subsurface((i * size, 0, size, size)) for i, piece in enumerate(PIECE_NAMES)}
+    ATLASES[size] = sprites
+    return sprites
+
 def loadImages():
-    pieces = ['bR', 'bN', 'bB', 'bQ', 'bK', 'bp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'wp']
-    for piece in pieces:
-        image_path = "images1/" + piece + ".png"
-        original_image = p.image.load(image_path)
-        IMAGES[piece] = p.transform.smoothscale(original_image, (SQ_SIZE, SQ_SIZE))
+    IMAGES.clear()
+    IMAGES.update(load_atlas(SQ_SIZE))
+    # Miniaturas das capturadas e do popup de promoção prontas antes da primeira jogada
+    load_atlas(CAPTURED_PIECE_SIZE)
+    load_atlas(PROMOTION_PIECE_SIZE)
 
 def loadLogo():
     try:
@@ -191,18 +214,18 @@ def draw_button(screen, rect, text, font, is_hovered=False):
     
     text_color = MENU_ACCENT_COLOR if is_hovered else MENU_TEXT_COLOR
     
-    shadow_text = font.render(text, True, (10, 15, 25))
+    shadow_text = render_text(font, text, (10, 15, 25), True)
     shadow_rect = shadow_text.get_rect(center=(rect.centerx + 1, rect.centery + 1))
     screen.blit(shadow_text, shadow_rect)
     
-    text_surface = font.render(text, True, text_color)
+    text_surface = render_text(font, text, text_color, True)
     text_rect = text_surface.get_rect(center=rect.center)
     screen.blit(text_surface, text_rect)
 
 def show_main_menu(screen):
-    font_title = p.font.SysFont("Arial", 54, True)
-    font_subtitle = p.font.SysFont("Arial", 28)
-    font_button = p.font.SysFont("Arial", 20, True)
+    font_title = get_font("Arial", 54, True)
+    font_subtitle = get_font("Arial", 28)
+    font_button = get_font("Arial", 20, True)
     
     # Carregar logo
     logo = loadLogo()
@@ -253,17 +276,17 @@ def show_main_menu(screen):
             screen.blit(logo_scaled, logo_rect)
         
         # Título estilizado
-        title = font_title.render("CODDUO", True, MENU_ACCENT_COLOR)
+        title = render_text(font_title, "CODDUO", MENU_ACCENT_COLOR, True)
         title_rect = title.get_rect(center=(WINDOW_WIDTH//2, title_y))
         
         # Sombra do título
-        title_shadow = font_title.render("CODDUO", True, (10, 15, 25))
+        title_shadow = render_text(font_title, "CODDUO", (10, 15, 25), True)
         shadow_rect = title_shadow.get_rect(center=(WINDOW_WIDTH//2 + 2, title_y + 2))
         screen.blit(title_shadow, shadow_rect)
         screen.blit(title, title_rect)
         
         # Subtítulo
-        subtitle = font_subtitle.render("XADREZ", True, MENU_TEXT_COLOR)
+        subtitle = render_text(font_subtitle, "XADREZ", MENU_TEXT_COLOR, True)
         subtitle_rect = subtitle.get_rect(center=(WINDOW_WIDTH//2, title_y + 50))
         screen.blit(subtitle, subtitle_rect)
         
@@ -279,17 +302,17 @@ def show_main_menu(screen):
         draw_button(screen, quit_button, "SAIR", font_button, quit_button.collidepoint(mouse_pos))
         
         # Versão no canto
-        version_font = p.font.SysFont("Arial", 16)
-        version_text = version_font.render("v2.0", True, (100, 110, 130))
+        version_font = get_font("Arial", 16)
+        version_text = render_text(version_font, "v2.0", (100, 110, 130), True)
         screen.blit(version_text, (WINDOW_WIDTH - 50, WINDOW_HEIGHT - 30))
         
         p.display.flip()
         clock.tick(60)
 
 def show_config_menu(screen):
-    font_title = p.font.SysFont("Arial", 32, True)
-    font_text = p.font.SysFont("Arial", 18)
-    font_button = p.font.SysFont("Arial", 16)
+    font_title = get_font("Arial", 32, True)
+    font_text = get_font("Arial", 18)
+    font_button = get_font("Arial", 16)
     
     button_width, button_height = 150, 35
     center_x = WINDOW_WIDTH // 2
@@ -324,6 +347,7 @@ def show_config_menu(screen):
                     current_preset = config.get("resolution_preset")
                     next_preset = config.get_next_preset(current_preset)
                     config.apply_resolution_preset(next_preset)
+                    clear_text_cache()
                 elif timer_minus.collidepoint(mouse_pos):
                     current_timer = config.get("timer_minutes")
                     if current_timer > 1:
@@ -353,11 +377,11 @@ def show_config_menu(screen):
             p.draw.rect(screen, gradient_color, (0, i * 4, WINDOW_WIDTH, 4))
         
         # Título estilizado
-        title = font_title.render("CONFIGURAÇÕES", True, MENU_ACCENT_COLOR)
+        title = render_text(font_title, "CONFIGURAÇÕES", MENU_ACCENT_COLOR, True)
         title_rect = title.get_rect(center=(WINDOW_WIDTH//2, 80))
         
         # Sombra do título
-        title_shadow = font_title.render("CONFIGURAÇÕES", True, (10, 15, 25))
+        title_shadow = render_text(font_title, "CONFIGURAÇÕES", (10, 15, 25), True)
         shadow_rect = title_shadow.get_rect(center=(WINDOW_WIDTH//2 + 2, 82))
         screen.blit(title_shadow, shadow_rect)
         screen.blit(title, title_rect)
@@ -372,7 +396,7 @@ def show_config_menu(screen):
         draw_button(screen, resolution_toggle, resolution_text, font_button, resolution_toggle.collidepoint(mouse_pos))
         
         # Timer
-        timer_text = font_text.render(f"Tempo por Jogador: {config.get('timer_minutes')} min", True, MENU_TEXT_COLOR)
+        timer_text = render_text(font_text, f"Tempo por Jogador: {config.get('timer_minutes')} min", MENU_TEXT_COLOR, True)
         screen.blit(timer_text, (center_x - 120, 205))
         draw_button(screen, timer_minus, "-", font_button, timer_minus.collidepoint(mouse_pos))
         draw_button(screen, timer_plus, "+", font_button, timer_plus.collidepoint(mouse_pos))
@@ -409,8 +433,8 @@ def pawnPromotionPopup(screen, gs):
     overlay.set_alpha(150)
     overlay.fill((0, 0, 0))
     
-    font_title = p.font.SysFont("Arial", 28, True)
-    font_label = p.font.SysFont("Arial", 16)
+    font_title = get_font("Arial", 28, True)
+    font_label = get_font("Arial", 16)
     
     # Create centered popup
     popup_width, popup_height = 500, 250
@@ -430,8 +454,8 @@ def pawnPromotionPopup(screen, gs):
         for i in range(4)
     ]
     
-    # Determine piece color based on whose turn it was BEFORE the move
-    piece_color = 'w' if not gs.whiteToMove else 'b'  # Opposite of current turn
+    # The popup is shown before the move is made, so it is still the promoting player's turn
+    piece_color = 'w' if gs.whiteToMove else 'b'
     
     button_pieces = [f"{piece_color}Q", f"{piece_color}R", f"{piece_color}B", f"{piece_color}N"]
     piece_names = ["Rainha", "Torre", "Bispo", "Cavalo"]
@@ -459,12 +483,12 @@ def pawnPromotionPopup(screen, gs):
         p.draw.rect(screen, MENU_ACCENT_COLOR, popup_rect, 3, border_radius=15)
         
         # Title
-        title_text = font_title.render("Promoção do Peão", True, MENU_ACCENT_COLOR)
+        title_text = render_text(font_title, "Promoção do Peão", MENU_ACCENT_COLOR, True)
         title_rect = title_text.get_rect(center=(popup_x + popup_width//2, popup_y + 40))
         screen.blit(title_text, title_rect)
         
         # Subtitle
-        subtitle = font_label.render("Escolha a peça para promoção:", True, MENU_TEXT_COLOR)
+        subtitle = render_text(font_label, "Escolha a peça para promoção:", MENU_TEXT_COLOR, True)
         subtitle_rect = subtitle.get_rect(center=(popup_x + popup_width//2, popup_y + 70))
         screen.blit(subtitle, subtitle_rect)
 
@@ -485,12 +509,12 @@ def pawnPromotionPopup(screen, gs):
             
             # Draw piece image
             if piece in IMAGES:
-                piece_img = p.transform.scale(IMAGES[piece], (button_size - 10, button_size - 10))
+                piece_img = load_atlas(button_size - 10)[piece]
                 img_rect = piece_img.get_rect(center=button.center)
                 screen.blit(piece_img, img_rect)
             
             # Label below button
-            label = font_label.render(name, True, MENU_TEXT_COLOR)
+            label = render_text(font_label, name, MENU_TEXT_COLOR, True)
             label_rect = label.get_rect(center=(button.centerx, button.bottom + 15))
             screen.blit(label, label_rect)
 
@@ -505,9 +529,9 @@ def showConfirmationDialog(screen, title, message):
     overlay.set_alpha(150)
     overlay.fill((0, 0, 0))
     
-    font_title = p.font.SysFont("Arial", 24, True)
-    font_message = p.font.SysFont("Arial", 18)
-    font_button = p.font.SysFont("Arial", 16, True)
+    font_title = get_font("Arial", 24, True)
+    font_message = get_font("Arial", 18)
+    font_button = get_font("Arial", 16, True)
     
     # Create centered popup
     popup_width, popup_height = 400, 200
@@ -551,17 +575,17 @@ def showConfirmationDialog(screen, title, message):
         p.draw.rect(screen, MENU_ACCENT_COLOR, popup_rect, 3, border_radius=15)
         
         # Title
-        title_text = font_title.render(title, True, MENU_ACCENT_COLOR)
+        title_text = render_text(font_title, title, MENU_ACCENT_COLOR, True)
         title_rect = title_text.get_rect(center=(popup_x + popup_width//2, popup_y + 40))
         screen.blit(title_text, title_rect)
         
         # Message
-        message_text = font_message.render(message, True, MENU_TEXT_COLOR)
+        message_text = render_text(font_message, message, MENU_TEXT_COLOR, True)
         message_rect = message_text.get_rect(center=(popup_x + popup_width//2, popup_y + 80))
         screen.blit(message_text, message_rect)
         
         # Instructions
-        instructions = font_message.render("Pressione R para Sim, ESC para Não", True, (180, 180, 180))
+        instructions = render_text(font_message, "Pressione R para Sim, ESC para Não", (180, 180, 180), True)
         inst_rect = instructions.get_rect(center=(popup_x + popup_width//2, popup_y + 110))
         screen.blit(instructions, inst_rect)
         
@@ -579,7 +603,7 @@ def showConfirmationDialog(screen, title, message):
         yes_border = MENU_ACCENT_COLOR if yes_hovered else TIMER_BORDER_COLOR
         p.draw.rect(screen, yes_border, yes_button, 2, border_radius=8)
         
-        yes_text = font_button.render("SIM", True, MENU_TEXT_COLOR)
+        yes_text = render_text(font_button, "SIM", MENU_TEXT_COLOR, True)
         yes_text_rect = yes_text.get_rect(center=yes_button.center)
         screen.blit(yes_text, yes_text_rect)
         
@@ -594,7 +618,7 @@ def showConfirmationDialog(screen, title, message):
         no_border = MENU_ACCENT_COLOR if no_hovered else TIMER_BORDER_COLOR
         p.draw.rect(screen, no_border, no_button, 2, border_radius=8)
         
-        no_text = font_button.render("NÃO", True, MENU_TEXT_COLOR)
+        no_text = render_text(font_button, "NÃO", MENU_TEXT_COLOR, True)
         no_text_rect = no_text.get_rect(center=no_button.center)
         screen.blit(no_text, no_text_rect)
         
@@ -603,6 +627,72 @@ def showConfirmationDialog(screen, title, message):
 
 
 
+# Segundos até a próxima mudança na tela que não vem do usuário: o próximo dígito do timer ou
+# a próxima etapa da animação de rotação (metade e fim). None quando nada muda sozinho
+def next_redraw_timeout(timer, is_white_turn, rotation_start_time=None, rotation_duration=0):
+    now = time.time()
+    timeouts = []
+    if rotation_start_time is not None:
+        middle = rotation_start_time + rotation_duration / 2
+        if middle > now:
+            timeouts.append(middle - now)
+        timeouts.append(max(0, rotation_start_time + rotation_duration - now))
+    if timer is not None and timer.active:
+        # o timer mostra segundos inteiros, então só muda ao cruzar um inteiro
+        white_time, black_time = timer.get_current_times(is_white_turn)
+        current = white_time if is_white_turn else black_time
+        fraction = current - int(current)
+        if timer.mode == "countdown":
+            if current > 0:
+                timeouts.append(fraction if fraction > 0 else 1.0)
+        else:
+            timeouts.append(1.0 - fraction)
+    return min(timeouts) if timeouts else None
+
+# Bloqueia até chegar um evento ou passar timeout segundos (None espera o próximo evento) e devolve os eventos da fila
+def wait_for_events(timeout):
+    if timeout is None:
+        first = p.event.wait()
+    else:
+        # arredonda para cima para não acordar antes da mudança e girar em espera curta
+        first = p.event.wait(int(timeout * 1000) + 1)
+    events = [] if first.type == p.NOEVENT else [first]
+    events.extend(p.event.get())
+    return events
+
+# Acrescenta a partida terminada ao PGN da pasta de logs e ao arquivo binário (archive.py) da pasta de saves
+# (codduo_integration.log_games e backup_saves, paths.logs e paths.saves)
+def log_game(controller):
+    integration = config.get("codduo_integration") or {}
+    if not integration.get("log_games"):
+        return
+    paths = config.get("paths") or {}
+    logs_dir = paths.get("logs", "logs")
+    saves_dir = paths.get("saves", "saves")
+    tags = {
+        "Event": "Codduo - Xadrez",
+        "Site": "Codduo",
+        "Termination": "time forfeit" if controller.end_text and "by time" in controller.end_text else "normal",
+    }
+    if controller.timer is not None:
+        if controller.timer_mode == "countdown":
+            tags["TimeControl"] = str(int(controller.timer_minutes * 60))
+        # tempos no fim da partida, archive.convertPgn os guarda nos campos de relógio do arquivo binário
+        white_time, black_time = controller.timer.get_current_times(controller.gs.whiteToMove)
+        tags["WhiteClock"] = formatClock(white_time)
+        tags["BlackClock"] = formatClock(black_time)
+        tags["TimerMode"] = controller.timer_mode
+    try:
+        appendGame(os.path.join(logs_dir, "games.pgn"), controller.gs, controller.result, tags)
+    except OSError as e:
+        print(f"Erro ao salvar partida: {e}")
+    # os relógios vão da própria partida (controller.timer) para os campos do arquivo binário
+    try:
+        appendArchive(os.path.join(saves_dir, "games.cdga"), controller.gs, controller.result, tags, controller.timer,
+                      integration.get("backup_saves", False))
+    except (OSError, ValueError) as e:
+        print(f"Erro ao salvar partida no arquivo: {e}")
+
 def game_loop(screen, clock):
     # Recarregar configurações atualizadas
     global BOARD_WIDTH, BOARD_HEIGHT, SQ_SIZE, IMAGES, WINDOW_WIDTH, WINDOW_HEIGHT
@@ -634,47 +724,32 @@ def game_loop(screen, clock):
         screen = p.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT), p.RESIZABLE)
     p.display.set_caption(f"Codduo - Xadrez [{config.get('resolution_preset')}]")
     
-    # Creating gamestate object calling our constructor
-    gs = GameState()
-    if (gs.playerWantsToPlayAsBlack):
-        gs.board = gs.board1
-    
-    # Timer do jogo
-    timer_mode = config.get("timer_mode")
-    game_timer = GameTimer(config.get("timer_minutes"), timer_mode)
-    if config.get("show_timer"):
-        game_timer.start_turn(gs.whiteToMove)
-    
-    # if a user makes a move we can ckeck if its in the list of valid moves
-    validMoves = gs.getValidMoves()
-    moveMade = False  # if user makes a valid moves and the gamestate changes then we should generate new set of valid move
-    animate = False  # flag var for when we should animate a move
+    # Fluxo da partida (lances, capturas, timer, fim de jogo e rotação) fica no controlador, aqui só entrada e desenho
+    controller = GameController(createGameState, config.get("show_timer"), config.get("timer_minutes"),
+                                config.get("timer_mode"), config.get("auto_rotate"), config.get("rotation_animation"),
+                                config.get("rotation_speed"))
+    # lances das próximas posições calculados numa thread enquanto a animação roda
+    move_worker = MoveWorker(type(controller.gs), playerWantsToPlayAsBlack=controller.gs.playerWantsToPlayAsBlack)
+    controller.move_worker = move_worker
     running = True
     squareSelected = ()  # keep tracks of last click
     # clicking to own piece and location where to move[(6,6),(4,4)]
     playerClicks = []
-    gameOver = False  # gameover if checkmate or stalemate
-    moveUndone = False
-    pieceCaptured = False
-    positionHistory = ""
-    previousPos = ""
-    countMovesForDraw = 0
-    COUNT_DRAW = 0
-    board_rotated = False  # Track if board is currently rotated
-    rotation_animation_active = False
-    rotation_start_time = 0
-    target_rotation = False
-    
-    # Listas para peças capturadas
-    white_captured = []  # Peças brancas capturadas pelo preto
-    black_captured = []  # Peças pretas capturadas pelo branco
+    # só redesenha o que mudou entre frames
+    renderer = BoardRenderer()
+    # performance_mode: redesenha só quando chega entrada ou o timer/rotação mudam, senão FPS fixo
+    event_driven = (config.get("advanced") or {}).get("performance_mode", False)
+    # a partida é gravada uma vez quando termina (de novo se for desfeita e terminar outra vez)
+    game_logged = False
+    events = p.event.get()
     while running:
-        for e in p.event.get():
+        gs = controller.gs
+        for e in events:
             if e.type == p.QUIT:
                 running = False
             # Mouse Handler
             elif e.type == p.MOUSEBUTTONDOWN:
-                if not gameOver and not rotation_animation_active:  # allow mouse handling only if its not game over and not rotating
+                if controller.accepts_input:  # allow mouse handling only if its not game over and not rotating
                     location = p.mouse.get_pos()
                     # Adjust for board offset
                     adjusted_x = location[0] - board_offset_x
@@ -685,7 +760,7 @@ def game_loop(screen, clock):
                         clicked_row = adjusted_y // SQ_SIZE
                         
                         # Convert clicked coordinates back to board coordinates if rotated
-                        if board_rotated:
+                        if controller.board_rotated:
                             row = 7 - clicked_row
                             col = 7 - clicked_col
                         else:
@@ -702,168 +777,197 @@ def game_loop(screen, clock):
                             playerClicks.append(squareSelected)
                     # after second click (at destination)
                     if len(playerClicks) == 2:
-                        # user generated a move
-                        move = Move(playerClicks[0], playerClicks[1], gs.board)
-                        for i in range(len(validMoves)):
-                            # check if the move is in the validMoves
-                            if move == validMoves[i]:
-                                # Check if a piece is captured at the destination square
-                                captured_piece = gs.board[validMoves[i].endRow][validMoves[i].endCol]
-                                if captured_piece != '--':
-                                    pieceCaptured = True
-                                    # Add captured piece to appropriate list
-                                    if captured_piece[0] == 'w':  # White piece captured
-                                        white_captured.append(captured_piece)
-                                    else:  # Black piece captured
-                                        black_captured.append(captured_piece)
-                                
-                                # Check for en passant capture
-                                if validMoves[i].isEnpassantMove:
-                                    # En passant capture - the captured pawn is not at the end square
-                                    enpassant_row = validMoves[i].endRow + (1 if validMoves[i].pieceMoved[0] == 'b' else -1)
-                                    captured_piece = gs.board[enpassant_row][validMoves[i].endCol]
-                                    if captured_piece != '--':
-                                        if captured_piece[0] == 'w':
-                                            white_captured.append(captured_piece)
-                                        else:
-                                            black_captured.append(captured_piece)
-                                
-                                gs.makeMove(validMoves[i])
-                                if (move.isPawnPromotion):
-                                    # Show pawn promotion popup and get the selected piece
-                                    promotion_choice = pawnPromotionPopup(
-                                        screen, gs)
-                                    # Set the promoted piece on the board
-                                    gs.board[move.endRow][move.endCol] = move.pieceMoved[0] + \
-                                        promotion_choice
-                                        pieceCaptured = False
-                                pieceCaptured = False
-                                moveMade = True
-                                animate = True
-                                squareSelected = ()
-                                playerClicks = []
-                        if not moveMade:
+                        # user generated a move, check if its in the validMoves
+                        move = controller.find_move(playerClicks[0], playerClicks[1])
+                        if move is not None:
+                            if (move.isPawnPromotion):
+                                # Show pawn promotion popup and pick the generated move of the selected piece
+                                move = controller.find_move(playerClicks[0], playerClicks[1], pawnPromotionPopup(screen, gs))
+                                renderer.invalidate()
+                            controller.make_move(move)
+                            # Call animateMove to animate the move (the worker generates the next moves meanwhile)
+                            animateMove(Move.fromCode(gs.moveLog[-1]), screen, gs.board, clock, controller.board_rotated)
+                            renderer.invalidate()
+                            squareSelected = ()
+                            playerClicks = []
+                        else:
                             playerClicks = [squareSelected]
 
             # Key Handler
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z:  # undo when z is pressed
-                    gs.undoMove()
-                    # when user undo move valid move change, here we could use [ validMoves = gs.getValidMoves() ] which would update the current validMoves after undo
-                    moveMade = True
-                    animate = False
-                    gameOver = False
-                    moveUndone = True
+                    controller.undo_move()
                 if e.key == p.K_r:  # reset board when 'r' is pressed
                     # Show confirmation dialog
                     confirmed = showConfirmationDialog(screen, "Reiniciar Jogo", "Deseja realmente reiniciar a partida?")
+                    renderer.invalidate()
                     if confirmed:
-                        gs = GameState()
-                        validMoves = gs.getValidMoves()
+                        controller.reset()
+                        gs = controller.gs
                         squareSelected = ()
                         playerClicks = []
-                        moveMade = False
-                        animate = False
-                        gameOver = False
-                        moveUndone = True
-                        board_rotated = False
-                        rotation_animation_active = False
-                        # Reset captured pieces
-                        white_captured.clear()
-                        black_captured.clear()
-                        if config.get("show_timer"):
-                            timer_mode = config.get("timer_mode")
-                            game_timer = GameTimer(config.get("timer_minutes"), timer_mode)
-                            game_timer.start_turn(gs.whiteToMove)
                 if e.key == p.K_ESCAPE:  # Voltar ao menu
+                    move_worker.stop()
                     return "menu"
 
+        # lances do worker, fim da rotação e fim de partida (tempo, repetição, afogamento, xeque-mate)
+        controller.update()
+        if controller.game_over and not game_logged:
+            log_game(controller)
+        game_logged = controller.game_over
 
-        if moveMade:
-            # Update timer
-            if config.get("show_timer"):
-                game_timer.start_turn(gs.whiteToMove)
-                
-            # Auto-rotate board if enabled
-            if config.get("auto_rotate"):
-                new_rotation = not gs.whiteToMove  # Black's turn = rotated
-                if new_rotation != board_rotated:
-                    if config.get("rotation_animation"):
-                        # Start rotation animation
-                        rotation_animation_active = True
-                        rotation_start_time = time.time()
-                        target_rotation = new_rotation
-                    else:
-                        # Instant rotation
-                        board_rotated = new_rotation
-                
-            if countMovesForDraw == 0 or countMovesForDraw == 1 or countMovesForDraw == 2 or countMovesForDraw == 3:
-                countMovesForDraw += 1
-            if countMovesForDraw == 4:
-                positionHistory += gs.getBoardString()
-                if previousPos == positionHistory:
-                    COUNT_DRAW += 1
-                    positionHistory = ""
-                    countMovesForDraw = 0
-                else:
-                    previousPos = positionHistory
-                    positionHistory = ""
-                    countMovesForDraw = 0
-                    COUNT_DRAW = 0
-            # Call animateMove to animate the move
-            if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock, board_rotated)
-            # genetare new set of valid move if valid move is made
-            validMoves = gs.getValidMoves()
-            moveMade = False
-            animate = False
-            moveUndone = False
-
-        # Update rotation animation
-        if rotation_animation_active:
-            elapsed = time.time() - rotation_start_time
-            rotation_duration = config.get("rotation_speed")
-            if elapsed >= rotation_duration:
-                # Animation complete
-                rotation_animation_active = False
-                board_rotated = target_rotation
-            
-        # Check timer
-        if config.get("show_timer") and game_timer.is_time_up(gs.whiteToMove):
-            gameOver = True
-            winner = "Black" if gs.whiteToMove else "White"
-            text = f'{winner} wins by time!'
-            drawEndGameText(screen, text)
-
-        # Calculate current rotation for animation
-        current_rotation = board_rotated
-        if rotation_animation_active:
-            elapsed = time.time() - rotation_start_time
-            rotation_duration = config.get("rotation_speed")
-            progress = min(elapsed / rotation_duration, 1.0)
-            # Simple flip animation (could be enhanced with smooth rotation)
-            if progress > 0.5:
-                current_rotation = target_rotation
-                
-        drawGameState(screen, gs, validMoves, squareSelected, current_rotation, 
-                     game_timer if config.get("show_timer") else None, 
-                     board_offset_x, board_offset_y, white_captured, black_captured, captured_offset_x)
-
-        if COUNT_DRAW == 1:
-            gameOver = True
-            text = 'Draw due to repetition'
-            drawEndGameText(screen, text)
-        if gs.stalemate:
-            gameOver = True
-            text = 'Stalemate'
-            drawEndGameText(screen, text)
-        elif gs.checkmate:
-            gameOver = True
-            text = 'Black wins by checkmate' if gs.whiteToMove else 'White wins by checkmate'
-            drawEndGameText(screen, text)
-
-        clock.tick(MAX_FPS)
-        p.display.flip()
+        # desenha só as áreas alteradas (ou a tela toda quando preciso) e atualiza a tela
+        renderer.render(screen, gs, controller.valid_moves, squareSelected, controller.current_rotation,
+                        controller.timer, board_offset_x, board_offset_y, controller.white_captured,
+                        controller.black_captured, captured_offset_x, controller.end_text)
+
+        if event_driven:
+            timeout = next_redraw_timeout(controller.timer, gs.whiteToMove,
+                                          controller.rotation_start_time if controller.rotation_animation_active else None,
+                                          controller.rotation_speed)
+            if move_worker.pending:
+                # o worker não gera eventos, então acorda a cada frame até o resultado chegar
+                timeout = min(timeout, 1 / MAX_FPS) if timeout is not None else 1 / MAX_FPS
+            events = wait_for_events(timeout)
+            clock.tick()
+        else:
+            clock.tick(MAX_FPS)
+            events = p.event.get()
+
+    move_worker.stop()
+
+
+# Renderizador em modo retido: guarda o tabuleiro vazio numa superfície e, a cada frame, só redesenha
+# as casas cuja peça ou destaque mudou, o painel de capturadas e o timer quando o texto muda,
+# enviando apenas esses retângulos com p.display.update(rects)
+class BoardRenderer:
+    def __init__(self):
+        self.squares_layer = None
+        self.squares_layer_key = None
+        self.highlight_surfaces = {}
+        # o que está na tela desde o último frame
+        self.layout = None
+        self.board = None
+        self.position_key = None
+        self.highlights = {}
+        self.timer_key = None
+        self.captured_key = None
+        self.invalidate()
+
+    # redesenho completo no próximo frame (depois de animações, popups e diálogos que desenham na tela toda)
+    def invalidate(self):
+        self.full_redraw = True
+
+    def get_highlights(self, gs, validMoves, squareSelected):
+        # (row, col) -> cor do destaque, mesma regra de highlightSquares
+        highlights = {}
+        if squareSelected != ():
+            row, col = squareSelected
+            if gs.board[row][col][0] == ('w' if gs.whiteToMove else 'b'):
+                highlights[(row, col)] = MOVE_HIGHLIGHT_COLOR
+                for move in validMoves:
+                    if move.startRow == row and move.startCol == col:
+                        highlights[(move.endRow, move.endCol)] = POSSIBLE_MOVE_COLOR
+        return highlights
+
+    def get_timer_key(self, timer, is_white_turn):
+        # o texto do timer só muda a cada segundo inteiro
+        if timer is None:
+            return None
+        white_time, black_time = timer.get_current_times(is_white_turn)
+        return int(white_time), int(black_time), is_white_turn
+
+    def build_layers(self, board_rotated):
+        key = (BOARD_WIDTH, SQ_SIZE, board_rotated)
+        if key != self.squares_layer_key:
+            self.squares_layer = p.Surface((BOARD_WIDTH, BOARD_HEIGHT))
+            drawSquare(self.squares_layer, board_rotated)
+            self.squares_layer_key = key
+            self.highlight_surfaces = {}
+            for color in (MOVE_HIGHLIGHT_COLOR, POSSIBLE_MOVE_COLOR):
+                s = p.Surface((SQ_SIZE, SQ_SIZE))
+                s.set_alpha(100)
+                s.fill(p.Color(color))
+                self.highlight_surfaces[color] = s
+
+    def draw_square(self, screen, piece, highlight, row, col, board_rotated, offset_x, offset_y):
+        if board_rotated:
+            display_row = 7 - row
+            display_col = 7 - col
+        else:
+            display_row = row
+            display_col = col
+        area = p.Rect(display_col * SQ_SIZE, display_row * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        rect = area.move(offset_x, offset_y)
+        # casa vazia copiada da camada do tabuleiro, depois destaque e peça como em drawGameState
+        screen.blit(self.squares_layer, rect, area)
+        if highlight is not None:
+            screen.blit(self.highlight_surfaces[highlight], rect)
+        if piece != "--":
+            screen.blit(IMAGES[piece], rect)
+        return rect
+
+    def render(self, screen, gs, validMoves, squareSelected, board_rotated=False, timer=None, offset_x=0, offset_y=0,
+               white_captured=None, black_captured=None, captured_offset_x=0, end_text=None):
+        highlights = self.get_highlights(gs, validMoves, squareSelected)
+        timer_key = self.get_timer_key(timer, gs.whiteToMove)
+        captured_key = (tuple(white_captured or ()), tuple(black_captured or ()))
+        position_key = (len(gs.moveLog), gs.zobristKey)
+        layout = (screen.get_size(), board_rotated, offset_x, offset_y, captured_offset_x, SQ_SIZE, end_text)
+
+        dirty = set()
+        if not self.full_redraw and layout == self.layout:
+            # casas alteradas pelo último lance (ou desfazer), só comparadas quando a posição mudou
+            if position_key != self.position_key:
+                for row in range(DIMENSION):
+                    for col in range(DIMENSION):
+                        if gs.board[row][col] != self.board[row][col]:
+                            dirty.add((row, col))
+            # casas que ganharam, perderam ou trocaram de destaque
+            for square in set(highlights) | set(self.highlights):
+                if highlights.get(square) != self.highlights.get(square):
+                    dirty.add(square)
+            # o texto de fim de jogo fica por cima do tabuleiro
+            if dirty and end_text:
+                self.full_redraw = True
+
+        if self.full_redraw or layout != self.layout:
+            drawGameState(screen, gs, validMoves, squareSelected, board_rotated, timer,
+                          offset_x, offset_y, white_captured, black_captured, captured_offset_x)
+            if end_text:
+                drawEndGameText(screen, end_text)
+            self.build_layers(board_rotated)
+            p.display.flip()
+        else:
+            rects = []
+            for row, col in dirty:
+                rects.append(self.draw_square(screen, gs.board[row][col], highlights.get((row, col)),
+                                              row, col, board_rotated, offset_x, offset_y))
+
+            if captured_key != self.captured_key and captured_offset_x >= 0:
+                # mesma área (com sombra) que drawCapturedPieces usa
+                captured_rect = p.Rect(max(captured_offset_x, 10), offset_y, 172, BOARD_HEIGHT + 2)
+                screen.fill(GAME_BG_COLOR, captured_rect)
+                drawCapturedPieces(screen, white_captured, black_captured, captured_offset_x, offset_y, board_rotated)
+                rects.append(captured_rect)
+
+            if timer is not None and timer_key != self.timer_key:
+                # mesma área (com sombra) que drawTimer usa
+                timer_rect = p.Rect(offset_x + BOARD_WIDTH + 240, offset_y + 50, 223, 203)
+                screen.fill(GAME_BG_COLOR, timer_rect)
+                drawTimer(screen, timer, gs.whiteToMove, offset_x, offset_y)
+                rects.append(timer_rect)
+
+            if rects:
+                p.display.update(rects)
+
+        self.full_redraw = False
+        self.layout = layout
+        self.board = [row[:] for row in gs.board]
+        self.position_key = position_key
+        self.highlights = highlights
+        self.timer_key = timer_key
+        self.captured_key = captured_key
 
 
 def drawGameState(screen, gs, validMoves, squareSelected, board_rotated=False, timer=None, offset_x=0, offset_y=0, white_captured=None, black_captured=None, captured_offset_x=0):
@@ -890,9 +994,9 @@ def drawGameState(screen, gs, validMoves, squareSelected, board_rotated=False, t
         drawTimer(screen, timer, gs.whiteToMove, offset_x, offset_y)
     
     # Draw instructions at bottom
-    font_instructions = p.font.SysFont("Arial", 14)
+    font_instructions = get_font("Arial", 14)
     instructions = "R = Reiniciar  |  Z = Desfazer  |  ESC = Menu"
-    inst_text = font_instructions.render(instructions, True, (120, 130, 150))
+    inst_text = render_text(font_instructions, instructions, (120, 130, 150), True)
     screen.blit(inst_text, (10, screen.get_height() - 25))
 
 
@@ -969,8 +1073,8 @@ def drawCapturedPieces(screen, white_captured, black_captured, captured_x, board
     if captured_x < 0 or not white_captured and not black_captured:
         return  # Don't draw if position is invalid or no pieces captured
         
-    font = p.font.SysFont("Arial", 16, True)
-    small_piece_size = 35  # Tamanho menor para peças capturadas
+    font = get_font("Arial", 16, True)
+    small_piece_size = CAPTURED_PIECE_SIZE
     
     # Área para peças capturadas
     captured_width = 170
@@ -991,7 +1095,7 @@ def drawCapturedPieces(screen, white_captured, black_captured, captured_x, board
     p.draw.rect(screen, TIMER_BORDER_COLOR, captured_rect, 2, border_radius=8)
     
     # Título da seção
-    title_text = font.render("Capturadas", True, MENU_ACCENT_COLOR)
+    title_text = render_text(font, "Capturadas", MENU_ACCENT_COLOR, True)
     screen.blit(title_text, (captured_x + 8, board_y + 8))
     
     # Dividir em duas áreas: superior e inferior
@@ -1012,15 +1116,15 @@ def drawCapturedPieces(screen, white_captured, black_captured, captured_x, board
         black_label = "Suas"
     
     # Labels
-    small_font = p.font.SysFont("Arial", 12)
+    small_font = get_font("Arial", 12)
     
     # Only show labels if there are captured pieces
     if black_captured:
-        black_text = small_font.render(black_label, True, MENU_TEXT_COLOR)
+        black_text = render_text(small_font, black_label, MENU_TEXT_COLOR, True)
         screen.blit(black_text, (captured_x + 8, black_area_y - 18))
     
     if white_captured:
-        white_text = small_font.render(white_label, True, MENU_TEXT_COLOR)
+        white_text = render_text(small_font, white_label, MENU_TEXT_COLOR, True)
         screen.blit(white_text, (captured_x + 8, white_area_y - 18))
     
     # Desenhar peças pretas capturadas (capturadas pelo branco)
@@ -1035,7 +1139,7 @@ def drawCapturedPieces(screen, white_captured, black_captured, captured_x, board
         # Verificar se a peça cabe na área
         if piece_y + small_piece_size <= mid_y - 5:
             if piece in IMAGES:
-                piece_img = p.transform.scale(IMAGES[piece], (small_piece_size, small_piece_size))
+                piece_img = load_atlas(small_piece_size)[piece]
                 screen.blit(piece_img, (piece_x, piece_y))
     
     # Desenhar peças brancas capturadas (capturadas pelo preto)
@@ -1050,12 +1154,12 @@ def drawCapturedPieces(screen, white_captured, black_captured, captured_x, board
         # Verificar se a peça cabe na área
         if piece_y + small_piece_size <= board_y + captured_height - 5:
             if piece in IMAGES:
-                piece_img = p.transform.scale(IMAGES[piece], (small_piece_size, small_piece_size))
+                piece_img = load_atlas(small_piece_size)[piece]
                 screen.blit(piece_img, (piece_x, piece_y))
 
 def drawTimer(screen, timer, is_white_turn, offset_x=0, offset_y=0):
-    font = p.font.SysFont("Arial", 24, True)
-    small_font = p.font.SysFont("Arial", 16)
+    font = get_font("Arial", 24, True)
+    small_font = get_font("Arial", 16)
     
     white_time, black_time = timer.get_current_times(is_white_turn)
     
@@ -1089,7 +1193,7 @@ def drawTimer(screen, timer, is_white_turn, offset_x=0, offset_y=0):
     p.draw.rect(screen, TIMER_BORDER_COLOR, timer_rect, 2, border_radius=12)
     
     # Mode indicator
-    mode_surface = small_font.render(mode_text, True, MENU_ACCENT_COLOR)
+    mode_surface = render_text(small_font, mode_text, MENU_ACCENT_COLOR, True)
     screen.blit(mode_surface, (timer_x + 10, offset_y + 60))
     
     # Warning for countdown mode
@@ -1100,7 +1204,7 @@ def drawTimer(screen, timer, is_white_turn, offset_x=0, offset_y=0):
     if timer.mode == "countdown" and white_time <= 30:
         white_color = (255, 120, 120)
     
-    white_surface = font.render(white_text, True, white_color)
+    white_surface = render_text(font, white_text, white_color, True)
     screen.blit(white_surface, (timer_x + 10, offset_y + 180))
     
     # Black timer
@@ -1108,12 +1212,12 @@ def drawTimer(screen, timer, is_white_turn, offset_x=0, offset_y=0):
     if timer.mode == "countdown" and black_time <= 30:
         black_color = (255, 120, 120)
     
-    black_surface = font.render(black_text, True, black_color)
+    black_surface = render_text(font, black_text, black_color, True)
     screen.blit(black_surface, (timer_x + 10, offset_y + 100))
     
     # Current turn indicator
     turn_text = "Vez do: " + ("Branco" if is_white_turn else "Preto")
-    turn_surface = font.render(turn_text, True, MENU_ACCENT_COLOR)
+    turn_surface = render_text(font, turn_text, MENU_ACCENT_COLOR, True)
     screen.blit(turn_surface, (timer_x + 10, offset_y + 220))
 
 
@@ -1182,9 +1286,9 @@ def animateMove(move, screen, board, clock, board_rotated=False):
 
 def drawEndGameText(screen, text):
     # create font object with type and size of font you want
-    font = p.font.SysFont("Times New Roman", 30, False, False)
+    font = get_font("Times New Roman", 30, False, False)
     # use the above font and render text (0 ? antialias)
-    textObject = font.render(text, True, p.Color('black'))
+    textObject = render_text(font, text, p.Color('black'), True)
 
     # Get the width and height of the textObject
     text_width = textObject.get_width()
@@ -1198,7 +1302,7 @@ def drawEndGameText(screen, text):
     screen.blit(textObject, textLocation)
 
     # Create a second rendering of the text with a slight offset for a shadow effect
-    textObject = font.render(text, 0, p.Color('Black'))
+    textObject = render_text(font, text, p.Color('Black'), 0)
     screen.blit(textObject, textLocation.move(1, 1))
 
 
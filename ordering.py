@@ -0,0 +1,137 @@
+# Move ordering for search.Searcher: the better the first move of a node, the more of its siblings alpha-beta cuts
+# order of a node: the principal variation / hash move, captures by MVV-LVA, the two killer moves of the ply
+# (quiet moves that caused a cutoff at the same ply elsewhere), then the other quiet moves by a history table
+# indexed by piece and to-square, which grows with every quiet cutoff
+# staged: a node without a hash move generates its captures alone (getCaptureCodes) and only generates the quiet
+# moves when no capture cut it off
+# usage: python ordering.py [--depth N] [--backend mailbox|bitboard] [--positions N] [--max-nodes N]
+#        (search nodes of a fixed position set with and without ordering)
+
+import argparse
+from array import array
+from engine import PIECES, NO_PIECE, MOVE_MASK, MOVED_SHIFT, CAPTURED_SHIFT, PROMOTION_SHIFT
+
+PIECE_VALUES = {'p': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+# value of every engine.PIECES index, for reading move codes
+INDEX_VALUES = [PIECE_VALUES[piece[1]] for piece in PIECES[:NO_PIECE]] + [0]
+# killer moves kept per ply
+KILLERS = 2
+# history scores are halved once one of them passes this
+HISTORY_LIMIT = 1 << 20
+# quiet move scores: queen promotions, then killers, then history
+PROMOTION_SCORE = 1 << 26
+KILLER_SCORE = 1 << 24
+# deepest ply with killer slots, search extends the table when it goes deeper
+MAX_PLY = 128
+
+
+def isCapture(code):
+    return (code >> CAPTURED_SHIFT) & 15 != NO_PIECE
+
+
+# most valuable victim first, then least valuable attacker, for a move code
+def mvvLva(code):
+    captured = (code >> CAPTURED_SHIFT) & 15
+    if captured == NO_PIECE:
+        return 0
+    return INDEX_VALUES[captured] * 10 - INDEX_VALUES[(code >> MOVED_SHIFT) & 15] + 10000
+
+
+class MoveOrderer():
+    def __init__(self):
+        self.killers = [[0] * KILLERS for ply in range(MAX_PLY)]
+        # history[piece * 64 + to-square]
+        self.history = array('l', bytes(array('l').itemsize * NO_PIECE * 64))
+
+    # called before every search: killers belong to the old position, history keeps half its weight
+    def newSearch(self):
+        for killers in self.killers:
+            killers[:] = [0] * KILLERS
+        for i in range(len(self.history)):
+            self.history[i] >>= 1
+
+    # a quiet move caused a cutoff at ply with depth plies left to search
+    def addCutoff(self, code, ply, depth):
+        while ply >= len(self.killers):
+            self.killers.append([0] * KILLERS)
+        killers = self.killers[ply]
+        if killers[0] != code:
+            killers[1:] = killers[:-1]
+            killers[0] = code
+        index = ((code >> MOVED_SHIFT) & 15) * 64 + ((code >> 6) & 63)
+        self.history[index] += depth * depth
+        if self.history[index] > HISTORY_LIMIT:
+            for i in range(len(self.history)):
+                self.history[i] >>= 1
+
+    def quietScore(self, code, killers):
+        if (code >> PROMOTION_SHIFT) & 7 == 1:
+            return PROMOTION_SCORE
+        if code in killers:
+            return KILLER_SCORE - killers.index(code)
+        return self.history[((code >> MOVED_SHIFT) & 15) * 64 + ((code >> 6) & 63)]
+
+    def orderQuiets(self, quiets, ply):
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+        return sorted(quiets, key=lambda code: self.quietScore(code, killers), reverse=True)
+
+
+# moves of the position of gs in search order, generated in stages; orderer None keeps the generation order
+# pvMove is a move code, hashMove the MOVE_MASK bits of one; the buffers are array('I') of this ply
+# yields nothing when there is no legal move (gs.inCheck tells mate from stalemate)
+def orderedMoves(gs, orderer, ply, captureBuffer, moveBuffer, pvMove=None, hashMove=None):
+    if orderer is None:
+        yield from gs.getValidMoveCodes(moveBuffer)
+        return
+    if pvMove is None and hashMove is None:
+        captures = sorted(gs.getCaptureCodes(captureBuffer), key=mvvLva, reverse=True)
+        yield from captures
+        # no capture cut the node off, now the quiet moves are needed
+        moves = gs.getValidMoveCodes(moveBuffer)
+        yield from orderer.orderQuiets([code for code in moves if not isCapture(code)], ply)
+        return
+    moves = gs.getValidMoveCodes(moveBuffer)
+    first = pvMove if pvMove is not None and pvMove in moves else None
+    if first is None and hashMove is not None:
+        for code in moves:
+            if code & MOVE_MASK == hashMove:
+                first = code
+                break
+    if first is not None:
+        yield first
+    yield from sorted((code for code in moves if isCapture(code) and code != first), key=mvvLva, reverse=True)
+    yield from orderer.orderQuiets([code for code in moves if not isCapture(code) and code != first], ply)
+
+
+def main():
+    from backends import BACKENDS, loadFen
+    from perft import REFERENCE_POSITIONS
+    from search import Searcher
+
+    parser = argparse.ArgumentParser(description="search nodes of a fixed position set with and without move ordering")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard")
+    parser.add_argument("--positions", type=int, default=6, help="how many of perft.REFERENCE_POSITIONS to search")
+    parser.add_argument("--max-nodes", type=int, default=500000,
+                        help="node budget of every search, a '+' marks the searches it stopped before --depth")
+    args = parser.parse_args()
+
+    totals = {False: [0, 0.0], True: [0, 0.0]}
+    for name, fen, counts in REFERENCE_POSITIONS[:args.positions]:
+        line = f"{name:32s}"
+        for ordering in (False, True):
+            gs = loadFen(BACKENDS[args.backend](), fen)
+            result = Searcher(gs, ordering=ordering).search(nodeLimit=args.max_nodes, maxDepth=args.depth)
+            totals[ordering][0] += result.nodes
+            totals[ordering][1] += result.elapsed
+            stopped = '+' if result.depth < args.depth and result.nodes >= args.max_nodes else ' '
+            line += f"  {'ordered' if ordering else 'unordered'} {result.nodes:9d}{stopped} nodes {result.elapsed:7.2f}s"
+        print(line)
+    unordered, ordered = totals[False], totals[True]
+    print(f"{'total':32s}  unordered {unordered[0]:9d} nodes {unordered[1]:7.2f}s  ordered {ordered[0]:9d} nodes "
+          f"{ordered[1]:7.2f}s  nodes {ordered[0] / max(unordered[0], 1):.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
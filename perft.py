@@ -0,0 +1,150 @@
+# Perft: walks the legal move tree with makeMove / undoMove and counts the leaf nodes
+# the counts are compared to known reference values to check the move generator, the time gives its speed
+# usage: python perft.py [--backend mailbox|bitboard] [--fen FEN --depth N [--divide]] [--max-nodes N] [--flipped]
+#        (--flipped loads the positions on the board of playerWantsToPlayAsBlack, mailbox backend only)
+
+import argparse
+import time
+from array import array
+from engine import Move
+from backends import BACKENDS, START_FEN, loadFen, moveName
+
+# (name, fen, {depth: nodes}) from the chessprogramming wiki perft results and the well known perft edge case suite,
+# the edge case suite only publishes its deepest count, the shallower ones were generated and checked against it
+REFERENCE_POSITIONS = [
+    ("start position", START_FEN,
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ("illegal en passant 1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     {1: 18, 2: 92, 3: 1670, 4: 10138, 5: 185429, 6: 1134888}),
+    ("illegal en passant 2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+     {1: 13, 2: 102, 3: 1266, 4: 10276, 5: 135655, 6: 1015133}),
+    ("en passant gives check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     {1: 15, 2: 126, 3: 1928, 4: 13931, 5: 206379, 6: 1440467}),
+    ("short castle gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+     {1: 15, 2: 66, 3: 1198, 4: 6399, 5: 120330, 6: 661072}),
+    ("long castle gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+     {1: 16, 2: 71, 3: 1286, 4: 7418, 5: 141077, 6: 803711}),
+    ("castle rights lost by capture", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+     {1: 26, 2: 1141, 3: 27826, 4: 1274206}),
+    ("castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+     {1: 44, 2: 1494, 3: 50509, 4: 1720476}),
+    ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+     {1: 11, 2: 133, 3: 1442, 4: 19174, 5: 266199, 6: 3821001}),
+    ("discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+     {1: 29, 2: 165, 3: 5160, 4: 31961, 5: 1004658}),
+    ("promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+     {1: 9, 2: 40, 3: 472, 4: 2661, 5: 38983, 6: 217342}),
+    ("underpromote to give check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     {1: 6, 2: 27, 3: 273, 4: 1329, 5: 18135, 6: 92683}),
+    ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+     {1: 2, 2: 6, 3: 13, 4: 63, 5: 382, 6: 2217}),
+    ("stalemate and checkmate", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+     {1: 10, 2: 25, 3: 268, 4: 926, 5: 10857, 6: 43261, 7: 567584}),
+    ("stalemate and checkmate 2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+     {1: 37, 2: 183, 3: 6559, 4: 23527}),
+]
+
+
+# buffers holds one move code array per depth, reused by every node at that depth
+def perft(gs, depth, buffers=None):
+    if depth == 0:
+        return 1
+    if buffers is None:
+        buffers = [array('I') for i in range(depth + 1)]
+    moves = gs.getValidMoveCodes(buffers[depth])
+    # bulk counting, the last ply doesn't need to be played
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for code in moves:
+        gs.makeMove(code)
+        nodes += perft(gs, depth - 1, buffers)
+        gs.undoMove()
+    return nodes
+
+
+# perft split by root move, returns [(move name, nodes)]
+def divide(gs, depth):
+    results = []
+    for code in gs.getValidMoveCodes():
+        gs.makeMove(code)
+        results.append((moveName(Move.fromCode(code)), perft(gs, depth - 1)))
+        gs.undoMove()
+    return results
+
+
+def runDivide(gs, depth):
+    start = time.perf_counter()
+    results = divide(gs, depth)
+    elapsed = time.perf_counter() - start
+    for name, nodes in sorted(results):
+        print(f"{name}: {nodes}")
+    total = sum(nodes for name, nodes in results)
+    print(f"\nmoves {len(results)}  nodes {total}  time {elapsed:.3f}s  nps {total / max(elapsed, 1e-9):.0f}")
+    return total
+
+
+# runs every reference position at the deepest depth with at most maxNodes nodes, returns True if all counts match
+# the counts don't depend on the board orientation, so flipped runs the same suite on the flipped board
+def runSuite(backend, maxNodes=200000, flipped=False):
+    allPassed = True
+    totalNodes = 0
+    totalTime = 0.0
+    for name, fen, counts in REFERENCE_POSITIONS:
+        depths = [depth for depth, nodes in counts.items() if nodes <= maxNodes]
+        if not depths:
+            print(f"{name:32s} skipped (more than {maxNodes} nodes)")
+            continue
+        depth = max(depths)
+        gs = loadFen(backend(), fen, flipped)
+        start = time.perf_counter()
+        nodes = perft(gs, depth)
+        elapsed = time.perf_counter() - start
+        passed = nodes == counts[depth]
+        allPassed = allPassed and passed
+        totalNodes += nodes
+        totalTime += elapsed
+        print(f"{name:32s} depth {depth}  nodes {nodes:9d}  expected {counts[depth]:9d}  "
+              f"{'ok' if passed else 'FAIL'}  time {elapsed:7.3f}s  nps {nodes / max(elapsed, 1e-9):9.0f}")
+    print(f"\ntotal nodes {totalNodes}  time {totalTime:.3f}s  nps {totalNodes / max(totalTime, 1e-9):.0f}")
+    return allPassed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="perft for the chess engine")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="mailbox")
+    parser.add_argument("--fen", help="position to search, runs the reference suite when omitted")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--max-nodes", type=int, default=200000, help="node limit per suite position")
+    parser.add_argument("--flipped", action="store_true", help="play on the flipped board (white at the top)")
+    args = parser.parse_args()
+    if args.flipped and args.backend != "mailbox":
+        parser.error("--flipped needs the mailbox backend")
+
+    if args.fen is None:
+        return 0 if runSuite(BACKENDS[args.backend], args.max_nodes, args.flipped) else 1
+
+    gs = loadFen(BACKENDS[args.backend](), args.fen, args.flipped)
+    if args.divide:
+        runDivide(gs, args.depth)
+    else:
+        start = time.perf_counter()
+        nodes = perft(gs, args.depth)
+        elapsed = time.perf_counter() - start
+        print(f"nodes {nodes}  time {elapsed:.3f}s  nps {nodes / max(elapsed, 1e-9):.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,322 @@
+# Standard algebraic notation and PGN games: san() names a move in its position (disambiguation, promotion, check and mate),
+# appendGame writes a finished game to a PGN file and readPgn streams the games of a PGN file one at a time,
+# so replayPgn can play databases of any size through makeMove with only one game in memory
+# usage: python pgn.py FILE [--backend mailbox|bitboard] [--report N]
+
+import argparse
+import datetime
+import os
+import re
+import time
+from engine import GameState, PIECES, NO_PIECE, PROMOTION_PIECES, PROMOTION_SHIFT, MOVED_SHIFT, CAPTURED_SHIFT, \
+    CASTLE_FLAG, parseFen
+from backends import START_FEN
+
+FILES = "abcdefgh"
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+# tags every PGN game starts with, in this order
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+# movetext lines are wrapped before this many characters
+LINE_LENGTH = 80
+
+
+# name of a square (row * 8 + col), on the flipped board (playerWantsToPlayAsBlack) row 0 is the first rank
+def squareName(sq, flipped=False):
+    row = sq >> 3
+    return FILES[sq & 7] + str(row + 1 if flipped else 8 - row)
+
+
+def squareIndex(name, flipped=False):
+    rank = int(name[1])
+    return (rank - 1 if flipped else 8 - rank) * 8 + FILES.index(name[0])
+
+
+# SAN of the move code in the current position of gs, legal is the list of legal move codes of that position if known
+def san(gs, code, legal=None):
+    if legal is None:
+        legal = gs.getValidMoveCodes()
+    flipped = gs.playerWantsToPlayAsBlack
+    start = code & 63
+    end = (code >> 6) & 63
+    moved = (code >> MOVED_SHIFT) & 15
+    piece = PIECES[moved][1]
+    if code & CASTLE_FLAG:
+        text = "O-O" if (end & 7) > (start & 7) else "O-O-O"
+    elif piece == 'p':
+        text = squareName(end, flipped)
+        if (code >> CAPTURED_SHIFT) & 15 != NO_PIECE:
+            text = FILES[start & 7] + 'x' + text
+        promotion = (code >> PROMOTION_SHIFT) & 7
+        if promotion:
+            text += '=' + PROMOTION_PIECES[promotion]
+    else:
+        # other pieces of the same kind that can go to the same square
+        others = [other & 63 for other in legal
+                  if (other >> MOVED_SHIFT) & 15 == moved and (other >> 6) & 63 == end and other & 63 != start]
+        startName = squareName(start, flipped)
+        if not others:
+            hint = ''
+        elif all(other & 7 != start & 7 for other in others):
+            hint = startName[0]
+        elif all(other >> 3 != start >> 3 for other in others):
+            hint = startName[1]
+        else:
+            hint = startName
+        capture = 'x' if (code >> CAPTURED_SHIFT) & 15 != NO_PIECE else ''
+        text = piece + hint + capture + squareName(end, flipped)
+    # check and mate, the position of gs is left as it was (move generation sets the end state flags)
+    flags = endState(gs)
+    gs.makeMove(code)
+    replies = gs.getValidMoveCodes()
+    if gs.inCheck:
+        text += '+' if len(replies) else '#'
+    gs.undoMove()
+    gs.inCheck, gs.checkmate, gs.stalemate = flags
+    return text
+
+
+# (inCheck, checkmate, stalemate) of gs, san and gameSans put them back after looking at other positions
+def endState(gs):
+    return gs.inCheck, gs.checkmate, gs.stalemate
+
+
+# legal move code of a SAN string (check marks and annotations are ignored), ValueError if there is none or more than one
+def parseSan(gs, text, legal=None):
+    if legal is None:
+        legal = gs.getValidMoveCodes()
+    token = text.rstrip('+#!?')
+    if token in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        kingside = len(token) == 3
+        for code in legal:
+            if code & CASTLE_FLAG and (((code >> 6) & 7) > (code & 7)) == kingside:
+                return code
+        raise ValueError(f"illegal move: {text}")
+    promotion = 0
+    if '=' in token:
+        token, piece = token.split('=', 1)
+        promotion = PROMOTION_PIECES.index(piece.upper()[:1])
+    elif token[-1:] in ('Q', 'R', 'B', 'N') and token[:1] in FILES:
+        promotion = PROMOTION_PIECES.index(token[-1])
+        token = token[:-1]
+    piece = 'p'
+    if token[:1] in ('K', 'Q', 'R', 'B', 'N'):
+        piece = token[0]
+        token = token[1:]
+    token = token.replace('x', '').replace('-', '').replace(':', '')
+    if len(token) < 2 or token[-2] not in FILES or token[-1] not in "12345678":
+        raise ValueError(f"bad SAN move: {text}")
+    flipped = gs.playerWantsToPlayAsBlack
+    end = squareIndex(token[-2:], flipped)
+    hint = token[:-2]
+    match = None
+    for code in legal:
+        if (code >> 6) & 63 != end or PIECES[(code >> MOVED_SHIFT) & 15][1] != piece or \
+                (code >> PROMOTION_SHIFT) & 7 != promotion or code & CASTLE_FLAG:
+            continue
+        startName = squareName(code & 63, flipped)
+        if any(char != startName[0] and char != startName[1] for char in hint) or \
+                (len(hint) == 2 and hint != startName):
+            continue
+        if match is not None:
+            raise ValueError(f"ambiguous move: {text}")
+        match = code
+    if match is None:
+        raise ValueError(f"illegal move: {text}")
+    return match
+
+
+# (FEN of the position before the first move, SAN of every move of gs.moveLog), gs is left as it was
+def gameSans(gs):
+    flags = endState(gs)
+    codes = list(gs.moveLog)
+    for code in codes:
+        gs.undoMove()
+    startFen = gs.to_fen()
+    sans = []
+    for code in codes:
+        sans.append(san(gs, code))
+        gs.makeMove(code)
+    gs.inCheck, gs.checkmate, gs.stalemate = flags
+    return startFen, sans
+
+
+# movetext of the SAN moves from a position with that side to move and move number, wrapped at LINE_LENGTH
+def movetext(sans, result, whiteToMove=True, fullmoveNumber=1):
+    words = []
+    for text in sans:
+        if whiteToMove:
+            words.append(f"{fullmoveNumber}. {text}")
+        elif not words:
+            words.append(f"{fullmoveNumber}... {text}")
+        else:
+            words.append(text)
+        if not whiteToMove:
+            fullmoveNumber += 1
+        whiteToMove = not whiteToMove
+    words.append(result)
+    lines = []
+    line = ""
+    for word in words:
+        if line and len(line) + 1 + len(word) >= LINE_LENGTH:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    lines.append(line)
+    return "\n".join(lines)
+
+
+# PGN text of one game, tags holds any tags beyond the seven tag roster
+def formatGame(sans, result, tags=None, startFen=START_FEN):
+    tags = dict(tags or {})
+    tags["Result"] = result
+    if startFen != START_FEN:
+        tags["SetUp"] = "1"
+        tags["FEN"] = startFen
+    defaults = {"Event": "?", "Site": "?", "Date": "????.??.??", "Round": "?", "White": "?", "Black": "?"}
+    lines = [f'[{name} "{tags.get(name, defaults.get(name))}"]' for name in SEVEN_TAG_ROSTER]
+    lines += [f'[{name} "{value}"]' for name, value in tags.items() if name not in SEVEN_TAG_ROSTER]
+    fields = startFen.split()
+    return "\n".join(lines) + "\n\n" + movetext(sans, result, fields[1] == 'w', int(fields[5])) + "\n\n"
+
+
+# appends the game of gs (from the position before its first move) to the PGN file at path, creating its directory
+def appendGame(path, gs, result, tags=None):
+    tags = dict(tags or {})
+    tags.setdefault("Date", datetime.date.today().strftime("%Y.%m.%d"))
+    startFen, sans = gameSans(gs)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(formatGame(sans, result, tags, startFen))
+
+
+class PgnGame():
+    def __init__(self, tags, moves, result):
+        self.tags = tags
+        # SAN strings of the main line
+        self.moves = moves
+        self.result = result
+
+
+TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+MOVE_NUMBER = re.compile(r'^\d+\.+')
+
+
+# PgnGames of a file object, read line by line so only the current game is ever held in memory
+# comments, variations and NAGs are skipped
+def readPgn(f):
+    tags = {}
+    moves = []
+    inComment = False
+    variationDepth = 0
+    for line in f:
+        if inComment:
+            end = line.find('}')
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            inComment = False
+        stripped = line.strip()
+        if not stripped or stripped.startswith('%'):
+            continue
+        if stripped.startswith('[') and variationDepth == 0:
+            match = TAG.match(stripped)
+            if match:
+                if moves:
+                    # a game without a result token at its end
+                    yield PgnGame(tags, moves, tags.get("Result", "*"))
+                    tags = {}
+                    moves = []
+                tags[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+                continue
+        i = 0
+        length = len(line)
+        while i < length:
+            char = line[i]
+            if char.isspace():
+                i += 1
+            elif char == '{':
+                end = line.find('}', i)
+                if end < 0:
+                    inComment = True
+                    break
+                i = end + 1
+            elif char == ';':
+                break
+            elif char == '(':
+                variationDepth += 1
+                i += 1
+            elif char == ')':
+                variationDepth -= 1
+                i += 1
+            else:
+                j = i
+                while j < length and not line[j].isspace() and line[j] not in '{};()':
+                    j += 1
+                word = line[i:j]
+                i = j
+                if variationDepth > 0 or word.startswith('$'):
+                    continue
+                if word in RESULTS:
+                    yield PgnGame(tags, moves, word)
+                    tags = {}
+                    moves = []
+                    continue
+                word = MOVE_NUMBER.sub('', word)
+                if word:
+                    moves.append(word)
+    if moves or tags:
+        yield PgnGame(tags, moves, tags.get("Result", "*"))
+
+
+# plays every game of games (PgnGames) on one scratch state, yields (game, gs) with gs at the end of the game
+# and the move codes in gs.moveLog; ValueError on an illegal move or a bad FEN tag
+# unless errors is a list: then the message goes in errors and the game is skipped
+def replayPgn(games, backend=GameState, errors=None):
+    gs = backend()
+    for game in games:
+        try:
+            gs.loadPosition(*parseFen(game.tags.get("FEN", START_FEN)))
+            for text in game.moves:
+                gs.makeMove(parseSan(gs, text))
+        except ValueError as e:
+            message = (f"{e} in game {game.tags.get('White', '?')} - {game.tags.get('Black', '?')} "
+                       f"{game.tags.get('Date', '')}")
+            if errors is None:
+                raise ValueError(message) from None
+            errors.append(message)
+            continue
+        yield game, gs
+
+
+def main():
+    from backends import BACKENDS
+
+    parser = argparse.ArgumentParser(description="replay every game of a PGN file")
+    parser.add_argument("file")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="mailbox")
+    parser.add_argument("--report", type=int, default=1000, help="print the speed every N games")
+    args = parser.parse_args()
+
+    games = moves = 0
+    errors = []
+    start = time.perf_counter()
+    with open(args.file, "r", encoding="utf-8", errors="replace") as f:
+        for game, gs in replayPgn(readPgn(f), BACKENDS[args.backend], errors):
+            games += 1
+            moves += len(gs.moveLog)
+            if args.report and games % args.report == 0:
+                elapsed = time.perf_counter() - start
+                print(f"games {games}  moves {moves}  games/s {games / elapsed:.0f}  moves/s {moves / elapsed:.0f}")
+    elapsed = time.perf_counter() - start
+    for message in errors:
+        print(f"skipped: {message}")
+    print(f"games {games}  skipped {len(errors)}  moves {moves}  time {elapsed:.3f}s  "
+          f"moves/s {moves / max(elapsed, 1e-9):.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+# Material values and piece-square tables shared by engine.py (incremental score) and evaluation.py
+# kept free of imports so both can build their tables from it
+
+# material of every piece type, in the middlegame and in the endgame
+MG_VALUES = {'p': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 0}
+EG_VALUES = {'p': 120, 'N': 300, 'B': 320, 'R': 520, 'Q': 900, 'K': 0}
+
+# piece-square tables from white's point of view, a8 first (row 0 of the board) and h1 last
+PAWN_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0]
+# in the endgame only how far a pawn got matters
+PAWN_EG_TABLE = [0] * 8 + [80] * 8 + [50] * 8 + [30] * 8 + [15] * 8 + [5] * 8 + [0] * 8 + [0] * 8
+KNIGHT_TABLE = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50]
+BISHOP_TABLE = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20]
+ROOK_TABLE = [
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0]
+QUEEN_TABLE = [
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20]
+# the king hides behind its pawns while there is material to attack it and walks to the centre in the endgame
+KING_MG_TABLE = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20]
+KING_EG_TABLE = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50]
+
+MG_PST = {'p': PAWN_TABLE, 'N': KNIGHT_TABLE, 'B': BISHOP_TABLE, 'R': ROOK_TABLE, 'Q': QUEEN_TABLE, 'K': KING_MG_TABLE}
+EG_PST = {'p': PAWN_EG_TABLE, 'N': KNIGHT_TABLE, 'B': BISHOP_TABLE, 'R': ROOK_TABLE, 'Q': QUEEN_TABLE, 'K': KING_EG_TABLE}
+
+# game phase weight of every piece type, PHASE_TOTAL with all of them on the board (middlegame), 0 with only pawns
+PHASE_WEIGHTS = {'p': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+PHASE_TOTAL = 24
+
+
+# material + square of every piece of pieces (engine.PIECES) on every square, positive for white, 0 for '--'
+# black pieces look up the square mirrored to white's side of the board
+def pieceSquareTables(pieces, values, tables, flipped=False):
+    result = []
+    for piece in pieces:
+        if piece == '--':
+            result.append([0] * 64)
+            continue
+        table = tables[piece[1]]
+        value = values[piece[1]]
+        # the flipped board (playerWantsToPlayAsBlack) has white on rows 0 and 1
+        white = piece[0] == 'w'
+        mirror = 0 if white != flipped else 56
+        sign = 1 if white else -1
+        result.append([sign * (value + table[sq ^ mirror]) for sq in range(64)])
+    return result
+
+
+# score between the middlegame and the endgame one, by how much material is left (promotions can pass PHASE_TOTAL)
+def taper(mg, eg, phase):
+    phase = min(phase, PHASE_TOTAL)
+    return (mg * phase + eg * (PHASE_TOTAL - phase)) // PHASE_TOTAL
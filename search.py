@@ -0,0 +1,289 @@
+# Responsible for choosing a move for the side to move: negamax alpha-beta with iterative deepening,
+# quiescence search on captures and move ordering (ordering.py), stopped by a time or node budget
+# works with both engine.GameState and bitboard.BitboardGameState
+# usage: python search.py [--backend mailbox|bitboard] [--fen FEN] [--time SECONDS] [--nodes N] [--depth N] [--hash MB]
+#                        [--book FILE] [--tablebase DIR]
+
+import argparse
+import time
+from array import array
+from engine import Move, MOVE_MASK
+# material + piece-square score kept up to date by makeMove / undoMove, O(1) at every node
+from evaluation import evaluate
+from transposition import EXACT, LOWER, UPPER
+from ordering import MoveOrderer, isCapture, mvvLva, orderedMoves
+
+MATE_SCORE = 100000
+# scores above this are mates, the distance to mate is MATE_SCORE - abs(score)
+MATE_BOUND = MATE_SCORE - 1000
+# how often (in nodes) the clock is read
+CHECK_EVERY = 1024
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+# seconds to spend on the next move from a controller.GameTimer, None when the timer doesn't count down
+def timeBudget(timer, whiteToMove, movesToGo=30, safetyMargin=0.05):
+    if timer is None or timer.mode != "countdown":
+        return None
+    whiteTime, blackTime = timer.get_current_times(whiteToMove)
+    remaining = whiteTime if whiteToMove else blackTime
+    # keep a little time in hand so the flag never falls while the search unwinds
+    return max(0.01, remaining / movesToGo - safetyMargin)
+
+
+class SearchResult():
+    def __init__(self, bestMove, score, depth, nodes, elapsed, pv):
+        self.bestMove = bestMove
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.pv = pv
+
+    @property
+    def nps(self):
+        return self.nodes / max(self.elapsed, 1e-9)
+
+    def __str__(self):
+        pv = " ".join(str(move) for move in self.pv)
+        return f"depth {self.depth}  score {self.score}  nodes {self.nodes}  nps {self.nps:.0f}  time {self.elapsed:.3f}s  pv {pv}"
+
+
+# mate scores are stored relative to the node in the transposition table, so they stay right at any ply
+def scoreToTable(score, ply):
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def scoreFromTable(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class Searcher():
+    # tt is an optional transposition.TranspositionTable shared between searches,
+    # tablebase an optional tablebase.Tablebase whose results replace the search of the positions it has,
+    # ordering False searches the moves of the main search in generation order (to measure what ordering.MoveOrderer
+    # saves), quiescence keeps MVV-LVA either way
+    def __init__(self, gs, evaluate=evaluate, tt=None, tablebase=None, ordering=True):
+        self.gs = gs
+        self.evaluate = evaluate
+        self.tt = tt
+        self.tablebase = tablebase
+        self.orderer = MoveOrderer() if ordering else None
+        self.nodes = 0
+        self.deadline = None
+        self.nodeLimit = None
+        # triangular principal variation table, pvTable[ply] is the best line (move codes) found from that ply
+        self.pvTable = []
+        # move code buffers of every ply (all moves, captures), reused by every node at that ply
+        self.buffers = []
+        self.captureBuffers = []
+        # pieces on the board (kings included), kept up to date by negamax so the tablebase is only probed when it
+        # can have the position
+        self.pieceCount = 0
+
+    # iterative deepening until the time or node budget runs out, returns the result of the last completed depth
+    # info is called with the SearchResult of every completed depth
+    def search(self, timeLimit=None, nodeLimit=None, maxDepth=64, info=None):
+        gs = self.gs
+        start = time.perf_counter()
+        self.deadline = start + timeLimit if timeLimit is not None else None
+        self.nodeLimit = nodeLimit
+        self.nodes = 0
+        if self.tt is not None:
+            self.tt.newSearch()
+        if self.orderer is not None:
+            self.orderer.newSearch()
+        rootMoves = gs.getValidMoveCodes()
+        self.pieceCount = sum(piece != "--" for rank in gs.board for piece in rank)
+        result = SearchResult(Move.fromCode(rootMoves[0]) if rootMoves else None, 0, 0, 0, 0.0, [])
+        if len(rootMoves) <= 1:
+            # nothing to think about
+            return result
+
+        pv = []
+        movesPlayed = len(gs.moveLog)
+        for depth in range(1, maxDepth + 1):
+            self.pvTable = [[] for ply in range(depth + 64)]
+            while len(self.buffers) < depth + 64:
+                self.buffers.append(array('I'))
+                self.captureBuffers.append(array('I'))
+            try:
+                score = self.negamax(depth, 0, -MATE_SCORE, MATE_SCORE, pv)
+            except SearchTimeout:
+                # unwind the moves the interrupted iteration left on the board
+                while len(gs.moveLog) > movesPlayed:
+                    gs.undoMove()
+                break
+            pv = self.pvTable[0]
+            pvMoves = [Move.fromCode(code) for code in pv]
+            result = SearchResult(pvMoves[0], score, depth, self.nodes, time.perf_counter() - start, pvMoves)
+            if info is not None:
+                info(result)
+            # a forced mate was found, searching deeper won't change the move
+            if abs(score) >= MATE_BOUND:
+                break
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        gs.getValidMoveCodes()  # restore checkmate / stalemate flags of the root position
+        return result
+
+    def checkLimits(self):
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            raise SearchTimeout()
+        if self.deadline is not None and self.nodes % CHECK_EVERY == 0 and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    # previousPv is the principal variation of the last iteration, searched first along its own line
+    def negamax(self, depth, ply, alpha, beta, previousPv):
+        gs = self.gs
+        self.nodes += 1
+        self.checkLimits()
+        self.pvTable[ply] = []
+
+        if ply > 0 and gs.repetitionCount() > 1:
+            return 0
+        if ply > 0 and self.tablebase is not None and self.pieceCount <= self.tablebase.maxPieces:
+            result = self.tablebase.probe(gs)
+            if result is not None:
+                # exact result, mates are scored by their distance like the ones the search finds
+                wdl, plies = result
+                return wdl * (MATE_SCORE - ply - plies)
+        if depth <= 0:
+            return self.quiescence(ply, alpha, beta)
+
+        tt = self.tt
+        hashMove = None
+        if tt is not None:
+            entry = tt.probe(gs.zobristKey)
+            if entry is not None:
+                ttDepth, bound, ttScore, hashMove = entry
+                # never cut at the root, it has to return a move
+                if ply > 0 and ttDepth >= depth:
+                    ttScore = scoreFromTable(ttScore, ply)
+                    if bound == EXACT or (bound == LOWER and ttScore >= beta) or (bound == UPPER and ttScore <= alpha):
+                        return ttScore
+
+        alphaOriginal = alpha
+        bestMove = None
+        pvMove = previousPv[ply] if ply < len(previousPv) else None
+        searched = 0
+        for move in orderedMoves(gs, self.orderer, ply, self.captureBuffers[ply], self.buffers[ply], pvMove, hashMove):
+            captured = isCapture(move)
+            gs.makeMove(move)
+            self.pieceCount -= captured
+            # only the first move at each ply follows the previous principal variation
+            score = -self.negamax(depth - 1, ply + 1, -beta, -alpha, previousPv if move == pvMove else [])
+            gs.undoMove()
+            self.pieceCount += captured
+            searched += 1
+            if score > alpha:
+                alpha = score
+                bestMove = move
+                self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                if alpha >= beta:
+                    if self.orderer is not None and not isCapture(move):
+                        self.orderer.addCutoff(move, ply, depth)
+                    break
+        if not searched:
+            # prefer the fastest mate
+            return -MATE_SCORE + ply if gs.inCheck else 0
+
+        if tt is not None:
+            if alpha >= beta:
+                bound = LOWER
+            elif alpha > alphaOriginal:
+                bound = EXACT
+            else:
+                bound = UPPER
+            tt.store(gs.zobristKey, depth, bound, scoreToTable(alpha, ply),
+                     bestMove & MOVE_MASK if bestMove is not None else None)
+        return alpha
+
+    # only captures, so the evaluation is never taken in the middle of an exchange
+    def quiescence(self, ply, alpha, beta):
+        gs = self.gs
+        self.nodes += 1
+        self.checkLimits()
+        self.pvTable[ply] = []
+
+        captures = sorted(gs.getCaptureCodes(self.buffers[ply]), key=mvvLva, reverse=True)
+        # without a capture only a king in check needs the quiet moves, to tell checkmate apart
+        # (stalemate is left to the main search, a quiet position just stands pat)
+        if not captures and gs.inCheck and not gs.getValidMoveCodes(self.buffers[ply]):
+            return -MATE_SCORE + ply
+        standPat = self.evaluate(gs)
+        if standPat >= beta:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+
+        for move in captures:
+            gs.makeMove(move)
+            score = -self.quiescence(ply + 1, -beta, -alpha)
+            gs.undoMove()
+            if score > alpha:
+                alpha = score
+                self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                if alpha >= beta:
+                    break
+        return alpha
+
+
+# book is an optional book.OpeningBook, a book move is played at once without searching
+def findBestMove(gs, timeLimit=None, nodeLimit=None, maxDepth=64, info=None, tt=None, book=None, tablebase=None):
+    if book is not None:
+        start = time.perf_counter()
+        code = book.pick(gs)
+        if code is not None:
+            move = Move.fromCode(code)
+            return SearchResult(move, 0, 0, 0, time.perf_counter() - start, [move])
+    return Searcher(gs, tt=tt, tablebase=tablebase).search(timeLimit, nodeLimit, maxDepth, info)
+
+
+def main():
+    from backends import BACKENDS, START_FEN, loadFen
+    from transposition import TranspositionTable, tableSizeFromConfig
+
+    parser = argparse.ArgumentParser(description="search the best move of a position")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="mailbox")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--time", type=float, default=None, help="time budget in seconds")
+    parser.add_argument("--nodes", type=int, default=None, help="node budget")
+    parser.add_argument("--depth", type=int, default=64)
+    parser.add_argument("--hash", type=int, default=tableSizeFromConfig(), help="transposition table size in MB, 0 disables it")
+    parser.add_argument("--book", default=None, help="opening book file (book.py), its moves are played without searching")
+    parser.add_argument("--tablebase", default=None, help="directory of endgame tables (tablebase.py)")
+    args = parser.parse_args()
+    if args.time is None and args.nodes is None and args.depth == 64:
+        args.time = 5.0
+
+    gs = loadFen(BACKENDS[args.backend](), args.fen)
+    tt = TranspositionTable(args.hash) if args.hash > 0 else None
+    book = None
+    if args.book is not None:
+        from book import OpeningBook
+        book = OpeningBook(args.book)
+    tablebase = None
+    if args.tablebase is not None:
+        from tablebase import Tablebase
+        tablebase = Tablebase(args.tablebase)
+    result = findBestMove(gs, args.time, args.nodes, args.depth, info=print, tt=tt, book=book, tablebase=tablebase)
+    print(f"bestmove {result.bestMove}  nodes {result.nodes}  nps {result.nps:.0f}  time {result.elapsed:.3f}s")
+    if tt is not None:
+        print("hash " + "  ".join(f"{name} {value:.3f}" if isinstance(value, float) else f"{name} {value}"
+                                  for name, value in tt.stats().items()))
+
+
+if __name__ == "__main__":
+    main()
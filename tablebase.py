@@ -0,0 +1,731 @@
+# Endgame tablebases of the two kings and at most two more pieces (KQvK, KRvK, KPvK, KBNvK, KQvKR...)
+# a table has one byte per position, holding the result for the side to move and its distance to mate in plies,
+# so a probe is one read of an mmap; positions are stored once per symmetry: the board is turned so the white king is
+# in the a1-d1-d4 triangle (462 king pairs) for tables without pawns, or on files a-d for tables with pawns
+# (1806 king pairs), and the index is side to move, king pair, then 6 bits for the square of every other piece
+# generation is retrograde analysis: a forward pass finds mates and stalemates, counts the moves that stay in the table
+# and scores the ones that leave it (captures and promotions, read from the smaller tables generated first), then the
+# results spread backwards one ply at a time through un-moves
+# both passes are split over a process pool, and generation can be stopped and started again: finished chunks of the
+# forward pass and a checkpoint of the backward pass are kept in a NAME.part directory until the table is written
+# positions are stored without castle rights or en passant captures
+# usage: python tablebase.py generate DIR [KQvK KRvK ...] [--pieces 3|4] [--workers N] [--checkpoint SECONDS]
+#        python tablebase.py probe DIR [--fen FEN]
+
+import argparse
+import mmap
+import os
+import pickle
+import struct
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from bitboard import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, ORTHOGONAL, DIAGONAL, WHITE, BLACK, \
+    _slidingAttacks, _squares
+
+MAGIC = b"CDTB"
+VERSION = 2
+# magic, version, number of pieces
+HEADER = struct.Struct("<4sHH")
+MAX_PIECES = 4
+# values of a table entry, for the side to move: DRAW, 1 to MAX_DISTANCE a win in that many plies,
+# LOSS + d a loss in d plies (LOSS itself is checkmate)
+DRAW = 0
+LOSS = 128
+MAX_DISTANCE = 125
+# not resolved yet while generating (a draw once generation ends), and impossible positions
+UNKNOWN = 254
+ILLEGAL = 255
+# piece order inside a table, and the material that decides which side is white in the table
+ORDER = "KQRBNp"
+MATERIAL = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'p': 1}
+PROMOTION_TYPES = "QRBN"
+# forward pass indices per pool task
+CHUNK = 1 << 16
+
+
+def pieceOrder(piece):
+    return (piece[0] == 'b', ORDER.index(piece[1]))
+
+
+# "KQvK" of a tuple of engine piece names, and back
+def signatureName(pieces):
+    white = "".join(piece[1].upper() for piece in pieces if piece[0] == 'w')
+    black = "".join(piece[1].upper() for piece in pieces if piece[0] == 'b')
+    return white + "v" + black
+
+
+def parseSignature(name):
+    white, sep, black = name.partition('v')
+    pieces = [color + ('p' if letter == 'P' else letter) for color, letters in (('w', white), ('b', black))
+              for letter in letters.upper()]
+    if not sep or any(piece[1] not in ORDER for piece in pieces) or pieces.count('wK') != 1 or pieces.count('bK') != 1:
+        raise ValueError(f"bad tablebase name: {name}")
+    if len(pieces) > MAX_PIECES:
+        raise ValueError(f"tablebases have at most {MAX_PIECES} pieces: {name}")
+    return canonicalPieces(pieces)
+
+
+def mirrorPiece(piece):
+    return ('b' if piece[0] == 'w' else 'w') + piece[1]
+
+
+# a table keeps the side with more material as white, the other colouring is read with the board mirrored
+def isMirrored(pieces):
+    def material(color):
+        kinds = sorted((piece[1] for piece in pieces if piece[0] == color), key=ORDER.index)
+        return sum(MATERIAL[kind] for kind in kinds), [-ORDER.index(kind) for kind in kinds]
+    return material('b') > material('w')
+
+
+def canonicalPieces(pieces):
+    if isMirrored(pieces):
+        pieces = [mirrorPiece(piece) for piece in pieces]
+    return tuple(sorted(pieces, key=pieceOrder))
+
+
+# pieces, squares and side to move of a position as its table stores it
+def canonical(pieces, squares, stm):
+    pairs = list(zip(pieces, squares))
+    if isMirrored(pieces):
+        pairs = [(mirrorPiece(piece), sq ^ 56) for piece, sq in pairs]
+        stm ^= 1
+    pairs.sort(key=lambda pair: pieceOrder(pair[0]))
+    return tuple(piece for piece, sq in pairs), tuple(sq for piece, sq in pairs), stm
+
+
+# square after symmetry t of the board: bit 2 swaps rows and cols, bit 1 mirrors the rows, bit 0 the cols
+def transformSquare(sq, t):
+    row, col = sq >> 3, sq & 7
+    if t & 4:
+        row, col = col, row
+    if t & 2:
+        row = 7 - row
+    if t & 1:
+        col = 7 - col
+    return row * 8 + col
+
+
+# a king pair is stored when the white king is in the a1-d1-d4 triangle (rows 4-7, cols 0-3, on or below the a1-h8
+# diagonal) and, with the white king on that diagonal, the black king is on or below it too;
+# with pawns only the cols can be mirrored, the white king has to be on files a-d
+def isStoredPair(whiteKing, blackKing, pawns):
+    row, col = whiteKing >> 3, whiteKing & 7
+    if pawns:
+        return col <= 3
+    if col > 3 or row < 4 or row + col < 7:
+        return False
+    return row + col > 7 or (blackKing >> 3) + (blackKing & 7) >= 7
+
+
+# symmetries allowed for a table, and its king pairs: list of (white king, black king) and the index of each
+def _kingPairs(pawns):
+    pairs = [(whiteKing, blackKing) for whiteKing in range(64) for blackKing in range(64)
+             if not KING_ATTACKS[whiteKing] >> blackKing & 1 and whiteKing != blackKing
+             and isStoredPair(whiteKing, blackKing, pawns)]
+    return (range(2) if pawns else range(8)), pairs, {pair: i for i, pair in enumerate(pairs)}
+
+
+KING_PAIRS = {False: _kingPairs(False), True: _kingPairs(True)}
+
+
+# how a table of pieces is stored: (king pair table, index of the white and black king, indices of the other pieces)
+def tableLayout(pieces):
+    kings = (pieces.index('wK'), pieces.index('bK'))
+    others = [i for i in range(len(pieces)) if i not in kings]
+    return KING_PAIRS[any(piece[1] == 'p' for piece in pieces)], kings, others
+
+
+def tableSize(pieces):
+    (transforms, pairs, pairIndex), kings, others = tableLayout(pieces)
+    return 2 * len(pairs) << (6 * len(others))
+
+
+# index in the table file of a canonical position, None for kings next to each other
+def storedIndex(pieces, squares, stm):
+    (transforms, pairs, pairIndex), kings, others = tableLayout(pieces)
+    whiteKing, blackKing = squares[kings[0]], squares[kings[1]]
+    for t in transforms:
+        pair = (transformSquare(whiteKing, t), transformSquare(blackKing, t))
+        if pair in pairIndex:
+            index = stm * len(pairs) + pairIndex[pair]
+            for i in others:
+                index = (index << 6) | transformSquare(squares[i], t)
+            return index
+    return None
+
+
+# table file of the values of a generated table (indexed by positionIndex), one byte per stored position
+def storedValues(pieces, values):
+    (transforms, pairs, pairIndex), kings, others = tableLayout(pieces)
+    stored = bytearray(tableSize(pieces))
+    squares = [0] * len(pieces)
+    i = 0
+    for stm in (WHITE, BLACK):
+        for whiteKing, blackKing in pairs:
+            squares[kings[0]] = whiteKing
+            squares[kings[1]] = blackKing
+            for rest in range(1 << (6 * len(others))):
+                for j in reversed(others):
+                    squares[j] = rest & 63
+                    rest >>= 6
+                stored[i] = values[positionIndex(squares, stm)]
+                i += 1
+    return stored
+
+
+# index of a position while generating its table: side to move, then 6 bits for the square of every piece
+def positionIndex(squares, stm):
+    index = stm
+    for sq in squares:
+        index = (index << 6) | sq
+    return index
+
+
+def indexPosition(index, count):
+    squares = [0] * count
+    for i in range(count - 1, -1, -1):
+        squares[i] = index & 63
+        index >>= 6
+    return squares, index
+
+
+# (wdl, plies) of a table value: wdl is 1 for a win, 0 for a draw, -1 for a loss of the side to move
+def decodeValue(value):
+    if value == DRAW or value == UNKNOWN:
+        return 0, 0
+    if value >= LOSS:
+        return -1, value - LOSS
+    return 1, value
+
+
+def encodeValue(wdl, plies):
+    if wdl == 0:
+        return DRAW
+    return plies if wdl > 0 else LOSS + plies
+
+
+# value of a position from the value of the position after one of its moves (for the other side)
+def backValue(value):
+    if value == DRAW:
+        return DRAW
+    if value >= LOSS:
+        return value - LOSS + 1
+    return LOSS + value + 1
+
+
+# ordering of values for the side to move: faster wins first, slower losses before faster ones
+def valueRank(value):
+    if value == DRAW:
+        return 0
+    if value >= LOSS:
+        return -1000 + value - LOSS
+    return 1000 - value
+
+
+def attacks(piece, sq, occupied):
+    kind = piece[1]
+    if kind == 'K':
+        return KING_ATTACKS[sq]
+    if kind == 'N':
+        return KNIGHT_ATTACKS[sq]
+    if kind == 'p':
+        return PAWN_ATTACKS[WHITE if piece[0] == 'w' else BLACK][sq]
+    result = 0
+    if kind != 'B':
+        result |= _slidingAttacks(sq, occupied, ORTHOGONAL)
+    if kind != 'R':
+        result |= _slidingAttacks(sq, occupied, DIAGONAL)
+    return result
+
+
+def isAttacked(sq, color, pieces, squares, occupied):
+    for piece, origin in zip(pieces, squares):
+        if piece[0] == color and attacks(piece, origin, occupied) >> sq & 1:
+            return True
+    return False
+
+
+# (pieces, squares, stays in the table) after every legal move of the side to move; a move stays in the table
+# when it neither captures nor promotes, then pieces are unchanged and only squares differs
+def successors(pieces, squares, stm):
+    color = 'w' if stm == WHITE else 'b'
+    enemy = 'b' if stm == WHITE else 'w'
+    occupied = own = 0
+    for piece, sq in zip(pieces, squares):
+        occupied |= 1 << sq
+        if piece[0] == color:
+            own |= 1 << sq
+    king = squares[pieces.index(color + 'K')]
+    for i, piece in enumerate(pieces):
+        if piece[0] != color:
+            continue
+        start = squares[i]
+        if piece[1] == 'p':
+            targets = PAWN_ATTACKS[stm][start] & occupied & ~own
+            step = -8 if stm == WHITE else 8
+            push = start + step
+            if not occupied >> push & 1:
+                targets |= 1 << push
+                if start >> 3 == (6 if stm == WHITE else 1) and not occupied >> (push + step) & 1:
+                    targets |= 1 << (push + step)
+        else:
+            targets = attacks(piece, start, occupied) & ~own
+        for end in _squares(targets):
+            newPieces = list(pieces)
+            newSquares = list(squares)
+            newSquares[i] = end
+            moving = i
+            captured = occupied >> end & 1
+            if captured:
+                j = squares.index(end)
+                del newPieces[j]
+                del newSquares[j]
+                if j < i:
+                    moving -= 1
+            if isAttacked(end if piece[1] == 'K' else king, enemy, newPieces, newSquares,
+                          (occupied & ~(1 << start)) | (1 << end)):
+                continue
+            if piece[1] == 'p' and end >> 3 in (0, 7):
+                for kind in PROMOTION_TYPES:
+                    newPieces[moving] = color + kind
+                    yield tuple(newPieces), tuple(newSquares), False
+            else:
+                yield tuple(newPieces), tuple(newSquares), not captured
+
+
+# indices of the positions one un-move before the position, with the other side to move (no captures or promotions)
+def predecessors(pieces, squares, stm):
+    mover = stm ^ 1
+    color = 'w' if mover == WHITE else 'b'
+    occupied = 0
+    for sq in squares:
+        occupied |= 1 << sq
+    squares = list(squares)
+    for i, piece in enumerate(pieces):
+        if piece[0] != color:
+            continue
+        end = squares[i]
+        if piece[1] == 'p':
+            back = 8 if mover == WHITE else -8
+            starts = []
+            start = end + back
+            if 1 <= start >> 3 <= 6 and not occupied >> start & 1:
+                starts.append(start)
+                # a double step from the starting row
+                if end >> 3 == (4 if mover == WHITE else 3) and not occupied >> (start + back) & 1:
+                    starts.append(start + back)
+        else:
+            starts = _squares(attacks(piece, end, occupied) & ~occupied)
+        for start in starts:
+            squares[i] = start
+            yield positionIndex(squares, mover)
+        squares[i] = end
+
+
+# dependencies of a table: the tables its captures and promotions lead to
+def subtables(pieces):
+    result = set()
+    for i, piece in enumerate(pieces):
+        if piece[1] != 'K':
+            result.add(canonicalPieces(pieces[:i] + pieces[i + 1:]))
+        if piece[1] == 'p':
+            for kind in PROMOTION_TYPES:
+                promoted = pieces[:i] + (piece[0] + kind,) + pieces[i + 1:]
+                result.add(canonicalPieces(promoted))
+                for j, other in enumerate(promoted):
+                    if other[0] != piece[0] and other[1] != 'K':
+                        result.add(canonicalPieces(promoted[:j] + promoted[j + 1:]))
+    return {sub for sub in result if len(sub) > 2}
+
+
+# every table of up to count pieces
+def allSignatures(count):
+    extras = [color + kind for color in "wb" for kind in ORDER[1:]]
+    signatures = set()
+
+    def add(pieces, first):
+        if len(pieces) > 2:
+            signatures.add(canonicalPieces(pieces))
+        if len(pieces) < count:
+            for k in range(first, len(extras)):
+                add(pieces + (extras[k],), k)
+    add(('wK', 'bK'), 0)
+    return signatures
+
+
+class Tablebase():
+    def __init__(self, directory):
+        self.directory = directory
+        # name -> mmap of the table, None when the file isn't there
+        self.tables = {}
+        self.hits = 0
+        # most pieces of a table in the directory (the bare kings need none), positions with more are never probed
+        self.maxPieces = 2
+        if os.path.isdir(directory):
+            for entry in os.listdir(directory):
+                name, ext = os.path.splitext(entry)
+                try:
+                    if ext == ".tb":
+                        self.maxPieces = max(self.maxPieces, len(parseSignature(name)))
+                except ValueError:
+                    pass
+
+    def path(self, name):
+        return os.path.join(self.directory, name + ".tb")
+
+    def table(self, name):
+        if name not in self.tables:
+            table = None
+            path = self.path(name)
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, version, count = HEADER.unpack_from(table, 0)
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError(f"not a tablebase (version {VERSION}): {path}")
+            self.tables[name] = table
+        return self.tables[name]
+
+    # table value of a position for the side to move, None when its table isn't available
+    def value(self, pieces, squares, stm):
+        if len(pieces) == 2:
+            return DRAW
+        pieces, squares, stm = canonical(pieces, squares, stm)
+        table = self.table(signatureName(pieces))
+        if table is None:
+            return None
+        index = storedIndex(pieces, squares, stm)
+        if index is None:
+            return ILLEGAL
+        return table[HEADER.size + index]
+
+    # (wdl, plies to mate) of the position of gs for the side to move, None when it isn't in the tables
+    def probe(self, gs):
+        if gs.whiteCastleKingside or gs.whiteCastleQueenside or gs.blackCastleKingside or gs.blackCastleQueenside:
+            return None
+        pieces = []
+        squares = []
+        flip = 56 if gs.playerWantsToPlayAsBlack else 0
+        for row, rank in enumerate(gs.board):
+            for col, piece in enumerate(rank):
+                if piece != "--":
+                    if len(pieces) == MAX_PIECES:
+                        return None
+                    pieces.append(piece)
+                    squares.append((row * 8 + col) ^ flip)
+        if gs.enpasantPossible:
+            # the tables have no en passant captures, one ply is searched instead
+            value = self.searchValue(gs)
+        else:
+            value = self.value(pieces, squares, WHITE if gs.whiteToMove else BLACK)
+        if value is None or value == ILLEGAL:
+            return None
+        self.hits += 1
+        return decodeValue(value)
+
+    def searchValue(self, gs):
+        best = None
+        for code in gs.getValidMoveCodes().tolist():
+            gs.makeMove(code)
+            result = self.probe(gs)
+            gs.undoMove()
+            if result is None:
+                return None
+            wdl, plies = result
+            value = backValue(encodeValue(wdl, plies))
+            if best is None or valueRank(value) > valueRank(best):
+                best = value
+        gs.getValidMoveCodes()
+        if best is None:
+            return LOSS if gs.inCheck else DRAW
+        return best
+
+    # move code that keeps the best table result (mates fastest, loses slowest), None when the position isn't covered
+    def bestMove(self, gs):
+        best = bestRank = None
+        for code in gs.getValidMoveCodes().tolist():
+            gs.makeMove(code)
+            result = self.probe(gs)
+            gs.undoMove()
+            if result is None:
+                return None
+            rank = valueRank(backValue(encodeValue(*result)))
+            if best is None or rank > bestRank:
+                best, bestRank = code, rank
+        gs.getValidMoveCodes()
+        return best
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+
+# tablebase of the smaller tables, opened once in every pool process
+_subtables = None
+
+
+def _getSubtables(directory):
+    global _subtables
+    if _subtables is None or _subtables.directory != directory:
+        _subtables = Tablebase(directory)
+    return _subtables
+
+
+# forward pass over indices [start, stop) of a table, written to a chunk file of the .part directory
+# values: ILLEGAL, DRAW (stalemate, or only drawn moves out of the table) or UNKNOWN
+# counts: legal moves that stay in the table, bestOut: best value of the moves that leave it (UNKNOWN if none)
+# seeds: (index, value) of positions whose value is known once the backward pass reaches its distance
+def forwardChunk(task):
+    pieces, start, stop, directory, chunkPath = task
+    subtables = _getSubtables(directory)
+    count = len(pieces)
+    pawns = [i for i, piece in enumerate(pieces) if piece[1] == 'p']
+    kings = (pieces.index('wK'), pieces.index('bK'))
+    values = bytearray([ILLEGAL]) * (stop - start)
+    counts = bytearray(stop - start)
+    bestOut = bytearray([UNKNOWN]) * (stop - start)
+    seeds = []
+    for index in range(start, stop):
+        squares, stm = indexPosition(index, count)
+        occupied = 0
+        for sq in squares:
+            occupied |= 1 << sq
+        if bin(occupied).count('1') != count or any(squares[i] >> 3 in (0, 7) for i in pawns):
+            continue
+        # the side that just moved can't be in check
+        enemyKing = squares[kings[stm ^ 1]]
+        if isAttacked(enemyKing, 'w' if stm == WHITE else 'b', pieces, squares, occupied):
+            continue
+        moves = 0
+        inTable = 0
+        best = None
+        for newPieces, newSquares, stays in successors(pieces, squares, stm):
+            moves += 1
+            if stays:
+                inTable += 1
+                continue
+            value = subtables.value(newPieces, newSquares, stm ^ 1)
+            if value is None:
+                raise FileNotFoundError(f"missing tablebase {signatureName(canonicalPieces(newPieces))}")
+            value = backValue(value)
+            if best is None or valueRank(value) > valueRank(best):
+                best = value
+        offset = index - start
+        counts[offset] = inTable
+        if moves == 0:
+            king = squares[kings[stm]]
+            if isAttacked(king, 'b' if stm == WHITE else 'w', pieces, squares, occupied):
+                values[offset] = UNKNOWN
+                seeds.append((index, LOSS))
+            else:
+                values[offset] = DRAW
+            continue
+        values[offset] = UNKNOWN
+        if best is not None:
+            bestOut[offset] = best
+            if inTable == 0 and best == DRAW:
+                values[offset] = DRAW
+            elif best != DRAW and (inTable == 0 or best < LOSS):
+                # a win out of the table, or the only moves there are
+                seeds.append((index, best))
+    with open(chunkPath + ".tmp", "wb") as f:
+        pickle.dump((bytes(values), bytes(counts), bytes(bestOut), seeds), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(chunkPath + ".tmp", chunkPath)
+    return chunkPath
+
+
+# predecessor indices (with repeats, one per un-move) of a batch of positions of a table
+def predecessorChunk(task):
+    pieces, indices = task
+    count = len(pieces)
+    result = array('I')
+    for index in indices:
+        squares, stm = indexPosition(index, count)
+        result.extend(predecessors(pieces, squares, stm))
+    return result
+
+
+def _distance(value):
+    return value - LOSS if value >= LOSS else value
+
+
+# generates one table into directory (its subtables have to be there already), resuming from its .part directory
+def generateTable(pieces, directory, executor=None, checkpointSeconds=60.0, report=print):
+    name = signatureName(pieces)
+    path = os.path.join(directory, name + ".tb")
+    if os.path.exists(path):
+        return path
+    partDir = os.path.join(directory, name + ".part")
+    os.makedirs(partDir, exist_ok=True)
+    size = 2 << (6 * len(pieces))
+    statePath = os.path.join(partDir, "state")
+    start = time.perf_counter()
+
+    if os.path.exists(statePath):
+        with open(statePath, "rb") as f:
+            level, values, counts, bestOut, frontier, pending = pickle.load(f)
+        report(f"{name}: resuming at ply {level + 1}")
+    else:
+        # forward pass, chunks already on disk are kept
+        tasks = []
+        chunkPaths = []
+        for chunkStart in range(0, size, CHUNK):
+            chunkPath = os.path.join(partDir, f"chunk-{chunkStart // CHUNK:05d}")
+            chunkPaths.append(chunkPath)
+            if not os.path.exists(chunkPath):
+                tasks.append((pieces, chunkStart, min(chunkStart + CHUNK, size), directory, chunkPath))
+        if executor is not None:
+            list(executor.map(forwardChunk, tasks))
+        else:
+            for task in tasks:
+                forwardChunk(task)
+        values = bytearray()
+        counts = bytearray()
+        bestOut = bytearray()
+        pending = {}
+        for chunkPath in chunkPaths:
+            with open(chunkPath, "rb") as f:
+                chunkValues, chunkCounts, chunkBestOut, seeds = pickle.load(f)
+            values += chunkValues
+            counts += chunkCounts
+            bestOut += chunkBestOut
+            for index, value in seeds:
+                pending.setdefault(_distance(value), []).append((index, value))
+        level = -1
+        frontier = array('I')
+        report(f"{name}: forward pass {time.perf_counter() - start:.1f}s")
+
+    # backward pass, frontier holds the positions resolved at the previous ply
+    lastCheckpoint = time.perf_counter()
+    longest = max(level, 0)
+    while frontier or pending:
+        level += 1
+        if level > MAX_DISTANCE:
+            raise ValueError(f"{name}: distance to mate over {MAX_DISTANCE} plies")
+        resolved = array('I')
+        if frontier:
+            winning = values[frontier[0]] >= LOSS
+            if executor is not None and len(frontier) > CHUNK:
+                batches = executor.map(predecessorChunk, [(pieces, frontier[i:i + CHUNK])
+                                                          for i in range(0, len(frontier), CHUNK)])
+            else:
+                batches = [predecessorChunk((pieces, frontier))]
+            for batch in batches:
+                for index in batch:
+                    if values[index] != UNKNOWN:
+                        continue
+                    if winning:
+                        # a move to a lost position wins
+                        values[index] = level
+                        resolved.append(index)
+                        continue
+                    counts[index] -= 1
+                    if counts[index]:
+                        continue
+                    # every move in the table loses, the best move out of the table decides
+                    out = bestOut[index]
+                    if out == UNKNOWN or out >= LOSS:
+                        distance = level if out == UNKNOWN else max(level, out - LOSS)
+                        if distance == level:
+                            values[index] = LOSS + level
+                            resolved.append(index)
+                        else:
+                            pending.setdefault(distance, []).append((index, LOSS + distance))
+        for index, value in pending.pop(level, ()):
+            if values[index] == UNKNOWN:
+                values[index] = value
+                resolved.append(index)
+        frontier = resolved
+        if resolved:
+            longest = level
+        if time.perf_counter() - lastCheckpoint >= checkpointSeconds:
+            with open(statePath + ".tmp", "wb") as f:
+                pickle.dump((level, values, counts, bestOut, frontier, pending), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(statePath + ".tmp", statePath)
+            lastCheckpoint = time.perf_counter()
+
+    # what was never resolved is a draw
+    values = values.replace(bytes([UNKNOWN]), bytes([DRAW]))
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(pieces)))
+        f.write(storedValues(pieces, values))
+    os.replace(path + ".tmp", path)
+    for entry in os.listdir(partDir):
+        os.remove(os.path.join(partDir, entry))
+    os.rmdir(partDir)
+    report(f"{name}: longest mate {longest} plies  time {time.perf_counter() - start:.1f}s")
+    return path
+
+
+# generates the tables and every table they depend on, smallest first
+def generate(signatures, directory, workers=None, checkpointSeconds=60.0, report=print):
+    os.makedirs(directory, exist_ok=True)
+    order = []
+
+    def visit(pieces):
+        if pieces in order:
+            return
+        for sub in sorted(subtables(pieces), key=lambda sub: (len(sub), sub)):
+            visit(sub)
+        order.append(pieces)
+    for pieces in sorted(signatures, key=lambda pieces: (len(pieces), pieces)):
+        visit(pieces)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        for pieces in order:
+            generateTable(pieces, directory, executor, checkpointSeconds, report)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return [signatureName(pieces) for pieces in order]
+
+
+def main():
+    from backends import BACKENDS, START_FEN, loadFen
+
+    parser = argparse.ArgumentParser(description="generate or probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("generate", help="generate tables and the tables they depend on")
+    build.add_argument("directory")
+    build.add_argument("tables", nargs="*", help="table names like KQvK or KBNvK")
+    build.add_argument("--pieces", type=int, choices=(3, 4), default=None, help="every table of up to this many pieces")
+    build.add_argument("--workers", type=int, default=os.cpu_count())
+    build.add_argument("--checkpoint", type=float, default=60.0, help="seconds between checkpoints of the backward pass")
+    probe = commands.add_parser("probe", help="result and best move of a position")
+    probe.add_argument("directory")
+    probe.add_argument("--fen", default=START_FEN)
+    probe.add_argument("--backend", choices=sorted(BACKENDS), default="mailbox")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        signatures = {parseSignature(name) for name in args.tables}
+        if args.pieces is not None:
+            signatures |= allSignatures(args.pieces)
+        if not signatures:
+            parser.error("give table names or --pieces")
+        start = time.perf_counter()
+        names = generate(signatures, args.directory, args.workers, args.checkpoint)
+        print(f"tables {len(names)}  time {time.perf_counter() - start:.1f}s")
+        return 0
+
+    from pgn import san
+    gs = loadFen(BACKENDS[args.backend](), args.fen)
+    tablebase = Tablebase(args.directory)
+    start = time.perf_counter()
+    result = tablebase.probe(gs)
+    elapsed = time.perf_counter() - start
+    if result is None:
+        print("not in the tablebase")
+        return 1
+    wdl, plies = result
+    move = tablebase.bestMove(gs)
+    text = {1: f"win, mate in {plies} plies", 0: "draw", -1: f"loss, mated in {plies} plies"}[wdl]
+    print(f"{text}  best move {san(gs, move) if move is not None else '-'}  probe {elapsed * 1e6:.0f}us")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,58 @@
+# Shared by the tests: the repository root on sys.path (the modules are scripts, not a package) and helpers to play games
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# the second game has an illegal move, the third a broken FEN tag
+BAD_GAMES_PGN = """[White "a"]
+[Black "b"]
+[Result "0-1"]
+
+1. f3 e5 2. g4 Qh4# 0-1
+
+[White "c"]
+[Black "d"]
+[Result "1-0"]
+
+1. e4 e5 2. Ke3 1-0
+
+[White "e"]
+[Black "f"]
+[FEN "8/8/8 w - - 0 1"]
+[Result "*"]
+
+*
+
+[White "g"]
+[Black "h"]
+[Result "*"]
+
+1. d4 d5 *
+"""
+
+
+# plays moves in UCI notation ("e2e4") through a controller.GameController, like clicks on the board
+def _playUci(controller, names):
+    for name in names:
+        start = (8 - int(name[1]), "abcdefgh".index(name[0]))
+        end = (8 - int(name[3]), "abcdefgh".index(name[2]))
+        move = controller.find_move(start, end)
+        assert move is not None, name
+        controller.make_move(move)
+        controller.update()
+
+
+@pytest.fixture
+def playUci():
+    return _playUci
+
+
+# path of a PGN file with two good games and two bad ones (BAD_GAMES_PGN)
+@pytest.fixture
+def badGamesPgn(tmp_path):
+    path = tmp_path / "bad.pgn"
+    path.write_text(BAD_GAMES_PGN, encoding="utf-8")
+    return path
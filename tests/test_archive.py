@@ -0,0 +1,108 @@
+# Regressions of archive.py: appendArchive keeps the games already in the file and the state of the finished game
+
+import pytest
+
+from engine import GameState
+from bitboard import BitboardGameState
+from controller import GameController
+from archive import GameArchive, HEADER, appendArchive, convertPgn
+
+FOOLS_MATE = ("f2f3", "e7e5", "g2g4", "d8h4")
+SCHOLARS_MATE = ("e2e4", "e7e5", "f1c4", "b8c6", "d1h5", "g8f6", "h5f7")
+
+
+@pytest.mark.parametrize("backend", [GameState, BitboardGameState])
+def test_append_archive(tmp_path, backend, playUci):
+    path = str(tmp_path / "saves" / "games.cdga")
+    games = []
+    for names, result in ((FOOLS_MATE, "0-1"), (SCHOLARS_MATE, "1-0")):
+        controller = GameController(backend, show_timer=True, timer_minutes=5)
+        playUci(controller, names)
+        assert controller.result == result
+        count = appendArchive(path, controller.gs, controller.result, {"Event": "test"}, controller.timer, backup=True)
+        assert count == len(games) + 1
+        # the finished game still shows its result
+        assert controller.gs.checkmate
+        controller.update()
+        assert controller.result == result
+        games.append((list(controller.gs.moveLog), result))
+
+    with GameArchive(path) as archive:
+        assert len(archive) == 2
+        for (codes, result), game in zip(games, archive):
+            assert game.result == result
+            assert game.tags["Event"] == "test"
+            assert game.clocks is not None and not game.stopwatch
+            assert list(game.replay(backend).moveLog) == codes
+    # the backup gets every game as well
+    with GameArchive(path + ".bak") as backup:
+        assert [game.result for game in backup] == ["0-1", "1-0"]
+
+
+def test_convert_skips_bad_games(tmp_path, badGamesPgn):
+    errors = []
+    assert convertPgn(str(badGamesPgn), str(tmp_path / "games.cdga"), errors=errors) == 2
+    assert len(errors) == 2
+    with GameArchive(str(tmp_path / "games.cdga")) as archive:
+        assert [game.tags["White"] for game in archive] == ["a", "g"]
+
+
+# controller of a finished game of the mailbox backend
+@pytest.fixture
+def finishedGame(playUci):
+    def play(names):
+        controller = GameController(GameState)
+        playUci(controller, names)
+        return controller
+    return play
+
+
+def test_append_keeps_records_in_place(tmp_path, finishedGame):
+    path = str(tmp_path / "games.cdga")
+    controller = finishedGame(FOOLS_MATE)
+    appendArchive(path, controller.gs, controller.result)
+    with open(path, "rb") as f:
+        first = f.read()
+    with GameArchive(path) as archive:
+        recordEnd = archive.dataEnd()
+    controller = finishedGame(SCHOLARS_MATE)
+    assert appendArchive(path, controller.gs, controller.result) == 2
+    with open(path, "rb") as f:
+        second = f.read()
+    # only the header and the index change, the first game stays where it was
+    assert second[HEADER.size:recordEnd] == first[HEADER.size:recordEnd]
+
+
+def test_damaged_index_is_rebuilt(tmp_path, finishedGame):
+    path = str(tmp_path / "games.cdga")
+    for names in (FOOLS_MATE, SCHOLARS_MATE):
+        controller = finishedGame(names)
+        appendArchive(path, controller.gs, controller.result)
+    # an append cut off after writing its game over the old index, before the new index and the header
+    with GameArchive(path) as archive:
+        indexOffset = archive.indexOffset
+    with open(path, "r+b") as f:
+        f.seek(indexOffset)
+        f.write(b"\xff" * 12)
+        f.truncate()
+    with GameArchive(path) as archive:
+        assert [game.result for game in archive] == ["0-1", "1-0"]
+    # the next append writes a good index again
+    controller = finishedGame(FOOLS_MATE)
+    assert appendArchive(path, controller.gs, controller.result) == 3
+    with GameArchive(path) as archive:
+        assert archive.indexIsValid()
+        assert [game.result for game in archive] == ["0-1", "1-0", "0-1"]
+
+
+def test_truncated_archive_raises_value_error(tmp_path, finishedGame):
+    path = str(tmp_path / "games.cdga")
+    controller = finishedGame(FOOLS_MATE)
+    appendArchive(path, controller.gs, controller.result)
+    with open(path, "rb") as f:
+        data = f.read()
+    for length in (0, HEADER.size - 4, HEADER.size + 6):
+        with open(path, "wb") as f:
+            f.write(data[:length])
+        with pytest.raises(ValueError):
+            GameArchive(path)
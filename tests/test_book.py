@@ -0,0 +1,67 @@
+# Opening books of book.py: built from PGN games with the results as weights, probed from either board orientation
+
+import random
+import pytest
+
+from engine import GameState
+from bitboard import BitboardGameState
+from book import OpeningBook, bookRecords, buildBook
+from pgn import san, parseSan
+
+GAMES_PGN = """[Result "1-0"]
+
+1. e4 e5 2. Nf3 1-0
+
+[Result "0-1"]
+
+1. e4 c5 0-1
+
+[Result "1/2-1/2"]
+
+1. d4 d5 1/2-1/2
+"""
+
+
+@pytest.fixture
+def bookPath(tmp_path):
+    pgnPath = tmp_path / "games.pgn"
+    pgnPath.write_text(GAMES_PGN, encoding="utf-8")
+    path = str(tmp_path / "games.book")
+    buildBook(bookRecords([str(pgnPath)]), path)
+    return path
+
+
+def bookMoves(book, gs):
+    return sorted((san(gs, code), weight) for code, weight in book.moves(gs))
+
+
+@pytest.mark.parametrize("backend", [GameState, BitboardGameState])
+def test_book_probe(bookPath, backend):
+    with OpeningBook(bookPath) as book:
+        gs = backend()
+        # a win weighs 2 for the winner and 0 for the loser, a draw 1 for both
+        assert bookMoves(book, gs) == [("d4", 1), ("e4", 2)]
+        gs.makeMove(parseSan(gs, "e4"))
+        # 1... e5 lost, so it isn't played
+        assert bookMoves(book, gs) == [("c5", 2)]
+        assert san(gs, book.pick(gs)) == "c5"
+        gs.makeMove(parseSan(gs, "c5"))
+        assert book.pick(gs) is None
+        assert (book.probes, book.hits) == (2, 1)
+
+
+def test_flipped_book_probe(bookPath):
+    with OpeningBook(bookPath) as book:
+        gs = GameState.from_fen("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", True)
+        assert bookMoves(book, gs) == [("d4", 1), ("e4", 2)]
+        gs.makeMove(parseSan(gs, "d4"))
+        assert bookMoves(book, gs) == [("d5", 1)]
+
+
+def test_book_pick_follows_weights(bookPath):
+    with OpeningBook(bookPath) as book:
+        gs = GameState()
+        rng = random.Random(3)
+        picks = [san(gs, book.pick(gs, rng)) for n in range(300)]
+        assert set(picks) == {"e4", "d4"}
+        assert 150 < picks.count("e4") < 250
@@ -0,0 +1,104 @@
+# GameState of both backends: FEN round trips, Zobrist keys kept up to date by makeMove / undoMove, and the
+# orientation of flipped boards
+
+import random
+import pytest
+
+from engine import GameState, Move, zobristKey
+from bitboard import BitboardGameState
+from perft import REFERENCE_POSITIONS
+
+BACKENDS = [GameState, BitboardGameState]
+# a position with an en passant square, and one with only some castle rights and move counters
+EXTRA_FENS = ["rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+              "r3k2r/8/8/8/8/8/8/R3K2R b Kq - 7 42"]
+FENS = [fen for name, fen, counts in REFERENCE_POSITIONS] + EXTRA_FENS
+
+# white pawn on b7 (row 6 with white at the top), black king on h8, white king on a1
+FLIPPED_PROMOTION_FEN = "7k/1P6/8/8/8/8/8/K7 w - - 0 1"
+
+
+def promotions(gs):
+    return [Move.fromCode(code) for code in gs.getValidMoveCodes() if Move.fromCode(code).isPawnPromotion]
+
+
+def test_flipped_promotions_survive_new_game_state():
+    gs = GameState.from_fen(FLIPPED_PROMOTION_FEN, True)
+    # another game state (a worker, a search) must not change the orientation of this one
+    GameState()
+    GameState.from_fen(FLIPPED_PROMOTION_FEN)
+    assert len(promotions(gs)) == 4
+    assert {move.endRow for move in promotions(gs)} == {7}
+
+
+def test_flipped_move_from_squares_promotes():
+    gs = GameState.from_fen(FLIPPED_PROMOTION_FEN, True)
+    GameState()
+    move = Move((6, 1), (7, 1), gs.board, promotionRows=gs.promotionRows)
+    assert move.isPawnPromotion
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("fen", FENS)
+def test_fen_round_trip(backend, fen):
+    assert backend.from_fen(fen).to_fen() == fen
+
+
+@pytest.mark.parametrize("fen", FENS)
+def test_flipped_fen_round_trip(fen):
+    gs = GameState.from_fen(fen, True)
+    assert gs.to_fen() == fen
+    # the same position, only turned round
+    assert gs.board == GameState.from_fen(fen).board[::-1]
+
+
+def fullKey(gs):
+    return zobristKey(gs.board, gs.whiteToMove, (gs.whiteCastleKingside, gs.whiteCastleQueenside,
+                      gs.blackCastleKingside, gs.blackCastleQueenside), gs.enpasantPossible)
+
+
+# random games from every position: the key makeMove / undoMove update has to match the key computed from scratch
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_zobrist_incremental_matches_full(backend):
+    rng = random.Random(7)
+    for fen in FENS:
+        gs = backend.from_fen(fen)
+        keys = [gs.zobristKey]
+        assert gs.zobristKey == fullKey(gs)
+        for ply in range(40):
+            moves = gs.getValidMoveCodes().tolist()
+            if not moves:
+                break
+            gs.makeMove(rng.choice(moves))
+            assert gs.zobristKey == fullKey(gs), gs.to_fen()
+            keys.append(gs.zobristKey)
+        while gs.moveLog:
+            keys.pop()
+            gs.undoMove()
+            assert gs.zobristKey == keys[-1]
+        assert gs.zobristKey == fullKey(gs)
+
+
+# move codes of moves in UCI notation ("g1f3") played on gs (white at the bottom)
+def playMoves(gs, names):
+    for name in names:
+        start = (8 - int(name[1])) * 8 + "abcdefgh".index(name[0])
+        end = (8 - int(name[3])) * 8 + "abcdefgh".index(name[2])
+        code, = [code for code in gs.getValidMoveCodes() if code & 63 == start and (code >> 6) & 63 == end]
+        gs.makeMove(code)
+    return gs
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_zobrist_transpositions(backend):
+    start = backend().zobristKey
+    # the same position by another move order has the same key
+    assert playMoves(backend(), ["g1f3", "b8c6", "b1c3"]).zobristKey == \
+        playMoves(backend(), ["b1c3", "b8c6", "g1f3"]).zobristKey
+    # back to the start position, with the same side to move and the same rights
+    gs = playMoves(backend(), ["g1f3", "g8f6", "f3g1", "f6g8"])
+    assert gs.zobristKey == start
+    assert gs.repetitionCount() == 2
+    # the kings went back but their castle rights are gone
+    gs = playMoves(backend(), ["e2e4", "e7e5", "e1e2", "e8e7", "e2e1", "e7e8"])
+    assert gs.zobristKey != playMoves(backend(), ["e2e4", "e7e5"]).zobristKey
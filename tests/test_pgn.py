@@ -0,0 +1,99 @@
+# Regressions of pgn.py: writing a finished game must leave the controller and its GameState as they were,
+# one bad game must not stop the replay of a whole file, and SAN names moves with only the hints it needs
+
+import pytest
+
+from engine import GameState
+from bitboard import BitboardGameState
+from controller import GameController
+from pgn import appendGame, readPgn, replayPgn, san, parseSan, squareIndex
+
+FOOLS_MATE = ("f2f3", "e7e5", "g2g4", "d8h4")
+# black to move and stalemated after Qg6
+STALEMATE_FEN = "7k/5Q2/8/8/8/8/8/K7 w - - 0 1"
+
+
+@pytest.mark.parametrize("backend", [GameState, BitboardGameState])
+def test_append_game_keeps_checkmate(tmp_path, backend, playUci):
+    controller = GameController(backend)
+    playUci(controller, FOOLS_MATE)
+    assert (controller.end_text, controller.result) == ("Black wins by checkmate", "0-1")
+
+    path = tmp_path / "games.pgn"
+    appendGame(str(path), controller.gs, controller.result)
+    assert controller.gs.checkmate and controller.gs.inCheck and not controller.gs.stalemate
+    # the next frame still shows the result
+    controller.update()
+    assert controller.game_over
+    assert (controller.end_text, controller.result) == ("Black wins by checkmate", "0-1")
+
+    with open(path, encoding="utf-8") as f:
+        game, = readPgn(f)
+    assert game.moves == ["f3", "e5", "g4", "Qh4#"]
+    assert game.result == "0-1"
+
+
+@pytest.mark.parametrize("backend", [GameState, BitboardGameState])
+def test_append_game_keeps_stalemate(tmp_path, backend, playUci):
+    controller = GameController(lambda: backend.from_fen(STALEMATE_FEN))
+    playUci(controller, ("f7g6",))
+    assert (controller.end_text, controller.result) == ("Stalemate", "1/2-1/2")
+
+    appendGame(str(tmp_path / "games.pgn"), controller.gs, controller.result)
+    assert controller.gs.stalemate and not controller.gs.checkmate
+    controller.update()
+    assert (controller.end_text, controller.result) == ("Stalemate", "1/2-1/2")
+
+
+@pytest.mark.parametrize("backend", [GameState, BitboardGameState])
+def test_replay_skips_bad_games(badGamesPgn, backend):
+    path = badGamesPgn
+    with open(path, encoding="utf-8") as f:
+        with pytest.raises(ValueError, match="illegal move: Ke3 in game c - d"):
+            list(replayPgn(readPgn(f), backend))
+
+    errors = []
+    with open(path, encoding="utf-8") as f:
+        replayed = [(game.tags["White"], len(gs.moveLog)) for game, gs in replayPgn(readPgn(f), backend, errors)]
+    assert replayed == [("a", 4), ("g", 2)]
+    assert len(errors) == 2
+    assert "in game e - f" in errors[1]
+
+
+# (FEN, from, to, SAN): knights on one rank need the file, rooks on one file the rank, and one of three queens
+# that share a file with one and a rank with another its whole square
+DISAMBIGUATION = [
+    ("4k3/8/8/8/8/5N2/8/1N2K3 w - - 0 1", "b1", "d2", "Nbd2"),
+    ("4k3/8/8/8/8/5N2/8/1N2K3 w - - 0 1", "f3", "d2", "Nfd2"),
+    ("4k3/8/8/R7/8/8/8/R3K3 w - - 0 1", "a5", "a3", "R5a3"),
+    ("4k3/8/8/R7/8/8/8/R3K3 w - - 0 1", "a1", "a3", "R1a3"),
+    ("1k6/8/8/8/4Q2Q/8/8/K6Q w - - 0 1", "h4", "e1", "Qh4e1"),
+    ("1k6/8/8/8/4Q2Q/8/8/K6Q w - - 0 1", "e4", "e1", "Qee1"),
+    ("1k6/8/8/8/4Q2Q/8/8/K6Q w - - 0 1", "h1", "e1", "Q1e1"),
+    # the knight on f3 is pinned, so it doesn't count
+    ("4k3/8/8/8/4b3/5N2/8/1N5K w - - 0 1", "b1", "d2", "Nd2"),
+    ("6k1/8/8/8/8/8/8/R3K2R w KQ - 0 1", "h1", "f1", "Rf1"),
+]
+
+
+def moveCode(gs, start, end, flipped=False):
+    code, = [code for code in gs.getValidMoveCodes()
+             if code & 63 == squareIndex(start, flipped) and (code >> 6) & 63 == squareIndex(end, flipped)]
+    return code
+
+
+@pytest.mark.parametrize("backend", [GameState, BitboardGameState])
+@pytest.mark.parametrize("fen, start, end, text", DISAMBIGUATION)
+def test_san_disambiguation(backend, fen, start, end, text):
+    gs = backend.from_fen(fen)
+    code = moveCode(gs, start, end)
+    assert san(gs, code) == text
+    assert parseSan(gs, text) == code
+
+
+@pytest.mark.parametrize("fen, start, end, text", DISAMBIGUATION)
+def test_flipped_san_disambiguation(fen, start, end, text):
+    gs = GameState.from_fen(fen, True)
+    code = moveCode(gs, start, end, True)
+    assert san(gs, code) == text
+    assert parseSan(gs, text) == code
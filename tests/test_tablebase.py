@@ -0,0 +1,64 @@
+# Endgame tablebases of tablebase.py: a generated KQvK table probed from every symmetry, colour and board orientation
+
+import pytest
+
+from engine import GameState
+from bitboard import BitboardGameState
+from tablebase import Tablebase, generate, parseSignature, storedIndex, transformSquare, WHITE
+
+# white mates in 15 plies
+KQVK_FEN = "8/8/8/4k3/8/8/2Q5/6K1 w - - 0 1"
+# the same position mirrored between the a and h files, turned a quarter, and with the colours swapped
+KQVK_SYMMETRIC = ["8/8/8/3k4/8/8/5Q2/1K6 w - - 0 1", "1K6/8/2Q5/8/3k4/8/8/8 w - - 0 1",
+                  "6k1/2q5/8/8/4K3/8/8/8 b - - 0 1"]
+
+
+@pytest.fixture(scope="module")
+def tablebase(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("tb"))
+    generate({parseSignature("KQvK")}, directory, workers=1, report=lambda text: None)
+    tablebase = Tablebase(directory)
+    yield tablebase
+    tablebase.close()
+
+
+@pytest.mark.parametrize("backend", [GameState, BitboardGameState])
+def test_probe(tablebase, backend):
+    assert tablebase.maxPieces == 3
+    gs = backend.from_fen(KQVK_FEN)
+    assert tablebase.probe(gs) == (1, 15)
+    for fen in KQVK_SYMMETRIC:
+        assert tablebase.probe(backend.from_fen(fen)) == (1, 15), fen
+    # the best move keeps the mate: the other side is mated in 14 plies
+    gs.makeMove(tablebase.bestMove(gs))
+    assert tablebase.probe(gs) == (-1, 14)
+    # checkmate, and a bare king that can take the queen
+    assert tablebase.probe(backend.from_fen("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1")) == (-1, 0)
+    assert tablebase.probe(backend.from_fen("k7/1Q6/8/8/8/8/8/6K1 b - - 0 1")) == (0, 0)
+
+
+def test_flipped_probe(tablebase):
+    gs = GameState.from_fen(KQVK_FEN, True)
+    assert tablebase.probe(gs) == (1, 15)
+    gs.makeMove(tablebase.bestMove(gs))
+    assert tablebase.probe(gs) == (-1, 14)
+
+
+def test_positions_outside_the_tables(tablebase):
+    # no KRvK table, too many pieces, castle rights
+    assert tablebase.probe(GameState.from_fen("8/8/8/4k3/8/8/2R5/6K1 w - - 0 1")) is None
+    assert tablebase.probe(GameState.from_fen("8/8/8/4k3/8/8/2QQ4/6K1 w - - 0 1")) is None
+    assert tablebase.probe(GameState.from_fen("4k3/8/8/8/8/8/2Q5/4K2R w K - 0 1")) is None
+
+
+# every symmetry of a pawnless position is stored at the same index, with pawns only the file mirror
+def test_stored_index_symmetries():
+    pieces = parseSignature("KQvK")
+    squares = (62, 50, 28)
+    index = storedIndex(pieces, squares, WHITE)
+    for t in range(8):
+        assert storedIndex(pieces, tuple(transformSquare(sq, t) for sq in squares), WHITE) == index
+    pieces = parseSignature("KPvK")
+    index = storedIndex(pieces, squares, WHITE)
+    assert storedIndex(pieces, tuple(transformSquare(sq, 1) for sq in squares), WHITE) == index
+    assert storedIndex(pieces, tuple(transformSquare(sq, 2) for sq in squares), WHITE) != index
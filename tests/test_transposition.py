@@ -0,0 +1,53 @@
+# Replacement policy of transposition.TranspositionTable: the first slot of a bucket keeps the deepest search of the
+# current game move, the second slot is always replaced
+
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+
+def bucketKeys(tt, count):
+    # different keys that all land in bucket 5
+    return [5 + n * (tt.mask + 1) for n in range(count)]
+
+
+def test_store_and_probe():
+    tt = TranspositionTable(1)
+    key, = bucketKeys(tt, 1)
+    assert tt.probe(key) is None
+    tt.store(key, 6, LOWER, -1234, 0x0fc3)
+    assert tt.probe(key) == (6, LOWER, -1234, 0x0fc3)
+    tt.store(key, 7, UPPER, 50)
+    # a store without a move keeps the best move of the position
+    assert tt.probe(key) == (7, UPPER, 50, 0x0fc3)
+
+
+def test_deeper_entry_is_kept():
+    tt = TranspositionTable(1)
+    deep, shallow, other = bucketKeys(tt, 3)
+    tt.store(deep, 8, EXACT, 10)
+    tt.store(shallow, 2, EXACT, 20)
+    assert tt.probe(deep) == (8, EXACT, 10, None)
+    assert tt.probe(shallow) == (2, EXACT, 20, None)
+    # the second slot is always replaced, the deep entry stays
+    tt.store(other, 1, EXACT, 30)
+    assert tt.probe(shallow) is None
+    assert tt.probe(other) == (1, EXACT, 30, None)
+    assert tt.probe(deep) == (8, EXACT, 10, None)
+    # an entry at least as deep takes the first slot
+    tt.store(shallow, 8, EXACT, 40)
+    assert tt.probe(deep) is None
+    assert tt.probe(shallow) == (8, EXACT, 40, None)
+
+
+def test_older_search_is_replaced():
+    tt = TranspositionTable(1)
+    deep, shallow, other = bucketKeys(tt, 3)
+    tt.store(deep, 12, EXACT, 10)
+    tt.newSearch()
+    # the deep entry belongs to an older search, a shallow one of this search replaces it
+    tt.store(shallow, 1, EXACT, 20)
+    assert tt.probe(deep) is None
+    assert tt.probe(shallow) == (1, EXACT, 20, None)
+    tt.store(other, 0, EXACT, 30)
+    assert tt.probe(shallow) == (1, EXACT, 20, None)
+    assert tt.probe(other) == (0, EXACT, 30, None)
+    assert tt.stats()["stores"] == 3
@@ -0,0 +1,321 @@
+# Self-play tournament between two engine settings, with games spread over a process pool
+# every opening is played twice with colours swapped (after the same random plies with --random-plies, so the pairs
+# differ even from few openings), each finished game is appended to a JSONL file as it comes in,
+# and the Elo of engine A against engine B is updated with an SPRT that can stop the run once it has decided
+# an engine is a list of key=value settings: nodes, time (seconds per move), depth, hash (MB), eval (module:function),
+# book (opening book file of book.py)
+# usage: python tournament.py --engine nodes=4000 --engine nodes=2000 --openings FILE [--games N] [--workers N]
+#                             [--random-plies N] [--seed N] [--clock MINUTES] [--backend mailbox|bitboard] [--out FILE] [--elo0 E0 --elo1 E1]
+
+import argparse
+import importlib
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from book import OpeningBook
+from controller import GameController
+from engine import Move
+from search import Searcher, timeBudget
+from transposition import TranspositionTable
+
+# games still running after this many plies are adjudicated as draws
+MAX_PLIES = 400
+# halfmove clock of the fifty-move rule
+FIFTY_MOVES = 100
+
+
+# "nodes=4000 hash=16" or ["nodes=4000", "hash=16"] -> {"nodes": 4000, "hash": 16}
+def parseEngine(settings):
+    if isinstance(settings, str):
+        settings = settings.split()
+    engine = {}
+    for setting in settings:
+        key, sep, value = setting.partition('=')
+        if not sep or key not in ("nodes", "time", "depth", "hash", "eval", "book", "name"):
+            raise ValueError(f"bad engine setting: {setting}")
+        if key in ("nodes", "depth", "hash"):
+            engine[key] = int(value)
+        elif key == "time":
+            engine[key] = float(value)
+        else:
+            engine[key] = value
+    engine.setdefault("name", " ".join(settings) or "default")
+    return engine
+
+
+# opening FENs of a file, one per line (EPD lines with only the first four fields are accepted too)
+def readOpenings(path):
+    openings = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split(';')[0].strip()
+            if line and not line.startswith('#'):
+                fields = line.split()
+                if len(fields) == 4:
+                    fields += ["0", "1"]
+                openings.append(" ".join(fields[:6]))
+    return openings
+
+
+# fen after plies random legal moves from fen, the same for the same seed; stops early if the game ends
+def randomOpening(backend, fen, plies, seed):
+    if plies <= 0:
+        return fen
+    rng = random.Random(seed)
+    gs = backend.from_fen(fen)
+    for _ in range(plies):
+        moves = gs.getValidMoveCodes()
+        if not moves:
+            break
+        gs.makeMove(rng.choice(moves))
+    # a position without moves would be no game at all
+    if not gs.getValidMoveCodes():
+        gs.undoMove()
+    return gs.to_fen()
+
+
+class Player():
+    def __init__(self, engine):
+        self.engine = engine
+        self.evaluate = None
+        if "eval" in engine:
+            module, _, function = engine["eval"].partition(':')
+            self.evaluate = getattr(importlib.import_module(module), function or "evaluate")
+        hashMB = engine.get("hash", 0)
+        self.tt = TranspositionTable(hashMB) if hashMB > 0 else None
+        self.book = OpeningBook(engine["book"]) if "book" in engine else None
+        self.nodes = 0
+        self.elapsed = 0.0
+
+    def chooseMove(self, controller):
+        gs = controller.gs
+        if self.book is not None:
+            code = self.book.pick(gs)
+            if code is not None:
+                return Move.fromCode(code)
+        # a countdown clock limits the move like the UI timer would, otherwise the fixed per move budget
+        timeLimit = timeBudget(controller.timer, gs.whiteToMove)
+        if timeLimit is None:
+            timeLimit = self.engine.get("time")
+        searcher = Searcher(gs, tt=self.tt) if self.evaluate is None else Searcher(gs, self.evaluate, self.tt)
+        result = searcher.search(timeLimit, self.engine.get("nodes"), self.engine.get("depth", 64))
+        self.nodes += result.nodes
+        self.elapsed += result.elapsed
+        return result.bestMove
+
+
+# plays one game in a pool process, returns its JSON record
+# task is (game number, opening FEN, engine of white, engine of black, backend name, clock minutes or None,
+#          random plies, seed of the random plies)
+def playGame(task):
+    from backends import BACKENDS
+    game, fen, whiteEngine, blackEngine, backendName, clockMinutes, randomPlies, seed = task
+    backend = BACKENDS[backendName]
+    fen = randomOpening(backend, fen, randomPlies, seed)
+    white, black = Player(whiteEngine), Player(blackEngine)
+    controller = GameController(lambda: backend.from_fen(fen), show_timer=clockMinutes is not None,
+                                timer_minutes=clockMinutes or 0, timer_mode="countdown")
+    start = time.perf_counter()
+    plies = 0
+    controller.update()
+    reason = None
+    while not controller.game_over:
+        gs = controller.gs
+        if plies >= MAX_PLIES:
+            reason = "move limit"
+            break
+        if gs.halfmoveClock >= FIFTY_MOVES:
+            reason = "fifty-move rule"
+            break
+        player = white if gs.whiteToMove else black
+        controller.make_move(player.chooseMove(controller))
+        controller.update()
+        plies += 1
+    result = controller.result if reason is None else "1/2-1/2"
+    return {
+        "game": game,
+        "opening": fen,
+        "white": whiteEngine["name"],
+        "black": blackEngine["name"],
+        "result": result,
+        "reason": reason or controller.end_text,
+        "plies": plies,
+        "time": round(time.perf_counter() - start, 3),
+        "white_nps": round(white.nodes / max(white.elapsed, 1e-9)),
+        "black_nps": round(black.nodes / max(black.elapsed, 1e-9)),
+    }
+
+
+# expected score of an Elo difference and back
+def eloToScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def scoreToElo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return 400 * math.log10(score / (1 - score))
+
+
+class Sprt():
+    # H0: engine A is elo0 stronger than B, H1: it is elo1 stronger; alpha and beta are the error rates
+    def __init__(self, elo0=0.0, elo1=5.0, alpha=0.05, beta=0.05):
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    # score of engine A in one game: 1, 0.5 or 0
+    def add(self, score):
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    @property
+    def score(self):
+        return (self.wins + self.draws / 2) / self.games if self.games else 0.5
+
+    @property
+    def variance(self):
+        # variance of the score of a single game
+        s = self.score
+        if not self.games:
+            return 0.0
+        return (self.wins * (1 - s) ** 2 + self.draws * (0.5 - s) ** 2 + self.losses * s ** 2) / self.games
+
+    # Elo difference with its 95% interval
+    def elo(self):
+        if not self.games:
+            return 0.0, 0.0, 0.0
+        margin = 1.96 * math.sqrt(self.variance / self.games)
+        return scoreToElo(self.score), scoreToElo(self.score - margin), scoreToElo(self.score + margin)
+
+    # log likelihood ratio of H1 against H0 (normal approximation of the game results)
+    def llr(self):
+        if self.variance == 0:
+            return 0.0
+        s0, s1 = eloToScore(self.elo0), eloToScore(self.elo1)
+        return (s1 - s0) * (2 * self.score - s0 - s1) * self.games / (2 * self.variance)
+
+    # "H1" (accept the change), "H0" (reject it) or None while undecided
+    def decision(self):
+        llr = self.llr()
+        if llr >= self.upper:
+            return "H1"
+        if llr <= self.lower:
+            return "H0"
+        return None
+
+    def __str__(self):
+        elo, low, high = self.elo()
+        return (f"games {self.games}  +{self.wins} ={self.draws} -{self.losses}  score {self.score:.3f}  "
+                f"elo {elo:+.1f} [{low:+.1f}, {high:+.1f}]  llr {self.llr():.2f} [{self.lower:.2f}, {self.upper:.2f}]")
+
+
+# tasks of every game: each opening twice, engine A with white then with black
+# both games of a pair get the same seed, so they start from the same position after the random plies
+def tournamentTasks(openings, engineA, engineB, games, backendName, clockMinutes, randomPlies=0, seed=0):
+    for game in range(games):
+        pair = game // 2
+        fen = openings[pair % len(openings)]
+        if game % 2 == 0:
+            yield (game + 1, fen, engineA, engineB, backendName, clockMinutes, randomPlies, seed + pair)
+        else:
+            yield (game + 1, fen, engineB, engineA, backendName, clockMinutes, randomPlies, seed + pair)
+
+
+# plays the tournament, writing every game to out as it finishes; stops early once the SPRT decides
+# returns the Sprt with the results of engine A
+def runTournament(engineA, engineB, openings, games, out, workers=None, backendName="mailbox", clockMinutes=None,
+                  sprt=None, report=print, randomPlies=0, seed=0):
+    sprt = sprt or Sprt()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(playGame, task)
+                   for task in tournamentTasks(openings, engineA, engineB, games, backendName, clockMinutes,
+                                               randomPlies, seed)]
+        try:
+            for future in as_completed(futures):
+                record = future.result()
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                if record["result"] == "1/2-1/2":
+                    sprt.add(0.5)
+                else:
+                    whiteWon = record["result"] == "1-0"
+                    sprt.add(1 if whiteWon == (record["white"] == engineA["name"]) else 0)
+                if report is not None:
+                    report(f"game {record['game']}  {record['white']} - {record['black']}  {record['result']}  "
+                           f"{record['reason']}  plies {record['plies']}  |  {sprt}")
+                if sprt.decision() is not None:
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+    return sprt
+
+
+def main():
+    from backends import BACKENDS
+
+    parser = argparse.ArgumentParser(description="self-play tournament of two engine settings")
+    parser.add_argument("--engine", action="append", nargs="+", required=True,
+                        help="settings of an engine (given twice, A then B): nodes=N time=S depth=N hash=MB eval=module:function "
+                             "book=FILE name=NAME")
+    parser.add_argument("--openings", required=True, help="file of opening FENs, each one is played twice")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--random-plies", type=int, default=0,
+                        help="random legal plies played from each opening, to get more than two different games out of it")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random plies")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--clock", type=float, default=None, help="countdown minutes per player, like the UI timer")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="mailbox")
+    parser.add_argument("--out", default="tournament.jsonl")
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=5.0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    args = parser.parse_args()
+    if len(args.engine) != 2:
+        parser.error("--engine has to be given twice")
+
+    engineA, engineB = parseEngine(args.engine[0]), parseEngine(args.engine[1])
+    if engineA["name"] == engineB["name"]:
+        engineA["name"] += " (A)"
+        engineB["name"] += " (B)"
+    for engine in (engineA, engineB):
+        if "nodes" not in engine and "time" not in engine and "depth" not in engine and args.clock is None:
+            engine["nodes"] = 2000
+    openings = readOpenings(args.openings)
+    if not openings:
+        parser.error(f"no openings in {args.openings}")
+    # the search is deterministic, so an opening played more than twice only repeats the same games
+    # and the SPRT would count them as independent results
+    if args.games > 2 * len(openings) and args.random_plies <= 0:
+        parser.error(f"--games {args.games} needs at least {(args.games + 1) // 2} openings "
+                     f"({len(openings)} in {args.openings}), or --random-plies")
+
+    start = time.perf_counter()
+    with open(args.out, "a") as out:
+        sprt = runTournament(engineA, engineB, openings, args.games, out, args.workers, args.backend, args.clock,
+                             Sprt(args.elo0, args.elo1, args.alpha, args.beta), randomPlies=args.random_plies,
+                             seed=args.seed)
+    print(f"{engineA['name']} vs {engineB['name']}  {sprt}  time {time.perf_counter() - start:.1f}s")
+    decision = sprt.decision()
+    print({"H1": "accepted (H1)", "H0": "rejected (H0)", None: "undecided"}[decision])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+# Fixed size transposition table for search.py, keyed by GameState.zobristKey
+# Two preallocated array('Q') hold the key and the packed entry of every slot. Slots come in buckets of two:
+# the first slot keeps the deepest search of the current game move (depth preferred), the second is always replaced
+#
+# packed entry: bits 0-15 best move (low 16 bits of its engine move code), 16-23 depth, 24-25 bound, 26-31 age, 32-63 score + 2**31
+
+import json
+import os
+from array import array
+
+EXACT, LOWER, UPPER = 0, 1, 2
+# bytes per slot, one key and one packed entry
+SLOT_SIZE = 16
+SCORE_OFFSET = 1 << 31
+NO_MOVE = 0xFFFF
+
+
+# hash size in MB from the advanced section of config.json
+def tableSizeFromConfig(path="config.json", default=16):
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f).get("advanced", {}).get("hash_size_mb", default)
+        except (OSError, ValueError):
+            pass
+    return default
+
+
+class TranspositionTable():
+    def __init__(self, sizeMB=16):
+        # number of buckets is a power of two so the bucket index is a mask of the key
+        buckets = 1
+        while buckets * 2 * 2 * SLOT_SIZE <= sizeMB * 1024 * 1024:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.keys = array('Q', bytes(8 * 2 * buckets))
+        self.entries = array('Q', bytes(8 * 2 * buckets))
+        # bumped once per game move so entries of older searches get replaced first
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        # probes that found their bucket filled by other positions
+        self.collisions = 0
+        self.stores = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def clear(self):
+        self.keys = array('Q', bytes(8 * len(self.keys)))
+        self.entries = array('Q', bytes(8 * len(self.entries)))
+        self.age = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def newSearch(self):
+        self.age = (self.age + 1) & 63
+
+    # (depth, bound, score, move) stored for key, or None; move is None when no best move was stored
+    def probe(self, key):
+        slot = (key & self.mask) << 1
+        keys = self.keys
+        if keys[slot] != key or not self.entries[slot]:
+            slot += 1
+            if keys[slot] != key or not self.entries[slot]:
+                self.misses += 1
+                if self.entries[slot] or self.entries[slot - 1]:
+                    self.collisions += 1
+                return None
+        self.hits += 1
+        entry = self.entries[slot]
+        move = entry & 0xFFFF
+        return ((entry >> 16) & 0xFF, (entry >> 24) & 3, (entry >> 32) - SCORE_OFFSET,
+                None if move == NO_MOVE else move)
+
+    def store(self, key, depth, bound, score, move=None):
+        slot = (key & self.mask) << 1
+        entry = self.entries[slot]
+        # depth preferred slot: take it if it's empty, the same position, from an older search or not deeper
+        if not entry or self.keys[slot] == key or (entry >> 26) & 63 != self.age or (entry >> 16) & 0xFF <= depth:
+            if move is None and self.keys[slot] == key and entry:
+                # keep the best move of a previous search of this position
+                move = entry & 0xFFFF
+        else:
+            slot += 1
+        self.keys[slot] = key
+        self.entries[slot] = (NO_MOVE if move is None else move) | (min(depth, 255) << 16) | (bound << 24) | \
+            (self.age << 26) | ((score + SCORE_OFFSET) << 32)
+        self.stores += 1
+
+    # permille of the first 1000 slots used by the current search
+    def hashfull(self):
+        used = 0
+        sample = min(1000, len(self.entries))
+        for slot in range(sample):
+            entry = self.entries[slot]
+            if entry and (entry >> 26) & 63 == self.age:
+                used += 1
+        return used * 1000 // sample
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            "slots": len(self.keys),
+            "size_mb": len(self.keys) * SLOT_SIZE / (1024 * 1024),
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "hit_rate": self.hits / probes if probes else 0.0,
+            "hashfull": self.hashfull(),
+        }
@@ -0,0 +1,85 @@
+# Legal moves of the next position computed off the UI thread, so main.game_loop never waits on getValidMoves
+# the UI submits a snapshot of the position after every move, a worker thread generates its moves on a scratch
+# GameState (while the move animation plays) and publishes the result on a queue
+# results are tagged with the zobrist key of their position, the ones of positions no longer on the board are dropped
+
+import queue
+import threading
+from engine import GameState
+
+
+class MoveResult():
+    def __init__(self, key, moves, checkmate, stalemate, inCheck, score=None):
+        self.key = key
+        # move codes, as getValidMoveCodes returns them
+        self.moves = moves
+        self.checkmate = checkmate
+        self.stalemate = stalemate
+        self.inCheck = inCheck
+        # evaluate(gs) of the position when the worker has an evaluation function, else None
+        self.score = score
+
+
+# loadPosition arguments of the current position of gs, the board rows are copied so the UI can keep playing
+def positionSnapshot(gs):
+    return ([row[:] for row in gs.board], gs.whiteToMove, (gs.whiteCastleKingside, gs.whiteCastleQueenside,
+            gs.blackCastleKingside, gs.blackCastleQueenside), gs.enpasantPossible, gs.halfmoveClock, gs.fullmoveNumber)
+
+
+class MoveWorker():
+    # backend is the GameState class of the game, evaluate an optional function(gs) -> score (search.evaluate)
+    def __init__(self, backend=GameState, evaluate=None, playerWantsToPlayAsBlack=False):
+        self.gs = backend()
+        if playerWantsToPlayAsBlack:
+            # the scratch state has to see the board the same way round as the game
+            self.gs.playerWantsToPlayAsBlack = True
+        self.evaluate = evaluate
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        # key of the last submitted position, None once its result was taken
+        self.pendingKey = None
+        self.thread = threading.Thread(target=self.run, name="MoveWorker", daemon=True)
+        self.thread.start()
+
+    @property
+    def pending(self):
+        return self.pendingKey is not None
+
+    def submit(self, gs):
+        self.pendingKey = gs.zobristKey
+        self.requests.put((gs.zobristKey, positionSnapshot(gs)))
+
+    # MoveResult of the last submitted position, None while it's still being computed
+    def poll(self):
+        result = None
+        while True:
+            try:
+                item = self.results.get_nowait()
+            except queue.Empty:
+                return result
+            if item.key == self.pendingKey:
+                result = item
+                self.pendingKey = None
+
+    # forget the submitted position (new game), its result will be dropped
+    def cancel(self):
+        self.pendingKey = None
+
+    def stop(self):
+        self.requests.put(None)
+
+    def run(self):
+        gs = self.gs
+        buffer = None
+        while True:
+            request = self.requests.get()
+            # only the newest position matters, the older ones were already played over
+            while request is not None and not self.requests.empty():
+                request = self.requests.get_nowait()
+            if request is None:
+                return
+            key, position = request
+            gs.loadPosition(*position)
+            buffer = gs.getValidMoveCodes(buffer)
+            score = self.evaluate(gs) if self.evaluate is not None else None
+            self.results.put(MoveResult(key, buffer.tolist(), gs.checkmate, gs.stalemate, gs.inCheck, score))